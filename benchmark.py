@@ -0,0 +1,196 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+# offscreen rendering, the benchmark never opens a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+from src.world.world import World
+from src.world.tile_store import TileStore
+from src.world.memory import MemoryReport
+from src.core.camera import Camera
+
+
+class HeadlessApp:
+    """ The parts of App a world needs, drawing to an offscreen surface instead of a window. """
+    def __init__(self, width, height, max_elevation, scale, cache_budget):
+        pg.init()
+        # convert_alpha needs a display mode, even with the dummy driver
+        pg.display.set_mode((1, 1))
+        self.screen_w, self.screen_h = 1920, 1040
+        self.screen = pg.Surface((self.screen_w, self.screen_h))
+        self.scale = scale
+        self.tile_size = self.screen_h // self.scale
+        self.world = World(
+            self,
+            width, height,
+            self.tile_size,
+            self.tile_size // 2,
+            max_elevation,
+            0.05,
+            streaming=True,
+            cache_budget=cache_budget
+        )
+        self.camera = Camera(self)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def peak_rss() -> int:
+    """ Peak resident set size of this process in bytes. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def fly_through(app: HeadlessApp, frames: int) -> list[float]:
+    """ Scroll the camera from the top corner of the map to the bottom one, returning frame times. """
+    world, camera = app.world, app.camera
+    center_x = (world.width - world.height) * world.tile_size // 2 + world.tile_size
+    bottom = (world.width + world.height) * world.tile_size // 2
+    frame_times = []
+    for frame in range(frames):
+        y = bottom * frame / max(frames - 1, 1)
+        camera.offset_x, camera.offset_y = app.screen_w / 2 - center_x, app.screen_h / 2 - y
+        start = time.perf_counter()
+        camera.update()
+        app.screen.fill(pg.Color("black"))
+        world.draw(app.screen, camera)
+        world.collect_bakes()
+        # a steady 60 fps clock, so agents move the same way in every run
+        world.update(1 / 60)
+        frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def run_case(width, height, max_elevation, scale, frames, bake_samples, cache_budget, agents) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    app = HeadlessApp(width, height, max_elevation, scale, cache_budget)
+    timings["world_init"] = time.perf_counter() - start
+    world = app.world
+
+    # a streaming world starts out with nothing loaded, so each phase builds its part of every chunk
+    # for the first time, reusing only what the phases before it built
+    keys = [(cx, cy) for cy in range(-(-height // world.chunk_size)) for cx in range(-(-width // world.chunk_size))]
+    timings["generate_heights"] = timed(lambda: [world.grid.get_block(key) for key in keys])
+    timings["solve_water"] = timed(lambda: [world.hydrology.get_water(key, world.get_chunk_cells(*key)) for key in keys])
+    timings["build_atlas"] = timed(world.build_atlas)
+    tiles = {}
+    timings["create_tiles"] = timed(lambda: tiles.update((key, TileStore(world, world.get_chunk_cells(*key), key)) for key in keys))
+    # chunks take the tile stores built above, leaving only their own setup to time
+    timings["create_chunks"] = timed(lambda: [world.get_chunk(key, tiles.pop(key)) for key in keys])
+    world.agents.spawn(agents)
+
+    # baking every chunk of a large map would take most of the run, a spread out sample is enough
+    chunks = list(world.chunks.values())
+    sample = chunks[::max(len(chunks) // bake_samples, 1)][:bake_samples]
+    bake_times = [timed(chunk.bake) for chunk in sample]
+    timings["chunk_bake_mean"] = float(np.mean(bake_times))
+    timings["chunk_bake_max"] = float(np.max(bake_times))
+
+    frame_times = np.array(fly_through(app, frames))
+    timings["fly_through"] = float(frame_times.sum())
+
+    return {
+        "params": {
+            "width": width,
+            "height": height,
+            "max_elevation": max_elevation,
+            "scale": scale,
+            "tile_size": world.tile_size,
+            "chunk_size": world.chunk_size,
+            "frames": frames,
+            "agents": agents,
+        },
+        "seconds": timings,
+        "frames": {
+            "fps": float(frames / frame_times.sum()),
+            "frame_ms_p50": float(np.percentile(frame_times, 50) * 1000),
+            "frame_ms_p95": float(np.percentile(frame_times, 95) * 1000),
+            "frame_ms_max": float(frame_times.max() * 1000),
+        },
+        "memory": {
+            "peak_rss_bytes": peak_rss(),
+            "chunk_cache_bytes": world.chunk_cache.bytes_used,
+            "chunk_cache_entries": len(world.chunk_cache),
+            "chunk_cache_evictions": world.chunk_cache.evictions,
+            "surface_bytes": MemoryReport(world).surfaces,
+        },
+        "objects": {
+            "cells": world.width * world.height,
+            "chunks": len(world.chunks),
+            "heightmap_blocks": len(world.grid),
+            "stored_tiles": sum(len(chunk.tiles) for chunk in world.chunks.values()),
+            "gc_objects": len(gc.get_objects()),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of world generation, chunk baking and drawing.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[160, 320, 640], help="square map sizes in cells")
+    parser.add_argument("--elevations", type=int, nargs="+", default=[7, 15], help="max_elevation values")
+    parser.add_argument("--scale", type=int, default=20, help="App.scale, sets tile_size and chunk_size")
+    parser.add_argument("--frames", type=int, default=120, help="frames in the camera fly-through")
+    parser.add_argument("--bake-samples", type=int, default=4, help="chunks baked for the chunk bake timings")
+    parser.add_argument("--agents", type=int, default=0, help="wandering NPC agents spawned for the fly-through")
+    parser.add_argument("--cache-budget", type=int, default=1024 ** 3, help="chunk cache budget in bytes")
+    parser.add_argument("--output", default="benchmark_results.json", help="where the JSON results are written")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(**json.loads(args.case))))
+        return
+
+    results = []
+    for size in args.sizes:
+        for max_elevation in args.elevations:
+            case = {
+                "width": size,
+                "height": size,
+                "max_elevation": max_elevation,
+                "scale": args.scale,
+                "frames": args.frames,
+                "bake_samples": args.bake_samples,
+                "cache_budget": args.cache_budget,
+                "agents": args.agents,
+            }
+            print(f"benchmarking {size}x{size}, max_elevation {max_elevation}", file=sys.stderr)
+            # one process per case, so peak RSS and object counts are not shared between cases
+            process = subprocess.run([sys.executable, __file__, "--case", json.dumps(case)], capture_output=True, text=True, check=True)
+            results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pg.version.ver,
+            "sdl": ".".join(map(str, pg.get_sdl_version())),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
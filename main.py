@@ -1,3 +1,4 @@
+import argparse
 import cProfile
 import pstats
 import asyncio
@@ -9,8 +10,28 @@ if __name__ == "__main__":
     
     PROFILING = False
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", metavar="PATH", help="on exit, write per-frame phase timings and counters to PATH, as Chrome trace JSON for .json paths and CSV otherwise")
+    parser.add_argument("--hud", action="store_true", help="start with the frame timing overlay shown, F3 toggles it")
+    parser.add_argument("--agents", type=int, default=0, help="number of wandering NPC agents to spawn")
+    parser.add_argument("--max-fps", type=int, help="cap the frame rate, sleeping off the rest of each frame")
+    parser.add_argument("--idle-sleep", action="store_true", help="draw only a few frames a second while the window is unfocused or minimized")
+    parser.add_argument("--infinite", action="store_true", help="generate an unbounded world chunk by chunk as the camera moves")
+    parser.add_argument("--dirty-rects", action="store_true", help="redraw and flip only the parts of the screen that changed each frame")
+    parser.add_argument("--save", metavar="PATH", help="load the world saved at PATH, or start a new one there; F5 and quitting save it")
+    parser.add_argument("--lighting", action="store_true", help="light the terrain from a movable sun, [ and ] step the time of day")
+    parser.add_argument("--day-length", type=float, metavar="SECONDS", help="with --lighting, let the sun go round once every SECONDS")
+    parser.add_argument("--memory-report", action="store_true", help="print where the memory goes once the world is built and on quitting, F4 prints it any time")
+    parser.add_argument("--trace-memory", action="store_true", help="take tracemalloc snapshots while building the world, the memory report compares them")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", help="hold surfaces and arrays to MB megabytes, evicting chunks and shrinking them to fit")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false", help="build and bake every chunk of the map at startup instead of as they come into view, --infinite worlds always stream")
+    parser.add_argument("--bake-workers", type=int, metavar="N", help="bake chunks on N worker threads, one per CPU core by default, 0 bakes them while drawing")
+    parser.add_argument("--cache-dir", metavar="PATH", help="keep baked chunks, terrain and water on disk under PATH, so later launches skip building them again")
+    args = parser.parse_args()
+    memory_budget = int(args.memory_budget * 1024 ** 2) if args.memory_budget else None
+
     if PROFILING:
-        cProfile.run('asyncio.run(App().run())', './profiler_results/output.dat')
+        cProfile.run('asyncio.run(App(args.trace, args.hud, args.agents, args.max_fps, args.idle_sleep, args.infinite, args.dirty_rects, args.save, args.lighting, args.day_length, args.memory_report, args.trace_memory, memory_budget, args.streaming, args.bake_workers, args.cache_dir).run())', './profiler_results/output.dat')
 
         with open('./profiler_results/time.txt', 'w') as f:
             pstats.Stats('./profiler_results/output.dat', stream=f).sort_stats('time').print_stats()
@@ -22,4 +43,4 @@ if __name__ == "__main__":
             pstats.Stats('./profiler_results/output.dat', stream=f).sort_stats('cumulative').print_stats()
     
     else:
-        asyncio.run(App().run())
+        asyncio.run(App(args.trace, args.hud, args.agents, args.max_fps, args.idle_sleep, args.infinite, args.dirty_rects, args.save, args.lighting, args.day_length, args.memory_report, args.trace_memory, memory_budget, args.streaming, args.bake_workers, args.cache_dir).run())
@@ -1,14 +1,24 @@
 import pygame as pg
 import asyncio
+import os
 import sys
+import time
+import tracemalloc
 
 from src.world.world import World
+from src.world.save_file import SaveFile
+from src.world.memory import MemoryReport
 from src.core.camera import Camera
 from src.core.controls import Controls
+from src.core.profiler import FrameProfiler
+from src.core.dirty_rects import DirtyRects
 
 
 class App:
-    def __init__(self):
+    def __init__(self, trace_path: str | None = None, show_profiler: bool = False, agent_count: int = 0, max_fps: int | None = None, idle_sleep: bool = False, infinite: bool = False, dirty_rendering: bool = False, save_path: str | None = None, lighting: bool = False, day_length: float | None = None, memory_report: bool = False, trace_memory: bool = False, memory_budget: int | None = None, streaming: bool = True, bake_workers: int | None = None, cache_dir: str | None = None):
+        # started before anything is built, so the world's build phases are traced from the start
+        if trace_memory:
+            tracemalloc.start()
         pg.init()
         self.screen_w, self.screen_h = 1920, 1040
         self.screen = pg.display.set_mode((self.screen_w, self.screen_h), pg.RESIZABLE | pg.SCALED)
@@ -16,38 +26,190 @@ class App:
         self.font = pg.font.SysFont("Arial", 14)
         self.scale = 20
         self.tile_size = self.screen_h // self.scale
+        # an infinite world generates chunks around the camera as it moves, and unloads far ones
+        world_size = None if infinite else 160
+        # an existing save brings its own world size
+        saved_params = SaveFile.read_params(save_path) if save_path and os.path.exists(save_path) else None
+        if saved_params is not None:
+            world_size = saved_params["width"]
+        # and its chunk size, which a memory budget must not change
+        chunk_size = saved_params["chunk_size"] if saved_params is not None else None
         self.world = World(
             self, 
-            160, 160, 
+            world_size, world_size, 
             self.tile_size, 
             self.tile_size // 2, 
             7, 
-            0.05
+            0.05,
+            streaming=streaming,
+            cache_budget=1024 ** 3,
+            # one bake worker per core unless given, 0 bakes on the main thread
+            bake_workers=os.cpu_count() if bake_workers is None else bake_workers,
+            # baked chunks, heights and water are only kept on disk with a cache_dir
+            cache_dir=cache_dir,
+            save_path=save_path,
+            lighting=lighting,
+            day_length=day_length,
+            memory_budget=memory_budget,
+            chunk_size=chunk_size
         )
+        # a loaded save has its agents already
+        if saved_params is None:
+            self.world.agents.spawn(agent_count)
+        self.world.snapshot_memory("spawn")
         self.camera = Camera(self)
         self.controls = Controls(self)
-        self.dt = 0
+        self.profiler = FrameProfiler()
+        self.profiler.show_overlay = show_profiler
+        self.trace_path = trace_path
+        # the simulation advances in fixed steps, whatever the frame rate
+        self.dt = 1 / 60
+        # longer frames, after a stall, are not caught up step by step
+        self.max_frame_time = 0.25
+        # None draws as fast as possible
+        self.max_fps = max_fps
+        # with idle_sleep, an unfocused or minimized window only draws idle_fps frames a second
+        self.idle_sleep = idle_sleep
+        self.idle_fps = 10
+        # seconds between collecting finished chunk bakes
+        self.bake_poll_interval = 0.005
+        self.tasks: set[asyncio.Task] = set()
+        # with dirty_rendering only the parts of the screen that changed are drawn and flipped
+        self.dirty_rects = DirtyRects(self) if dirty_rendering else None
+        # with memory_report, where the memory goes is printed once built and again on quitting, F4 prints it any time
+        self.memory_report = memory_report
+        if memory_report:
+            self.print_memory_report()
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        """ Run a background task on the frame loop. Tasks get the loop whenever a frame
+        awaits, so they must await often; blocking work belongs in asyncio.to_thread. """
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def collect_bakes(self):
+        while True:
+            self.world.collect_bakes()
+            await asyncio.sleep(self.bake_poll_interval)
 
     async def run(self):
+        profiler = self.profiler
+        self.spawn(self.collect_bakes())
+        previous = time.perf_counter()
+        accumulator = 0.0
         while True:
-            await asyncio.sleep(0.0)
-            self.events: list[pg.event.Event] = pg.event.get()
-            for event in self.events:
-                if event.type == pg.QUIT \
-                    or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
-                        self.quit()           
-            self.screen.fill(pg.Color("black"))
-            self.controls.update(self.dt)
-            self.camera.update()
-            self.world.draw(self.screen, self.camera)
-            self.world.player.update(self.dt)
-            self.world.update()
-            pg.display.update()
-            self.dt = self.clock.tick() / 1000.0
+            frame_start = time.perf_counter()
+            accumulator += min(frame_start - previous, self.max_frame_time)
+            previous = frame_start
+            with profiler.phase("events"):
+                self.handle_events()
+            with profiler.phase("simulation"):
+                steps = 0
+                while accumulator >= self.dt:
+                    self.simulate(self.dt)
+                    accumulator -= self.dt
+                    steps += 1
+            if self.dirty_rects is None:
+                self.screen.fill(pg.Color("black"))
+            # drawn between the last two steps, by how far the clock is into the next one
+            with self.camera.interpolated(accumulator / self.dt):
+                with profiler.phase("camera"):
+                    self.camera.update()
+                with profiler.phase("world_draw"):
+                    if self.dirty_rects is None:
+                        self.world.draw(self.screen, self.camera)
+                    else:
+                        updated = self.dirty_rects.draw(self.screen, self.camera)
+            profiler.count("sim_steps", steps)
+            profiler.count("chunks_drawn", self.world.chunks_drawn)
+            profiler.count("chunks_culled", self.world.chunks_culled)
+            profiler.count("blits", self.world.blits_drawn)
+            profiler.count("agents", len(self.world.agents))
+            if self.dirty_rects is not None:
+                profiler.count("redrawn_px", self.dirty_rects.redrawn_area)
+            overlay_rect = profiler.draw(self.screen, self.font)
+            with profiler.phase("flip"):
+                if self.dirty_rects is None:
+                    pg.display.update()
+                else:
+                    if overlay_rect is not None:
+                        # the overlay is drawn over fresh world pixels every frame
+                        self.dirty_rects.mark(overlay_rect)
+                        updated.append(overlay_rect)
+                    pg.display.update(updated)
+            with profiler.phase("idle"):
+                await self.wait_for_next_frame(frame_start)
+            self.clock.tick()
+            profiler.end_frame()
             pg.display.set_caption(f"FPS: {self.clock.get_fps():.2f}")
-    
+
+    def handle_events(self):
+        self.events: list[pg.event.Event] = pg.event.get()
+        for event in self.events:
+            if event.type == pg.QUIT \
+                or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                    self.quit()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.profiler.show_overlay = not self.profiler.show_overlay
+            if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                self.print_memory_report()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                self.world.save()
+            if event.type == pg.KEYDOWN and event.key in (pg.K_LEFTBRACKET, pg.K_RIGHTBRACKET) and self.world.lighting is not None:
+                # an hour of the day back or forward
+                lighting = self.world.lighting
+                lighting.clock += 1 if event.key == pg.K_RIGHTBRACKET else -1
+                lighting.set_time(lighting.clock)
+            if event.type == pg.MOUSEWHEEL:
+                self.camera.zoom_by(event.y)
+            if event.type == pg.MOUSEBUTTONDOWN and event.button == pg.BUTTON_LEFT:
+                # click to walk the player to a cell
+                cell = self.world.picker.pick(self.camera, event.pos)
+                if cell is not None:
+                    self.world.player.go_to(cell[:2])
+            if event.type == pg.WINDOWEXPOSED and self.dirty_rects is not None:
+                self.dirty_rects.redraw()
+
+    @property
+    def hovered_cell(self) -> tuple[int, int, int] | None:
+        """ (x, y, elevation) of the cube under the mouse, None over empty space. """
+        return self.world.picker.pick(self.camera, pg.mouse.get_pos())
+
+    def simulate(self, dt: float):
+        """ One fixed simulation step, timed inside the simulation phase of the frame. """
+        self.camera.begin_step()
+        with self.profiler.phase("controls"):
+            self.controls.update(dt)
+        with self.profiler.phase("player_update"):
+            self.world.player.update(dt)
+        with self.profiler.phase("world_update"):
+            self.world.update(dt)
+
+    async def wait_for_next_frame(self, frame_start: float):
+        """ Sleep off what is left of the frame under the frame cap, giving background
+        tasks the loop meanwhile. Uncapped frames still yield once. """
+        idle = self.idle_sleep and not (pg.display.get_active() and pg.key.get_focused())
+        fps = self.idle_fps if idle else self.max_fps
+        delay = frame_start + 1 / fps - time.perf_counter() if fps else 0
+        await asyncio.sleep(max(delay, 0))
+
+    def print_memory_report(self):
+        print("memory report")
+        for line in MemoryReport(self.world).lines():
+            print(line)
+
     
     def quit(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.trace_path:
+            self.profiler.export(self.trace_path)
+        if self.memory_report:
+            self.print_memory_report()
+        self.world.save()
+        self.world.close()
         pg.quit()
         sys.exit()
 
@@ -1,4 +1,5 @@
 import pygame as pg
+from contextlib import contextmanager
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -9,15 +10,71 @@ class Camera:
     def __init__(self, app: "App"):
         self.app = app
         self.offset_x, self.offset_y = 0, 0
+        # offsets at the start of the current simulation step, for interpolated drawing
+        self.previous_offset = (self.offset_x, self.offset_y)
         self.speed = 1111 
+        # zoom is 1 / 2**lod, one level per LOD the world keeps of its chunks
+        self.lod = 0
+        self.max_lod = app.world.lod_levels - 1
+        # screen-space viewport and the part of the world it currently shows
         self.view_rect = pg.Rect(0, 0, app.screen_w, app.screen_h)
+        self.world_rect = self.view_rect.copy()
+
+    @property
+    def zoom(self) -> float:
+        return 1 / (1 << self.lod)
 
     def update(self):
-        pass
+        self.world_rect = self.unapply(self.view_rect)
+
+    def begin_step(self):
+        self.previous_offset = (self.offset_x, self.offset_y)
+
+    @contextmanager
+    def interpolated(self, alpha: float):
+        """ Place the camera alpha of the way from the last step's offsets to the current ones
+        while drawing, so movement looks smooth between fixed simulation steps. """
+        offset = (self.offset_x, self.offset_y)
+        previous_x, previous_y = self.previous_offset
+        self.offset_x = previous_x + (offset[0] - previous_x) * alpha
+        self.offset_y = previous_y + (offset[1] - previous_y) * alpha
+        try:
+            yield
+        finally:
+            self.offset_x, self.offset_y = offset
+
+    def zoom_by(self, steps: int):
+        """ Zoom in by steps levels, or out for negative steps, keeping the view centered. """
+        lod = min(max(self.lod - steps, 0), self.max_lod)
+        factor = 2 ** (self.lod - lod)
+        center_x, center_y = self.view_rect.center
+        self.offset_x = center_x - (center_x - self.offset_x) * factor
+        self.offset_y = center_y - (center_y - self.offset_y) * factor
+        self.lod = lod
+        # a zoom jumps, there is nothing to interpolate from
+        self.begin_step()
 
     def move(self, x: int, y: int, dt: float):
         self.offset_x += x * self.speed * dt
         self.offset_y += y * self.speed * dt
 
+    def unapply(self, screen_rect: pg.Rect) -> pg.Rect:
+        """ The world area a screen rect shows, the inverse of apply. """
+        # apply() truncates the offsets, so the world area does too
+        return pg.Rect(
+            (screen_rect.x - int(self.offset_x)) << self.lod,
+            (screen_rect.y - int(self.offset_y)) << self.lod,
+            screen_rect.width << self.lod,
+            screen_rect.height << self.lod
+        )
+
     def apply(self, entity_rect: pg.Rect) -> pg.Rect:
+        if self.lod:
+            # world coordinates are scaled down before the offset, which is in screen pixels
+            return pg.Rect(
+                (entity_rect.x >> self.lod) + int(self.offset_x),
+                (entity_rect.y >> self.lod) + int(self.offset_y),
+                entity_rect.width >> self.lod,
+                entity_rect.height >> self.lod
+            )
         return entity_rect.move(self.offset_x, self.offset_y)
@@ -28,16 +28,13 @@ class Controls:
             self.app.camera.move(-1, 0, dt)
 
     def move_player(self, dt):
-        if self.key_press_timer >= self.key_press_cd:
-            if self.keys[pg.K_UP]:
-                self.app.world.player.move(0, -1, dt)
-            if self.keys[pg.K_LEFT]:
-                self.app.world.player.move(-1, 0, dt)
-            if self.keys[pg.K_DOWN]:
-                self.app.world.player.move(0, 1, dt)
-            if self.keys[pg.K_RIGHT]:
-                self.app.world.player.move(1, 0, dt)
+        # called once per fixed simulation step, so the repeat rate does not depend on the frame rate
+        self.key_press_timer = min(self.key_press_timer + dt, self.key_press_cd)
+        if self.key_press_timer < self.key_press_cd:
+            return
+        moves = [(0, -1, pg.K_UP), (-1, 0, pg.K_LEFT), (0, 1, pg.K_DOWN), (1, 0, pg.K_RIGHT)]
+        pressed = [(x, y) for x, y, key in moves if self.keys[key]]
+        for x, y in pressed:
+            self.app.world.player.move(x, y, dt)
+        if pressed:
             self.key_press_timer = 0
-        else:
-            self.key_press_timer += dt
-
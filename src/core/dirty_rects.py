@@ -0,0 +1,117 @@
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.core.app import App
+    from src.core.camera import Camera
+
+
+class DirtyRects:
+    """ Draws only the parts of the screen that changed since the previous frame.
+
+    The previous frame stays on the screen surface. A camera scroll shifts it with
+    Surface.scroll and leaves only the exposed strips to draw. Agents and the player
+    that moved or changed head bob frame, finished bakes and terrain edits mark
+    their areas, which are cleared and redrawn clipped. Zooming, or so much change
+    that one full redraw is cheaper, redraws everything. """
+    def __init__(self, app: "App", background: pg.Color = pg.Color("black")):
+        self.app = app
+        self.background = background
+        self.screen_rect = app.screen.get_rect()
+        # truncated camera offsets and lod the screen was drawn with, None redraws everything
+        self.drawn_view: tuple[int, int, int] | None = None
+        self.drawn_player: tuple[pg.Rect, int] | None = None
+        # screen-space areas to redraw on the next frame
+        self.marked: list[pg.Rect] = []
+        # more areas than this are drawn as their union
+        self.max_rects = 16
+        # past this share of the screen changing, everything is redrawn at once
+        self.full_redraw_share = 0.5
+        # screen pixels cleared and redrawn by the last frame
+        self.redrawn_area = 0
+        app.world.damage = []
+
+    def mark(self, rect: pg.Rect):
+        """ Redraw a screen area on the next frame. """
+        self.marked.append(pg.Rect(rect))
+
+    def redraw(self):
+        """ Redraw the whole screen on the next frame. """
+        self.drawn_view = None
+
+    def draw(self, screen: pg.Surface, camera: "Camera") -> list[pg.Rect]:
+        """ Bring the screen up to date, returning the areas that changed for pg.display.update. """
+        view = (int(camera.offset_x), int(camera.offset_y), camera.lod)
+        damage = self.take_damage(camera)
+        if self.drawn_view is None or view[2] != self.drawn_view[2]:
+            return self.draw_all(screen, camera, view)
+        dx, dy = view[0] - self.drawn_view[0], view[1] - self.drawn_view[1]
+        if abs(dx) >= self.screen_rect.width or abs(dy) >= self.screen_rect.height:
+            return self.draw_all(screen, camera, view)
+
+        # marks are stale pixels of the previous frame, which the scroll moves along
+        areas = [rect.move(dx, dy) for rect in self.marked] + damage
+        if dx or dy:
+            screen.scroll(dx, dy)
+            areas.extend(self.get_exposed(dx, dy))
+        areas = self.merge(areas)
+        self.redrawn_area = sum(area.width * area.height for area in areas)
+        if self.redrawn_area > self.full_redraw_share * self.screen_rect.width * self.screen_rect.height:
+            return self.draw_all(screen, camera, view)
+
+        for area in areas:
+            screen.fill(self.background, area)
+        self.app.world.draw(screen, camera, areas)
+        self.drawn_view = view
+        self.marked = []
+        # a scroll moved every pixel
+        return [self.screen_rect] if dx or dy else areas
+
+    def draw_all(self, screen: pg.Surface, camera: "Camera", view: tuple[int, int, int]) -> list[pg.Rect]:
+        screen.fill(self.background)
+        self.app.world.draw(screen, camera)
+        self.drawn_view = view
+        self.marked = []
+        self.redrawn_area = self.screen_rect.width * self.screen_rect.height
+        return [self.screen_rect]
+
+    def take_damage(self, camera: "Camera") -> list[pg.Rect]:
+        """ Screen areas of everything that changed in the world since the last frame. """
+        world = self.app.world
+        rects = world.damage + world.agents.take_damage(camera.world_rect)
+        world.damage = []
+
+        player = world.player
+        if self.drawn_player is None or self.drawn_player != (player.rect, player.frame):
+            rects.append(player.rect.copy())
+            if self.drawn_player is not None:
+                rects.append(self.drawn_player[0])
+            self.drawn_player = (player.rect.copy(), player.frame)
+        # apply() truncates at zoomed out levels, a pixel of margin covers the rounding
+        return [camera.apply(rect).inflate(2, 2) for rect in rects]
+
+    def get_exposed(self, dx: int, dy: int) -> list[pg.Rect]:
+        """ The strips a scroll by (dx, dy) left without pixels. """
+        width, height = self.screen_rect.size
+        strips = []
+        if dx:
+            strips.append(pg.Rect(0 if dx > 0 else width + dx, 0, abs(dx), height))
+        if dy:
+            strips.append(pg.Rect(0, 0 if dy > 0 else height + dy, width, abs(dy)))
+        return strips
+
+    def merge(self, rects: list[pg.Rect]) -> list[pg.Rect]:
+        """ The rects clipped to the screen, with overlapping ones joined into their union. """
+        rects = [rect.clip(self.screen_rect) for rect in rects]
+        rects = [rect for rect in rects if rect.width and rect.height]
+        if len(rects) > self.max_rects:
+            return [rects[0].unionall(rects[1:])]
+        merged: list[pg.Rect] = []
+        for rect in rects:
+            # the union grows as it absorbs rects, and may then touch others
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
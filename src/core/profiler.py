@@ -0,0 +1,126 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pygame as pg
+
+
+class FrameProfiler:
+    """ Per-phase frame timings and per-frame counters kept in a ring buffer of the last
+    capacity frames, with percentiles, an on-screen overlay and CSV / Chrome trace export. """
+    def __init__(self, capacity: int = 600, refresh_frames: int = 15):
+        self.capacity = capacity
+        self.refresh_frames = refresh_frames
+        self.frame = 0
+        self.frame_start = time.perf_counter()
+        self.origin = self.frame_start
+        # frame_starts and phase start times are seconds since origin, durations are milliseconds
+        self.frame_starts = np.zeros(capacity)
+        self.starts: dict[str, np.ndarray] = {}
+        self.durations: dict[str, np.ndarray] = {}
+        self.counters: dict[str, np.ndarray] = {}
+        self.show_overlay = False
+        self.overlay_lines: list[pg.Surface] = []
+
+    @property
+    def slot(self) -> int:
+        return self.frame % self.capacity
+
+    @property
+    def frames_recorded(self) -> int:
+        return min(self.frame, self.capacity)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if name not in self.durations:
+                self.starts[name] = np.zeros(self.capacity)
+                self.durations[name] = np.zeros(self.capacity)
+            # a phase entered again in the same frame, like each simulation step, adds up from its first start
+            if not self.durations[name][self.slot]:
+                self.starts[name][self.slot] = start - self.origin
+            self.durations[name][self.slot] += (time.perf_counter() - start) * 1000
+
+    def count(self, name: str, value: int | float):
+        if name not in self.counters:
+            self.counters[name] = np.zeros(self.capacity)
+        self.counters[name][self.slot] = value
+
+    def end_frame(self):
+        """ Close the current frame, the next phase or count goes into a fresh slot. """
+        now = time.perf_counter()
+        self.frame_starts[self.slot] = self.frame_start - self.origin
+        self.count("frame_ms", (now - self.frame_start) * 1000)
+        self.frame += 1
+        self.frame_start = now
+        # a phase skipped in a frame must not report the value from capacity frames ago
+        for series in (*self.durations.values(), *self.counters.values()):
+            series[self.slot] = 0
+        if self.show_overlay and self.frame % self.refresh_frames == 0:
+            self.overlay_lines = []
+
+    def recorded(self, series: np.ndarray) -> np.ndarray:
+        """ Values of the recorded frames, oldest first. """
+        if self.frame < self.capacity:
+            return series[:self.frame]
+        return np.roll(series, -self.slot)
+
+    def percentiles(self, name: str) -> tuple[float, float, float]:
+        """ p50, p95 and p99 of a phase duration or counter over the recorded frames. """
+        series = self.durations.get(name, self.counters.get(name))
+        if series is None or self.frame == 0:
+            return (0.0, 0.0, 0.0)
+        return tuple(np.percentile(self.recorded(series), (50, 95, 99)).tolist())
+
+    def draw(self, screen: pg.Surface, font: pg.font.Font) -> pg.Rect | None:
+        """ Draw the overlay when shown, returning the screen area it covers. """
+        if not self.show_overlay:
+            return None
+        # text is only re-rendered every refresh_frames frames
+        if not self.overlay_lines:
+            lines = [f"{'':<14}{'p50':>8}{'p95':>8}{'p99':>8}"]
+            for name in (*self.durations, *self.counters):
+                p50, p95, p99 = self.percentiles(name)
+                lines.append(f"{name:<14}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}")
+            self.overlay_lines = [font.render(line, True, pg.Color("white"), pg.Color("black")) for line in lines]
+        y = 0
+        for line in self.overlay_lines:
+            screen.blit(line, (0, y))
+            y += line.get_height()
+        return pg.Rect(0, 0, max(line.get_width() for line in self.overlay_lines), y)
+
+    def export(self, path: str):
+        """ Write the recorded frames as CSV, or as a Chrome trace for a .json path. """
+        if path.endswith(".json"):
+            self.export_trace(path)
+        else:
+            self.export_csv(path)
+
+    def export_csv(self, path: str):
+        names = [*self.durations, *self.counters]
+        columns = [self.recorded(series) for series in (*self.durations.values(), *self.counters.values())]
+        first_frame = self.frame - self.frames_recorded
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", *names])
+            for i, row in enumerate(zip(*columns)):
+                writer.writerow([first_frame + i, *(round(value, 4) for value in row)])
+
+    def export_trace(self, path: str):
+        """ Chrome trace event format, viewable in chrome://tracing or Perfetto. """
+        events = []
+        for name in self.durations:
+            for start, duration in zip(self.recorded(self.starts[name]).tolist(), self.recorded(self.durations[name]).tolist()):
+                if duration:
+                    events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1000, "pid": 0, "tid": 0})
+        frame_starts = self.recorded(self.frame_starts).tolist()
+        for name, series in self.counters.items():
+            for start, value in zip(frame_starts, self.recorded(series).tolist()):
+                events.append({"name": name, "ph": "C", "ts": start * 1e6, "pid": 0, "args": {name: value}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
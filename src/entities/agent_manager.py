@@ -0,0 +1,209 @@
+import math
+
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.core.camera import Camera
+    from src.world.chunk import Chunk
+    from src.world.world import World
+
+from src.entities.agent_sprites import AgentSprites
+from src.world.navigation import STEPS
+from src.world.heightmap import pack_block_key, split_blocks, unpack_block_key
+
+
+class AgentManager:
+    """ Wandering NPC agents kept as NumPy arrays, one entry per agent, so updating and
+    depth sorting thousands of them is a handful of vectorized steps per frame.
+
+    Each agent waits a random step time, then tries a random step that the world's
+    navigation allows. Agents are grouped by chunk after every update, and merged
+    into the chunk's top layer depth order when drawn. """
+    def __init__(self, world: "World", sprites: AgentSprites, capacity: int = 1024, seed: int | None = None):
+        self.world = world
+        self.sprites = sprites
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.step_time = 0.5
+        # head bob cycles per second, matching AgentSprites.frame_at
+        self.bob_rate = sprites.bob_frequency * 1000 / (2 * math.pi)
+        self.step_dx = np.array([dx for dx, _ in STEPS], dtype=np.int32)
+        self.step_dy = np.array([dy for _, dy in STEPS], dtype=np.int32)
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.elevation = np.zeros(capacity, dtype=np.int16)
+        # head bob phase in [0, 1)
+        self.phase = np.zeros(capacity, dtype=np.float32)
+        self.step_timer = np.zeros(capacity, dtype=np.float32)
+        self.rect_x = np.zeros(capacity, dtype=np.int32)
+        self.rect_y = np.zeros(capacity, dtype=np.int32)
+        self.chunk_key = np.zeros(capacity, dtype=np.int64)
+        # rect and head bob frame as of the last take_damage call, frame -1 for agents not seen yet
+        self.shown_x = np.zeros(capacity, dtype=np.int32)
+        self.shown_y = np.zeros(capacity, dtype=np.int32)
+        self.shown_frame = np.zeros(capacity, dtype=np.int16)
+        self.names = ("x", "y", "elevation", "phase", "step_timer", "rect_x", "rect_y", "chunk_key", "shown_x", "shown_y", "shown_frame")
+        # agent indices sorted by chunk, and their packed chunk keys in the same order for searchsorted
+        self.chunk_order = np.zeros(0, dtype=np.intp)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return self.x.size
+
+    def reserve(self, capacity: int):
+        """ Grow every array to hold at least capacity agents, doubling to keep spawns cheap. """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name in self.names:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            setattr(self, name, grown)
+
+    def spawn(self, count: int, area: pg.Rect | None = None) -> np.ndarray:
+        """ Place count agents on random cells of area, returns their indices. area defaults
+        to the whole of a bounded world, or the chunk_size cells around the player. """
+        if area is None:
+            world = self.world
+            player_x, player_y = world.player.current_grid_pos
+            area = world.bounds or pg.Rect(player_x - world.chunk_size // 2, player_y - world.chunk_size // 2, world.chunk_size, world.chunk_size)
+        return self.add(
+            self.rng.integers(area.left, area.right, count),
+            self.rng.integers(area.top, area.bottom, count),
+            self.rng.random(count),
+            self.rng.random(count) * self.step_time,
+        )
+
+    def add(self, xs: np.ndarray, ys: np.ndarray, phases: np.ndarray, step_timers: np.ndarray) -> np.ndarray:
+        """ Place agents on the given cells with the given head bob phases and step timers,
+        as spawned or as loaded from a save, returns their indices. """
+        count = len(xs)
+        self.reserve(self.count + count)
+        indices = np.arange(self.count, self.count + count)
+        self.x[indices] = xs
+        self.y[indices] = ys
+        self.phase[indices] = phases
+        self.step_timer[indices] = step_timers
+        self.shown_frame[indices] = -1
+        self.count += count
+        self.refresh()
+        return indices
+
+    def remove(self, indices: np.ndarray):
+        """ Remove agents, the remaining ones keep their order but not their indices. """
+        keep = np.ones(self.count, dtype=bool)
+        keep[indices] = False
+        width, height = self.sprites.size
+        shown = np.flatnonzero(~keep & (self.shown_frame[:self.count] >= 0))
+        for x, y in zip(self.shown_x[shown].tolist(), self.shown_y[shown].tolist()):
+            self.world.add_damage(pg.Rect(x, y, width, height))
+        kept = int(keep.sum())
+        for name in self.names:
+            array = getattr(self, name)
+            array[:kept] = array[:self.count][keep]
+        self.count = kept
+        self.refresh()
+
+    def update(self, dt: float):
+        count = self.count
+        if not count:
+            return
+        self.phase[:count] = (self.phase[:count] + dt * self.bob_rate) % 1
+
+        self.step_timer[:count] -= dt
+        ready = np.flatnonzero(self.step_timer[:count] <= 0)
+        if ready.size:
+            steps = self.rng.integers(0, len(STEPS), ready.size)
+            # steps off the map or up a cliff cost inf, those agents stay put this time
+            allowed = np.isfinite(self.world.navigation.costs_at(steps, self.x[ready], self.y[ready]))
+            moving, steps = ready[allowed], steps[allowed]
+            self.x[moving] += self.step_dx[steps]
+            self.y[moving] += self.step_dy[steps]
+            self.step_timer[ready] = self.step_time * self.rng.uniform(0.5, 1.5, ready.size)
+        self.refresh()
+
+    def refresh(self):
+        """ Recompute what follows from positions: elevations, which may also change
+        through terrain edits, screen rects and the grouping by chunk. """
+        count = self.count
+        x, y = self.x[:count], self.y[:count]
+        world = self.world
+        self.elevation[:count] = world.grid[y, x]
+        # the same placement as Agent.update_grid_position
+        self.rect_x[:count] = (x - y) * world.tile_size
+        self.rect_y[:count] = (x + y) * world.tile_size // 2 - self.elevation[:count] * world.cube_height - world.cube_height
+        self.chunk_key[:count] = pack_block_key(x // world.chunk_size, y // world.chunk_size)
+
+        chunk_key = self.chunk_key[:count]
+        self.chunk_order = np.argsort(chunk_key, kind="stable")
+        self.sorted_keys = chunk_key[self.chunk_order]
+
+    def get_frames(self) -> np.ndarray:
+        """ Head bob frame of every agent. """
+        return (self.phase[:self.count] * self.sprites.frames).astype(np.intp) % self.sprites.frames
+
+    def take_damage(self, view: pg.Rect) -> list[pg.Rect]:
+        """ World-space rects, where they were and where they are, of the agents inside view
+        that moved or changed head bob frame since the last call. """
+        count = self.count
+        frames = self.get_frames()
+        rect_x, rect_y = self.rect_x[:count], self.rect_y[:count]
+        changed = np.flatnonzero((rect_x != self.shown_x[:count]) | (rect_y != self.shown_y[:count]) | (frames != self.shown_frame[:count]))
+        seen = self.shown_frame[changed] >= 0
+        xs = np.concatenate((rect_x[changed], self.shown_x[changed][seen]))
+        ys = np.concatenate((rect_y[changed], self.shown_y[changed][seen]))
+        self.shown_x[:count], self.shown_y[:count], self.shown_frame[:count] = rect_x, rect_y, frames
+
+        width, height = self.sprites.size
+        visible = (xs + width > view.left) & (xs < view.right) & (ys + height > view.top) & (ys < view.bottom)
+        return [pg.Rect(x, y, width, height) for x, y in zip(xs[visible].tolist(), ys[visible].tolist())]
+
+    def get_chunks(self) -> dict[tuple[int, int], np.ndarray]:
+        """ Indices of the agents in each chunk that has any. """
+        chunks = {}
+        keys, starts = np.unique(self.sorted_keys, return_index=True)
+        for key, indices in zip(keys.tolist(), np.split(self.chunk_order, starts[1:])):
+            chunks[unpack_block_key(key)] = indices
+        return chunks
+
+    def get_blocks(self) -> set[tuple[int, int]]:
+        """ Keys of the heightmap blocks agents stand on. """
+        size = self.world.chunk_size
+        return {key for key, _ in split_blocks(self.x[:self.count], self.y[:self.count], size)}
+
+    def get_blits(self, chunk: "Chunk", camera: "Camera", view: pg.Rect | None = None) -> list[tuple[int, tuple]]:
+        """ (position, blit) pairs of the chunk's agents inside view, the camera view by
+        default, sorted for Chunk.draw_top_layer. """
+        key = pack_block_key(*chunk.chunk_id)
+        indices = self.chunk_order[np.searchsorted(self.sorted_keys, key):np.searchsorted(self.sorted_keys, key, side="right")]
+        if not indices.size:
+            return []
+        width, height = self.sprites.size
+        view = view or camera.world_rect
+        rect_x, rect_y = self.rect_x[indices], self.rect_y[indices]
+        visible = (rect_x + width > view.left) & (rect_x < view.right) & (rect_y + height > view.top) & (rect_y < view.bottom)
+        indices, rect_x, rect_y = indices[visible], rect_x[visible], rect_y[visible]
+        if not indices.size:
+            return []
+
+        x, y = self.x[indices], self.y[indices]
+        positions = chunk.get_draw_positions(rect_y, x, y)
+        # agents drawn after the same tile are ordered among themselves like tiles are
+        order = np.lexsort(((x + y).astype(np.int64) * 2 ** 32 + rect_y, positions))
+
+        sheet, areas = self.sprites.get_sheet(camera.lod)
+        frames = self.get_frames()[indices[order]]
+        # same rounding as Camera.apply
+        screen_x = (rect_x[order] >> camera.lod) + int(camera.offset_x)
+        screen_y = (rect_y[order] >> camera.lod) + int(camera.offset_y)
+        return [
+            (position, (sheet, (dest_x, dest_y), areas[frame]))
+            for position, dest_x, dest_y, frame in zip(positions[order].tolist(), screen_x.tolist(), screen_y.tolist(), frames.tolist())
+        ]
@@ -0,0 +1,71 @@
+import math
+
+import pygame as pg
+
+
+class AgentSprites:
+    """ Agent body pre-rendered once per head bob frame, side by side on one sheet.
+
+    Agents blit their frame's area of the sheet instead of redrawing their body
+    parts every frame. Sheets scaled down for zoomed out views are made on first use. """
+    def __init__(self, tile_size: int, cube_height: int, frames: int = 16):
+        self.tile_size = tile_size
+        self.cube_height = cube_height
+        self.frames = frames
+        self.bob_amplitude = 2
+        # radians per millisecond, one bob takes 2 * pi / bob_frequency milliseconds
+        self.bob_frequency = 0.02
+        self.size = (self.tile_size * 2, self.tile_size + self.cube_height)
+        self.surface = pg.Surface((self.size[0] * frames, self.size[1]), pg.SRCALPHA)
+        self.areas = [pg.Rect(frame * self.size[0], 0, *self.size) for frame in range(frames)]
+        for frame, area in enumerate(self.areas):
+            self.draw_body(self.surface.subsurface(area), self.bob_amplitude * math.sin(2 * math.pi * frame / frames))
+        self.scaled: dict[int, tuple[pg.Surface, list[pg.Rect]]] = {}
+
+    def frame_at(self, ticks: int) -> int:
+        """ The frame shown at a pg.time.get_ticks() time. """
+        return int(ticks * self.bob_frequency / (2 * math.pi) * self.frames) % self.frames
+
+    def image(self, frame: int) -> pg.Surface:
+        return self.surface.subsurface(self.areas[frame])
+
+    def get_sheet(self, lod: int) -> tuple[pg.Surface, list[pg.Rect]]:
+        """ The sheet and its frame areas downsampled by 2**lod. """
+        if lod == 0:
+            return self.surface, self.areas
+        if lod not in self.scaled:
+            width, height = max(self.size[0] >> lod, 1), max(self.size[1] >> lod, 1)
+            surface = pg.transform.smoothscale(self.surface, (width * self.frames, height))
+            self.scaled[lod] = (surface, [pg.Rect(frame * width, 0, width, height) for frame in range(self.frames)])
+        return self.scaled[lod]
+
+    def draw_body(self, surface: pg.Surface, bob_offset: float):
+        image_rect = surface.get_rect()
+        y_offset = self.tile_size // 6
+        # head circle
+        head_radius = self.tile_size // 4
+        head_pos = pg.Vector2(image_rect.centerx, image_rect.centery - head_radius - y_offset + bob_offset)
+        # body
+        body_width = self.tile_size // 2
+        body_height = self.tile_size // 2
+        body_pos = pg.Vector2(image_rect.centerx - body_width // 2, image_rect.centery - y_offset)
+        body_rect = pg.Rect(*body_pos, body_width, body_height)
+        # hands
+        hands_width = self.tile_size // 6
+        hands_radius = hands_width // 2
+        left_hand_pos = pg.Vector2(body_rect.x - hands_radius, body_rect.centery)
+        right_hand_pos = pg.Vector2(body_rect.x + body_width + hands_radius, body_rect.centery)
+        # feet
+        feet_width = self.tile_size // 3
+        feet_height = self.tile_size // 5
+        left_foot_pos = pg.Vector2(image_rect.centerx - feet_width, image_rect.centery + body_height - y_offset)
+        left_foot_rect = pg.Rect(*left_foot_pos, feet_width, feet_height)
+        right_foot_pos = pg.Vector2(image_rect.centerx, image_rect.centery + body_height - y_offset)
+        right_foot_rect = pg.Rect(*right_foot_pos, feet_width, feet_height)
+
+        pg.draw.rect(surface, pg.Color("blue"), body_rect, border_radius=5)
+        pg.draw.circle(surface, pg.Color("pink"), left_hand_pos, hands_radius)
+        pg.draw.circle(surface, pg.Color("pink"), right_hand_pos, hands_radius)
+        pg.draw.rect(surface, pg.Color("brown"), left_foot_rect, border_radius=5)
+        pg.draw.rect(surface, pg.Color("brown"), right_foot_rect, border_radius=5)
+        pg.draw.circle(surface, pg.Color("pink"), head_pos, head_radius)
@@ -0,0 +1,109 @@
+import pygame as pg
+import pygame.gfxdraw as gfxdraw
+
+from src.world.terrain import FACE_NO_LEFT, FACE_NO_RIGHT
+
+
+class TextureAtlas:
+    """ Every cube variant the world uses, packed into one surface.
+
+    A variant is a (material, face_code, shade) key. Variants are rendered the first
+    time they are asked for and memoized, so only the combinations a map actually
+    contains cost anything. Tiles refer to variants by index, and blit the matching
+    area of the atlas surface. """
+    def __init__(self, materials: dict[str, str], tile_size: int, cube_height: int, shade_step: float = 0.0, columns: int = 16, side_shades: tuple[int, int] = (200, 150)):
+        self.materials = materials
+        self.tile_size = tile_size
+        self.cube_height = cube_height
+        # brightness lost per shade level, shade 0 is the unshaded texture
+        self.shade_step = shade_step
+        # brightness of the left and right faces out of 255, fixed sunlight from the left
+        self.side_shades = side_shades
+        self.columns = columns
+        self.cell_size = (self.tile_size * 2, self.tile_size + self.cube_height)
+        self.surface = pg.Surface((self.cell_size[0] * columns, self.cell_size[1]), pg.SRCALPHA)
+        self.areas: list[pg.Rect] = []
+        self.keys: dict[tuple[str, int, int], int] = {}
+        self.faces: dict[tuple[str, int], tuple[pg.Surface, pg.Surface, pg.Surface]] = {}
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def get(self, material: str, face_code: int, shade: int = 0) -> int:
+        """ Index of a variant, rendering it into the atlas on first use. """
+        key = (material, face_code, shade)
+        if key not in self.keys:
+            area = self.allocate()
+            self.create_cube(self.surface.subsurface(area), material, face_code, shade)
+            self.keys[key] = len(self.areas)
+            self.areas.append(area)
+        return self.keys[key]
+
+    def image(self, index: int) -> pg.Surface:
+        """ A standalone view of one variant, for code that wants a surface per tile. """
+        return self.surface.subsurface(self.areas[index])
+
+    def allocate(self) -> pg.Rect:
+        row, column = divmod(len(self.areas), self.columns)
+        if (row + 1) * self.cell_size[1] > self.surface.get_height():
+            # grow by doubling; areas handed out so far keep their place
+            surface = pg.Surface((self.surface.get_width(), self.surface.get_height() * 2), pg.SRCALPHA)
+            # adding onto a fully transparent surface copies the pixels exactly, alpha included
+            surface.blit(self.surface, (0, 0), special_flags=pg.BLEND_RGBA_ADD)
+            self.surface = surface
+        return pg.Rect(column * self.cell_size[0], row * self.cell_size[1], *self.cell_size)
+
+    def get_faces(self, material: str, shade: int) -> tuple[pg.Surface, pg.Surface, pg.Surface]:
+        """ Top, left and right face textures, scaled and shaded once per material and shade.
+        Shaded faces are darkened copies of the unshaded ones, so the full size source
+        image is only loaded while it is scaled, and never kept. """
+        key = (material, shade)
+        if key not in self.faces:
+            if shade:
+                brightness = round(255 * max(1 - shade * self.shade_step, 0))
+                faces = tuple(face.copy() for face in self.get_faces(material, 0))
+                for face in faces:
+                    face.fill((brightness, brightness, brightness, 255), None, pg.BLEND_RGBA_MULT)
+            else:
+                texture = pg.image.load(self.materials[material]).convert_alpha()
+                texture_top = pg.transform.scale(texture, (self.tile_size * 2, self.tile_size))
+                texture_left = pg.transform.scale(texture, (self.tile_size, self.cube_height))
+                texture_right = pg.transform.scale(texture, (self.tile_size, self.cube_height))
+
+                left_shade, right_shade = self.side_shades
+                texture_left.fill((left_shade, left_shade, left_shade, 255), None, pg.BLEND_RGBA_MULT)
+                texture_right.fill((right_shade, right_shade, right_shade, 255), None, pg.BLEND_RGBA_MULT)
+                faces = (texture_top, texture_left, texture_right)
+            self.faces[key] = faces
+        return self.faces[key]
+
+    def get_cube_points(self) -> tuple[list[tuple[int, int]]]:
+        top_face_points = [
+            (self.tile_size, 0),
+            (self.tile_size * 2, self.tile_size / 2),
+            (self.tile_size, self.tile_size),
+            (0, self.tile_size / 2)
+        ]
+        left_face_points = [
+            (0, self.tile_size / 2),
+            (self.tile_size, self.tile_size),
+            (self.tile_size, self.tile_size + self.cube_height),
+            (0, self.tile_size / 2 + self.cube_height)
+        ]
+        right_face_points = [
+            (self.tile_size, self.tile_size),
+            (self.tile_size * 2, self.tile_size / 2),
+            (self.tile_size * 2, self.tile_size / 2 + self.cube_height),
+            (self.tile_size, self.tile_size + self.cube_height)
+        ]
+        return top_face_points, left_face_points, right_face_points
+
+    def create_cube(self, surface: pg.Surface, material: str, face_code: int, shade: int):
+        top_face_points, left_face_points, right_face_points = self.get_cube_points()
+        texture_top, texture_left, texture_right = self.get_faces(material, shade)
+
+        gfxdraw.textured_polygon(surface, top_face_points, texture_top, 0, 0)
+        if not face_code & FACE_NO_LEFT:
+            gfxdraw.textured_polygon(surface, left_face_points, texture_left, 0, 0)
+        if not face_code & FACE_NO_RIGHT:
+            gfxdraw.textured_polygon(surface, right_face_points, texture_right, 0, 0)
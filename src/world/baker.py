@@ -0,0 +1,62 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from typing import TYPE_CHECKING, Callable
+if TYPE_CHECKING:
+    from src.world.chunk import Chunk
+    from src.world.world import World
+
+
+class ChunkBaker:
+    """ Bakes chunks and their LODs on a thread pool; pygame releases the GIL while blitting
+    and scaling.
+
+    Finished surfaces are handed to the chunk cache by poll(), so the cache is
+    only ever touched from the main thread. Each job is kept with the chunk
+    method that caches its result. """
+    def __init__(self, world: "World", workers: int):
+        self.world = world
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-baker")
+        self.pending: dict[object, tuple[Future, Callable]] = {}
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def is_pending(self, chunk: "Chunk") -> bool:
+        return chunk.chunk_id in self.pending
+
+    def is_busy(self, chunk: "Chunk") -> bool:
+        """ Whether any bake of the chunk, LODs included, is pending. """
+        return chunk.chunk_id in self.pending or chunk.lod_job_key in self.pending
+
+    def submit(self, chunk: "Chunk"):
+        if chunk.chunk_id not in self.pending and not chunk.is_baked:
+            self.pending[chunk.chunk_id] = (self.executor.submit(chunk.bake_layers), chunk.cache_layers)
+
+    def submit_lods(self, chunk: "Chunk", level: int):
+        """ Scale a chunk down to level, and the levels between it and its source. A chunk
+        whose layers are not cached is baked in the same job, and only its LODs are kept. """
+        if chunk.lod_job_key not in self.pending:
+            self.pending[chunk.lod_job_key] = (self.executor.submit(chunk.bake_lods, *chunk.lod_source(level), level), chunk.cache_lods)
+
+    def discard(self, chunk: "Chunk"):
+        """ Drop bakes that went stale, their results are ignored if they already started. """
+        for key in (chunk.chunk_id, chunk.lod_job_key):
+            job = self.pending.pop(key, None)
+            if job is not None:
+                job[0].cancel()
+
+    def poll(self) -> int:
+        """ Move finished bakes into the chunk cache, returns how many were collected. """
+        finished = [key for key, (future, _) in self.pending.items() if future.done()]
+        for key in finished:
+            future, cache = self.pending.pop(key)
+            cache(*future.result())
+        return len(finished)
+
+    def wait(self):
+        wait([future for future, _ in self.pending.values()])
+        self.poll()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pending.clear()
@@ -1,47 +1,488 @@
+import numpy as np
 import pygame as pg
+from bisect import bisect_left, bisect_right
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from src.world.tile import Tile
     from src.core.camera import Camera
     from src.world.world import World
 
-from src.world.shadows import Shadows
+from src.world.tile_store import TileStore
+from src.world.terrain import ShadowType
+
+
+PLACEHOLDER_COLOR = (40, 40, 40)
+
+
+def get_chunk_rect(world: "World", grid_rect: pg.Rect) -> pg.Rect:
+    """ World-space rect of the chunk covering grid_rect, anchored at the highest possible
+    cube so terrain edits never move the surface. """
+    return pg.Rect(
+        (grid_rect.left - grid_rect.bottom + 1) * world.tile_size,
+        (grid_rect.left + grid_rect.top) * world.tile_size // 2 - world.max_elevation * world.cube_height,
+        *get_chunk_surface_size(world, world.chunk_size)
+    )
+
+
+def get_chunk_surface_size(world: "World", chunk_size: int) -> tuple[int, int]:
+    """ Pixel size of the surfaces of chunks of chunk_size x chunk_size cells. """
+    return (
+        chunk_size * world.tile_size * 2,
+        (chunk_size * world.tile_size) + (world.max_elevation * world.tile_size) + (world.tile_size * 4)
+    )
 
 
 class Chunk:
-    def __init__(self, world: "World", chunk_id: int, tiles: list["Tile"]):
+    def __init__(self, world: "World", chunk_id: tuple[int, int], grid_rect: pg.Rect, tiles: TileStore | None = None):
         self.world = world
         self.chunk_id = chunk_id
-        self.tiles = tiles
+        self.grid_rect = grid_rect
         self.tile_size = self.world.tile_size
         self.cube_height = self.world.cube_height
         self.chunk_size = self.world.chunk_size
         self.max_elevation = self.world.max_elevation
-        self.width = self.chunk_size * self.tile_size * 2
-        self.height = (self.chunk_size * self.tile_size) + (self.max_elevation * self.tile_size) + (self.tile_size * 4)
-        self.main_surface = pg.Surface((self.width, self.height), pg.SRCALPHA)
-        self.rect = self.main_surface.get_rect()
-        self.shadows = Shadows(self)
-        self.top_layer_tiles: list["Tile"] = []
-
-    def update(self):
-        self.rect.x = min(tile.rect.x for tile in self.tiles)
-        self.rect.y = min(tile.rect.y for tile in self.tiles)
-
-        for tile in self.tiles:
-            if not tile.needs_layering:
-                self.main_surface.blit(tile.image, (tile.rect.x - self.rect.x, tile.rect.y - self.rect.y))
-                self.shadows.draw(tile, self.shadows.main_surface)
-            else:
-                self.shadows.draw(tile, self.shadows.main_surface)
-                if tile.is_surface_tile:
-                    self.top_layer_tiles.append(tile)
+        self.rect = get_chunk_rect(world, grid_rect)
+        self.width, self.height = self.rect.size
+        self.footprint = self.get_footprint_points()
+        # edited chunks no longer match the generated terrain kept in the disk cache
+        self.edited = chunk_id in world.edited_chunks
+        self.create_tiles(tiles)
+
+    def create_tiles(self, tiles: TileStore | None = None):
+        """ Build the chunk's tiles from the heightmap, unless given ones built for it. """
+        self.tiles = tiles if tiles is not None else TileStore(self.world, self.grid_rect, self.chunk_id)
+        self.sort_top_layer()
+        self.update_light()
+
+    def update_light(self):
+        """ Light stamp of every tile for the sun's current position, see Lighting. """
+        lighting = self.world.lighting
+        self.light_stamps = lighting.get_stamp_ids(self.tiles, self.grid_rect) if lighting is not None else None
+        # the sun the stamps and lightmaps are for, relit once it differs from lighting.version
+        self.light_version = lighting.version if lighting is not None else 0
+
+    def sort_top_layer(self):
+        """ Order the layered surface tiles for drawing once, instead of every frame,
+        and split them into overlay bands of band_rows isometric rows. """
+        tiles = self.tiles
+        layered = np.flatnonzero(tiles.needs_layering & tiles.is_surface)
+        rows = tiles.x[layered] + tiles.y[layered]
+        order = np.lexsort((tiles.rect_y[layered], rows))
+        self.top_layer_indices: np.ndarray = layered[order]
+        rows = rows[order]
+        self.top_layer_keys: list[tuple[int, int]] = list(zip(rows.tolist(), tiles.rect_y[self.top_layer_indices].tolist()))
+        self.top_layer_areas: list[pg.Rect] = [tiles.atlas.areas[i] for i in tiles.image[self.top_layer_indices].tolist()]
+        self.top_layer_xy = np.column_stack((tiles.rect_x[self.top_layer_indices], tiles.rect_y[self.top_layer_indices]))
+        self.top_layer_cells: dict[tuple[int, int], int] = {
+            cell: position for position, cell in enumerate(zip(tiles.x[self.top_layer_indices].tolist(), tiles.y[self.top_layer_indices].tolist()))
+        }
+        # the same ordering as top_layer_keys packed into one integer, and the position of the
+        # layered tile on each cell or -1, for placing many entities at once
+        self.top_layer_sort_keys = rows.astype(np.int64) * 2 ** 32 + tiles.rect_y[self.top_layer_indices]
+        self.top_layer_under = np.full((self.grid_rect.height, self.grid_rect.width), -1, dtype=np.int32)
+        self.top_layer_under[tiles.y[self.top_layer_indices] - self.grid_rect.top, tiles.x[self.top_layer_indices] - self.grid_rect.left] = np.arange(len(layered))
+        # positions of the layered tiles with a river on them, whose water is blitted right after the tile
+        water = tiles.water[self.top_layer_indices]
+        wet = np.flatnonzero(water)
+        self.top_layer_wet: list[int] = wet.tolist()
+        self.top_layer_water = water[wet]
+        self.top_layer_water_xy = np.column_stack((tiles.rect_x[self.top_layer_indices[wet]], tiles.water_y[self.top_layer_indices[wet]]))
+
+        bands = (rows - (self.grid_rect.left + self.grid_rect.top)) // self.world.band_rows
+        starts = np.flatnonzero(np.diff(bands, prepend=-1))
+        self.band_starts: list[int] = starts.tolist() + [len(layered)]
+        self.tile_bands: list[int] = (np.cumsum(np.diff(bands, prepend=-1) != 0) - 1).tolist()
+        self.band_rects: list[pg.Rect] = []
+        for start, stop in zip(self.band_starts, self.band_starts[1:]):
+            xy = self.top_layer_xy[start:stop]
+            left, top = xy.min(axis=0)
+            right, bottom = xy.max(axis=0) + (self.tile_size * 2, self.tile_size + self.cube_height)
+            band_rect = pg.Rect(left, top, right - left, bottom - top)
+            # rivers reach a little past the top faces they run on
+            if bisect_left(self.top_layer_wet, start) < bisect_left(self.top_layer_wet, stop):
+                band_rect.inflate_ip(self.tile_size, self.tile_size)
+            self.band_rects.append(band_rect)
+
+    def get_draw_position(self, rect_y: int, grid_pos: tuple[int, int]) -> int:
+        """ How many top layer tiles an entity standing on grid_pos is drawn after. """
+        position = bisect_right(self.top_layer_keys, (grid_pos[0] + grid_pos[1], rect_y))
+        # an entity always stands in front of the layered tile under it
+        if grid_pos in self.top_layer_cells:
+            position = max(position, self.top_layer_cells[grid_pos] + 1)
+        return position
+
+    def get_draw_positions(self, rect_ys: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ get_draw_position of many entities standing on cells of this chunk. """
+        positions = np.searchsorted(self.top_layer_sort_keys, (xs + ys).astype(np.int64) * 2 ** 32 + rect_ys, side="right")
+        return np.maximum(positions, self.top_layer_under[ys - self.grid_rect.top, xs - self.grid_rect.left] + 1)
+
+    @property
+    def main_surface(self) -> pg.Surface:
+        """ The baked chunk, re-baked on demand after being evicted from the chunk cache. """
+        surface = self.world.chunk_cache.get(self.chunk_id)
+        if surface is None:
+            surface = self.update()
+        return surface
+
+    @property
+    def overlay(self) -> list[pg.Surface] | None:
+        """ One surface per overlay band, None while the chunk is still baking on the pool. """
+        overlay = self.world.chunk_cache.get(self.overlay_key)
+        if overlay is None and not (self.world.baker is not None and self.world.baker.is_pending(self)):
+            overlay = self.bake_overlay()
+            self.world.chunk_cache.put(self.overlay_key, overlay)
+        return overlay
+
+    @property
+    def overlay_key(self) -> tuple[tuple[int, int], str]:
+        return (self.chunk_id, "overlay")
+
+    @property
+    def light(self) -> pg.Surface | None:
+        """ The main surface's lightmap, None without lighting or while the chunk is still baking. """
+        return self.get_light(self.light_key, self.bake_light)
+
+    @property
+    def overlay_light(self) -> list[pg.Surface] | None:
+        """ One lightmap per overlay band, None without lighting or while the chunk is still baking. """
+        return self.get_light(self.overlay_light_key, self.bake_overlay_light)
+
+    def get_light(self, key: tuple[tuple[int, int], str], bake):
+        if self.world.lighting is None:
+            return None
+        light = self.world.chunk_cache.get(key)
+        if light is None and not (self.world.baker is not None and self.world.baker.is_pending(self)):
+            light = bake()
+            self.world.chunk_cache.put(key, light)
+        return light
+
+    @property
+    def light_key(self) -> tuple[tuple[int, int], str]:
+        return (self.chunk_id, "light")
+
+    @property
+    def overlay_light_key(self) -> tuple[tuple[int, int], str]:
+        return (self.chunk_id, "overlay_light")
+
+    @property
+    def is_baked(self) -> bool:
+        return self.chunk_id in self.world.chunk_cache
+
+    @property
+    def lod_job_key(self) -> tuple[tuple[int, int], str]:
+        return (self.chunk_id, "lods")
+
+    def lod_key(self, level: int) -> tuple[tuple[int, int], str, int]:
+        return (self.chunk_id, "lod", level)
+
+    def has_lod(self, level: int) -> bool:
+        return self.lod_key(level) in self.world.chunk_cache
+
+    def lod_size(self, level: int) -> tuple[int, int]:
+        return (max(self.width >> level, 1), max(self.height >> level, 1))
+
+    def lod_source(self, level: int) -> tuple[int, pg.Surface | tuple | None]:
+        """ The closest cached level above level, else level 0 as the baked layers, the surface,
+        its overlay and their lightmaps, or None when they are not all cached. Nothing is baked
+        here, on the main thread: bake_lods bakes missing layers itself without caching them. """
+        cache = self.world.chunk_cache
+        for source_level in range(level - 1, 0, -1):
+            surface = cache.get(self.lod_key(source_level))
+            if surface is not None:
+                return source_level, surface
+        keys = [self.chunk_id, self.overlay_key] + ([self.light_key, self.overlay_light_key] if self.world.lighting is not None else [])
+        layers = tuple(cache.peek(key) for key in keys)
+        return 0, layers if all(layer is not None for layer in layers) else None
+
+    def bake_lods(self, source_level: int, source: pg.Surface | tuple | None, level: int) -> tuple[int, list[pg.Surface]]:
+        """ Halve source until it reaches level, returning the first new level and every surface
+        on the way, so the chain down to 1/2**level is built from the closest level once. """
+        if source_level == 0:
+            surface, overlay, *lights = source if source is not None else self.bake_layers()
+            light, overlay_light = lights or (None, None)
+            source = surface.copy()
+            if light is not None:
+                source.blit(light, (0, 0), special_flags=pg.BLEND_RGBA_MULT)
+            blits = []
+            for band, band_rect in enumerate(self.band_rects):
+                blits.append((overlay[band], band_rect.move(-self.rect.x, -self.rect.y)))
+                if overlay_light is not None:
+                    blits.append((overlay_light[band], band_rect.move(-self.rect.x, -self.rect.y), None, pg.BLEND_RGBA_MULT))
+            source.blits(blits, doreturn=False)
+        lods = []
+        for lod in range(source_level + 1, level + 1):
+            source = pg.transform.smoothscale(source, self.lod_size(lod))
+            lods.append(source)
+        return source_level + 1, lods
 
-        self.main_surface.blit(self.shadows.main_surface, (0, 0))
+    def update_lods(self, level: int):
+        self.cache_lods(*self.bake_lods(*self.lod_source(level), level))
+
+    def cache_lods(self, first_level: int, lods: list[pg.Surface]):
+        for level, surface in enumerate(lods, first_level):
+            self.world.chunk_cache.put(self.lod_key(level), surface)
+        # LODs baked on the pool replace a placeholder
+        self.world.add_damage(self.rect)
+
+    def discard_lods(self):
+        for level in range(1, self.world.lod_levels):
+            self.world.chunk_cache.discard(self.lod_key(level))
+
+    def unload(self):
+        """ Drop every baked surface of the chunk, and any bake still pending for it. """
+        if self.world.baker is not None:
+            self.world.baker.discard(self)
+        self.world.chunk_cache.discard(self.chunk_id)
+        self.world.chunk_cache.discard(self.overlay_key)
+        self.world.chunk_cache.discard(self.light_key)
+        self.world.chunk_cache.discard(self.overlay_light_key)
+        self.discard_lods()
+
+    def update(self) -> pg.Surface:
+        layers = self.bake_layers()
+        self.cache_layers(*layers)
+        return layers[0]
+
+    def bake_layers(self) -> tuple:
+        """ The main surface and overlay, followed by their lightmaps with lighting. """
+        layers = (self.load(), self.bake_overlay())
+        if self.world.lighting is not None:
+            layers += (self.bake_light(), self.bake_overlay_light())
+        return layers
+
+    def cache_layers(self, surface: pg.Surface, overlay: list[pg.Surface], light: pg.Surface | None = None, overlay_light: list[pg.Surface] | None = None):
+        self.world.chunk_cache.put(self.chunk_id, surface)
+        self.world.chunk_cache.put(self.overlay_key, overlay)
+        if light is not None:
+            self.world.chunk_cache.put(self.light_key, light)
+            self.world.chunk_cache.put(self.overlay_light_key, overlay_light)
+        self.world.add_damage(self.rect)
+
+    def load(self) -> pg.Surface:
+        """ The baked surface from the disk cache, baked and saved there on a miss. """
+        disk_cache = self.world.disk_cache if not self.edited else None
+        if disk_cache is not None:
+            surface = disk_cache.load_chunk(self.chunk_id, (self.width, self.height))
+            if surface is not None:
+                return surface
+        surface = self.bake()
+        if disk_cache is not None and not self.edited:
+            disk_cache.save_chunk(self.chunk_id, surface)
+        return surface
+
+    def bake(self) -> pg.Surface:
+        surface = pg.Surface((self.width, self.height), pg.SRCALPHA)
+        self.bake_area(surface, surface.get_rect())
+        return surface
+
+    def bake_overlay(self) -> list[pg.Surface]:
+        """ Bake the top layer tiles of each band, in drawing order, into one surface per band. """
+        overlay = []
+        for band_rect, start, stop in zip(self.band_rects, self.band_starts, self.band_starts[1:]):
+            surface = pg.Surface(band_rect.size, pg.SRCALPHA)
+            surface.blits(self.get_top_layer_blits(start, stop, (-band_rect.x, -band_rect.y)), doreturn=False)
+            overlay.append(surface)
+        return overlay
+
+    def get_top_layer_blits(self, start: int, stop: int, offset: tuple[int, int], lit: bool = False) -> list:
+        """ Surface.blits items for the top layer tiles from start to stop moved by offset,
+        each followed by the water on it, and when lit by its light multiplied over both. """
+        atlas = self.world.atlas.surface
+        xy = self.top_layer_xy[start:stop] + offset
+        blits = [(atlas, position, area) for position, area in zip(xy.tolist(), self.top_layer_areas[start:stop])]
+        first, last = bisect_left(self.top_layer_wet, start), bisect_left(self.top_layer_wet, stop)
+        if not lit and first == last:
+            return blits
+        tiles = [[blit] for blit in blits]
+        if first < last:
+            water = self.world.hydrology.get_blits(self.top_layer_water[first:last], *(self.top_layer_water_xy[first:last] + offset).T)
+            for position, blit in zip(self.top_layer_wet[first:last], water):
+                tiles[position - start].append(blit)
+        if lit:
+            light = self.world.lighting.get_blits(self.light_stamps[self.top_layer_indices[start:stop]], *xy.T)
+            for tile, blit in zip(tiles, light):
+                tile.append(blit)
+        return [blit for tile in tiles for blit in tile]
+
+    def bake_area(self, surface: pg.Surface, area: pg.Rect):
+        """ Redraw the tiles, shadows and water that touch area, a rect in chunk space. """
+        tiles = self.tiles
+        xs = tiles.rect_x - self.rect.x
+        ys = tiles.rect_y - self.rect.y
+        # shadows reach further right and down than the cube images that cast them
+        in_area = (xs < area.right) & (ys < area.bottom) & (ys + self.tile_size + self.cube_height * 2 > area.top)
+        images = in_area & (xs + self.tile_size * 2 > area.left) & ~tiles.needs_layering
+        shadows = in_area & (xs + self.tile_size * 4 > area.left) & (tiles.shadow != ShadowType.NONE)
+
+        surface.fill((0, 0, 0, 0), area)
+        surface.set_clip(area)
+        atlas, atlas_areas = self.world.atlas.surface, self.world.atlas.areas
+        surface.blits(
+            [(atlas, position, atlas_areas[image_id]) for image_id, position in zip(tiles.image[images].tolist(), zip(xs[images].tolist(), ys[images].tolist()))],
+            doreturn=False
+        )
+        surface.set_clip(None)
+
+        # lighting casts its own shadows from the sun
+        if self.world.lighting is None:
+            self.world.shadows.draw(surface, area, tiles.shadow[shadows], xs[shadows], ys[shadows])
+
+        # water on layered tiles is baked into the overlay with them, rivers reach a little past the top face
+        water_ys = tiles.water_y - self.rect.y
+        slack = self.tile_size // 2
+        water = (
+            (tiles.water != 0) & ~tiles.needs_layering
+            & (xs - slack < area.right) & (xs + self.tile_size * 2 + slack > area.left)
+            & (water_ys - slack < area.bottom) & (water_ys + self.tile_size + slack > area.top)
+        )
+        self.world.hydrology.draw(surface, area, tiles.water[water], xs[water], water_ys[water])
+
+    def bake_light(self) -> pg.Surface:
+        surface = self.world.lighting.create_lightmap((self.width, self.height))
+        self.bake_light_area(surface, surface.get_rect())
+        return surface
+
+    def bake_light_area(self, surface: pg.Surface, area: pg.Rect):
+        """ Repaint the main surface's lightmap inside area, a rect in chunk space. """
+        tiles = self.tiles
+        xs = tiles.rect_x - self.rect.x
+        ys = tiles.rect_y - self.rect.y
+        images = (xs < area.right) & (xs + self.tile_size * 2 > area.left) & (ys < area.bottom) & (ys + self.tile_size + self.cube_height > area.top) & ~tiles.needs_layering
+        self.world.lighting.draw(surface, area, self.light_stamps[images], xs[images], ys[images])
+
+    def bake_overlay_light(self) -> list[pg.Surface]:
+        """ A lightmap for each overlay band, lighting its tiles in the same order. """
+        overlay_light = []
+        for band_rect, start, stop in zip(self.band_rects, self.band_starts, self.band_starts[1:]):
+            surface = self.world.lighting.create_lightmap(band_rect.size)
+            xs, ys = (self.top_layer_xy[start:stop] - band_rect.topleft).T
+            self.world.lighting.draw(surface, surface.get_rect(), self.light_stamps[self.top_layer_indices[start:stop]], xs, ys)
+            overlay_light.append(surface)
+        return overlay_light
+
+    def recolor_light(self, palette: list[tuple[int, int, int]]):
+        """ Give the cached lightmaps the light palette of another sun position, see Lighting. """
+        cache = self.world.chunk_cache
+        light, overlay_light = cache.peek(self.light_key), cache.peek(self.overlay_light_key)
+        for lightmap in ([light] if light is not None else []) + (overlay_light or []):
+            lightmap.set_palette(palette)
+
+    def relight(self):
+        """ Light the chunk for the sun's current position, repainting the lightmaps it has cached
+        and rescaling its cached LODs. Chunks with bakes pending are left for a later call, the bakes
+        paint lightmaps with the stamps they started with. """
+        baker = self.world.baker
+        if baker is not None and baker.is_busy(self):
+            return
+        self.update_light()
+        cache = self.world.chunk_cache
+        if self.light_key in cache:
+            cache.put(self.light_key, self.bake_light())
+        if self.overlay_light_key in cache:
+            cache.put(self.overlay_light_key, self.bake_overlay_light())
+        levels = [level for level in range(1, self.world.lod_levels) if self.lod_key(level) in cache]
+        self.discard_lods()
+        if levels and self.is_baked:
+            self.update_lods(max(levels))
+        self.world.add_damage(self.rect)
+
+    def rebuild(self, dirty_cells: pg.Rect):
+        """ Pick up terrain edits to dirty_cells, re-baking only the part of the surface they cover. """
+        self.create_tiles()
+        self.edited = True
+        # band boundaries move with the tiles, so the overlay is re-baked on its next draw
+        self.world.chunk_cache.discard(self.overlay_key)
+        self.world.chunk_cache.discard(self.overlay_light_key)
+        self.discard_lods()
+        if self.world.baker is not None:
+            self.world.baker.discard(self)
+        if self.world.disk_cache is not None:
+            self.world.disk_cache.discard_chunk(self.chunk_id)
+
+        area = self.get_cells_area(dirty_cells).clip((0, 0, self.width, self.height))
+        self.world.add_damage(area.move(self.rect.topleft))
+        surface = self.world.chunk_cache.get(self.chunk_id)
+        if surface is not None:
+            self.bake_area(surface, area)
+        light = self.world.chunk_cache.get(self.light_key)
+        if light is not None:
+            self.bake_light_area(light, area)
+
+    def get_cells_area(self, cells: pg.Rect) -> pg.Rect:
+        """ Chunk space rect holding every cube, shadow and water stamp the given cells can draw. """
+        left = (cells.left - cells.bottom + 1) * self.tile_size - self.tile_size // 2
+        right = (cells.right - 1 - cells.top) * self.tile_size + self.tile_size * 4
+        top = (cells.left + cells.top) * self.tile_size // 2 - self.max_elevation * self.cube_height
+        bottom = (cells.right + cells.bottom - 2) * self.tile_size // 2 + self.tile_size + self.cube_height * 2
+        return pg.Rect(left - self.rect.x, top - self.rect.y, right - left, bottom - top)
+
+    def get_footprint_points(self) -> list[tuple[int, int]]:
+        """ Screen corners of the chunk's ground diamond, relative to the world origin. """
+        cells = self.grid_rect
+        corners = [(cells.left, cells.top), (cells.right, cells.top), (cells.right, cells.bottom), (cells.left, cells.bottom)]
+        return [((x - y) * self.tile_size + self.tile_size, (x + y) * self.tile_size // 2) for x, y in corners]
+
+    def draw_placeholder(self, screen: pg.Surface, camera: "Camera"):
+        offset_x, offset_y, lod = int(camera.offset_x), int(camera.offset_y), camera.lod
+        pg.draw.polygon(screen, PLACEHOLDER_COLOR, [((x >> lod) + offset_x, (y >> lod) + offset_y) for x, y in self.footprint])
+
+    def draw_top_layer(self, screen: pg.Surface, camera: "Camera", entities: list[tuple[int, tuple]] = ()):
+        """ Draw the top layer, blitting each (position, blit) entity after the first position
+        tiles as given by get_draw_position. blit is a Surface.blits item, entities must be
+        sorted by position. Tiles and entities go to the screen in a single blits call. """
+        # same rounding as Camera.apply, which truncates the offset before moving
+        offset = (int(camera.offset_x), int(camera.offset_y))
+        overlay, overlay_light = self.overlay, self.overlay_light
+        blits = []
+        start = 0
+        for position, blit in entities:
+            self.add_top_layer_range(blits, offset, overlay, overlay_light, start, position)
+            blits.append(blit)
+            start = position
+        self.add_top_layer_range(blits, offset, overlay, overlay_light, start, len(self.top_layer_areas))
+        screen.blits(blits, doreturn=False)
+        self.world.blits_drawn += len(blits)
+
+    def add_top_layer_range(self, blits: list, offset: tuple[int, int], overlay: list[pg.Surface] | None, overlay_light: list[pg.Surface] | None, start: int, stop: int):
+        """ Whole bands between start and stop are blitted from the overlay, tiles of bands
+        split by an entity are blitted one by one. """
+        lit = self.world.lighting is not None
+        position = start
+        while position < stop:
+            band = self.tile_bands[position]
+            band_start, band_stop = self.band_starts[band], self.band_starts[band + 1]
+            if overlay is not None and (overlay_light is not None or not lit) and position == band_start and band_stop <= stop:
+                blits.append((overlay[band], self.band_rects[band].move(offset)))
+                if lit:
+                    blits.append((overlay_light[band], self.band_rects[band].move(offset), None, pg.BLEND_RGBA_MULT))
+                position = band_stop
+            else:
+                end = min(band_stop, stop)
+                blits.extend(self.get_top_layer_blits(position, end, offset, lit))
+                position = end
 
     def draw_main_layer(self, screen: pg.Surface, camera: "Camera"):
+        baker = self.world.baker
+        if baker is not None and not self.is_baked:
+            baker.submit(self)
+            self.draw_placeholder(screen, camera)
+            return
         screen.blit(self.main_surface, camera.apply(self.rect))
+        self.world.blits_drawn += 1
+        light = self.light
+        if light is not None:
+            screen.blit(light, camera.apply(self.rect), special_flags=pg.BLEND_RGBA_MULT)
+            self.world.blits_drawn += 1
 
-    def add_tile(self, tile: "Tile"):
-        self.tiles.append(tile)
+    def draw_lod(self, screen: pg.Surface, camera: "Camera"):
+        """ Draw the chunk, top layer included, downsampled to the camera's zoom level. """
+        surface = self.world.chunk_cache.get(self.lod_key(camera.lod))
+        if surface is None:
+            if self.world.baker is not None:
+                self.world.baker.submit_lods(self, camera.lod)
+                self.draw_placeholder(screen, camera)
+                return
+            self.update_lods(camera.lod)
+            surface = self.world.chunk_cache.get(self.lod_key(camera.lod))
+        screen.blit(surface, camera.apply(self.rect))
+        self.world.blits_drawn += 1
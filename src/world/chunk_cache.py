@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import pygame as pg
+
+
+def surface_bytes(surface: pg.Surface | list[pg.Surface]) -> int:
+    """ Pixel memory of a surface, or of a list of surfaces cached under one key. """
+    if isinstance(surface, list):
+        return sum(surface_bytes(part) for part in surface)
+    return surface.get_pitch() * surface.get_height()
+
+
+class ChunkCache:
+    """ Least recently used store of baked chunk surfaces, bounded by a byte budget.
+    A budget of None keeps every surface. Values are surfaces or lists of surfaces. """
+    def __init__(self, budget: int | None = None):
+        self.budget = budget
+        self.surfaces: OrderedDict[object, pg.Surface] = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self.surfaces
+
+    def __len__(self) -> int:
+        return len(self.surfaces)
+
+    def get(self, key) -> pg.Surface | None:
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.surfaces.move_to_end(key)
+        return surface
+
+    def peek(self, key) -> pg.Surface | None:
+        """ A cached value, without counting a hit or miss or making it recently used. """
+        return self.surfaces.get(key)
+
+    def put(self, key, surface: pg.Surface):
+        self.discard(key)
+        self.surfaces[key] = surface
+        self.bytes_used += surface_bytes(surface)
+        self.evict()
+
+    def discard(self, key):
+        surface = self.surfaces.pop(key, None)
+        if surface is not None:
+            self.bytes_used -= surface_bytes(surface)
+
+    def evict(self):
+        # the most recent surface always stays, even when it alone exceeds the budget
+        while self.budget is not None and self.bytes_used > self.budget and len(self.surfaces) > 1:
+            _, surface = self.surfaces.popitem(last=False)
+            self.bytes_used -= surface_bytes(surface)
+            self.evictions += 1
+
+    def clear(self):
+        self.surfaces.clear()
+        self.bytes_used = 0
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pygame as pg
+
+
+# bump whenever generation or baking output changes so stale caches are not reused
+CACHE_VERSION = 5
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class DiskCache:
+    """ Generated heightmap blocks and baked chunk pixels kept on disk between launches.
+
+    Entries live in a directory named after a hash of every parameter that
+    affects them, so changing any parameter or asset starts a fresh cache.
+    Loads are memory-mapped; pages are read only when a surface is drawn. """
+    def __init__(self, root: str, params: dict, asset_paths: list[str]):
+        self.params = dict(params, version=CACHE_VERSION, assets={path: file_hash(path) for path in asset_paths})
+        self.key = hashlib.sha1(json.dumps(self.params, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(root, self.key)
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "params.json"), "w") as f:
+            json.dump(self.params, f, indent=4, sort_keys=True)
+
+    def heights_path(self, key: tuple[int, int]) -> str:
+        return os.path.join(self.path, f"heights_{key[0]}_{key[1]}.npy")
+
+    def water_path(self, key: tuple[int, int] | None) -> str:
+        """ Water of a chunk's window, or of a whole bounded world under None, see Hydrology. """
+        return os.path.join(self.path, "water.npz" if key is None else f"water_{key[0]}_{key[1]}.npz")
+
+    def chunk_path(self, chunk_id: tuple[int, int]) -> str:
+        return os.path.join(self.path, f"chunk_{chunk_id[0]}_{chunk_id[1]}.rgba")
+
+    def write(self, path: str, data: bytes):
+        # written under a temporary name so a crash never leaves a truncated entry behind
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def load_heights(self, key: tuple[int, int]) -> np.ndarray | None:
+        path = self.heights_path(key)
+        if not os.path.exists(path):
+            return None
+        # copy-on-write, so runtime terrain edits never reach the file
+        return np.load(path, mmap_mode="c")
+
+    def save_heights(self, key: tuple[int, int], heights: np.ndarray):
+        temp_path = f"{self.heights_path(key)}.{os.getpid()}.tmp.npy"
+        np.save(temp_path, heights)
+        os.replace(temp_path, self.heights_path(key))
+
+    def load_water(self, key: tuple[int, int] | None) -> tuple[np.ndarray, np.ndarray] | None:
+        """ The filled heights and flow receivers the water of a key was solved from. """
+        path = self.water_path(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return arrays["filled"], arrays["receivers"]
+
+    def save_water(self, key: tuple[int, int] | None, filled: np.ndarray, receivers: np.ndarray):
+        temp_path = f"{self.water_path(key)}.{os.getpid()}.tmp.npz"
+        np.savez(temp_path, filled=filled, receivers=receivers)
+        os.replace(temp_path, self.water_path(key))
+
+    def load_chunk(self, chunk_id: tuple[int, int], size: tuple[int, int]) -> pg.Surface | None:
+        path = self.chunk_path(chunk_id)
+        if not os.path.exists(path) or os.path.getsize(path) != size[0] * size[1] * 4:
+            return None
+        pixels = np.memmap(path, dtype=np.uint8, mode="c")
+        return pg.image.frombuffer(pixels, size, "RGBA")
+
+    def save_chunk(self, chunk_id: tuple[int, int], surface: pg.Surface):
+        self.write(self.chunk_path(chunk_id), pg.image.tobytes(surface, "RGBA"))
+
+    def discard_chunk(self, chunk_id: tuple[int, int]):
+        if os.path.exists(self.chunk_path(chunk_id)):
+            os.remove(self.chunk_path(chunk_id))
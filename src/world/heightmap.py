@@ -0,0 +1,129 @@
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.world.world import World
+
+
+def pack_block_key(bx, by):
+    """ Block, or chunk, keys packed into one int64, ordered like chunks are drawn, by y then x. """
+    return np.asarray(by, dtype=np.int64) * 2 ** 32 + np.asarray(bx, dtype=np.int64) + 2 ** 31
+
+
+def unpack_block_key(key) -> tuple[int, int]:
+    """ (bx, by) of a key packed by pack_block_key. """
+    by, bx = divmod(int(key), 2 ** 32)
+    return bx - 2 ** 31, by
+
+
+def split_blocks(xs: np.ndarray, ys: np.ndarray, size: int):
+    """ ((bx, by), mask) for every block of size x size cells the cells (xs, ys) fall in. """
+    bxs, bys = xs // size, ys // size
+    if bxs.size and (bxs == bxs[0]).all() and (bys == bys[0]).all():
+        yield (int(bxs[0]), int(bys[0])), slice(None)
+        return
+    packed = pack_block_key(bxs, bys)
+    keys, first = np.unique(packed, return_index=True)
+    for key, index in zip(keys.tolist(), first.tolist()):
+        yield (int(bxs[index]), int(bys[index])), packed == key
+
+
+class HeightMap:
+    """ Cell elevations of an unbounded grid, sampled from noise one block of
+    block_size x block_size cells at a time, the first time anything reads them.
+
+    Indexed like the 2D array it replaces, grid[y, x] with ints or index arrays.
+    Blocks are keyed by (bx, by), the same keys as the chunks covering them.
+    Edited blocks are kept for good, untouched ones can be unloaded and are
+    generated again, identically, when needed. """
+    def __init__(self, world: "World", block_size: int):
+        self.world = world
+        self.block_size = block_size
+        self.dtype = np.int16
+        self.blocks: dict[tuple[int, int], np.ndarray] = {}
+        self.edited: set[tuple[int, int]] = set()
+        # highest elevation of each block, kept until the block is edited or unloaded
+        self.maxima: dict[tuple[int, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def get_block(self, key: tuple[int, int]) -> np.ndarray:
+        block = self.blocks.get(key)
+        if block is None:
+            block = self.blocks[key] = self.load_block(key)
+        return block
+
+    def block_max(self, key: tuple[int, int]) -> int:
+        maximum = self.maxima.get(key)
+        if maximum is None:
+            maximum = self.maxima[key] = int(self.get_block(key).max())
+        return maximum
+
+    def load_block(self, key: tuple[int, int]) -> np.ndarray:
+        """ A block from the save file if it was edited, else from the disk cache,
+        generated and saved there on a miss. """
+        save_file = self.world.save_file
+        block = save_file.load_heights(key, self.block_size) if save_file is not None else None
+        if block is not None:
+            self.edited.add(key)
+            return block
+        disk_cache = self.world.disk_cache
+        block = disk_cache.load_heights(key) if disk_cache is not None else None
+        if block is None:
+            block = self.generate_block(key)
+            if disk_cache is not None:
+                disk_cache.save_heights(key, block)
+        return block
+
+    def generate_block(self, key: tuple[int, int]) -> np.ndarray:
+        world = self.world
+        # noise is sampled per point, so a block matches the same cells of a whole map sample
+        xs = np.arange(key[0] * self.block_size, (key[0] + 1) * self.block_size) * world.noise_scale
+        ys = np.arange(key[1] * self.block_size, (key[1] + 1) * self.block_size) * world.noise_scale
+        noise = world.simplex.noise2array(xs, ys)
+        return ((noise + 1) / 2 * world.max_elevation).astype(self.dtype)
+
+    def window(self, rect: pg.Rect) -> np.ndarray:
+        """ A copy of the elevations of a block of cells, shaped (rect.height, rect.width). """
+        size = self.block_size
+        heights = np.empty((rect.height, rect.width), dtype=self.dtype)
+        for by in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for bx in range(rect.left // size, (rect.right - 1) // size + 1):
+                part = rect.clip(bx * size, by * size, size, size)
+                heights[part.top - rect.top:part.bottom - rect.top, part.left - rect.left:part.right - rect.left] = \
+                    self.get_block((bx, by))[part.top - by * size:part.bottom - by * size, part.left - bx * size:part.right - bx * size]
+        return heights
+
+    def split(self, ys: np.ndarray, xs: np.ndarray):
+        """ (block key, block, mask, local ys, local xs) for every block the cells fall in. """
+        size = self.block_size
+        for key, mask in split_blocks(xs, ys, size):
+            yield key, self.get_block(key), mask, ys[mask] - key[1] * size, xs[mask] - key[0] * size
+
+    def __getitem__(self, index: tuple):
+        y, x = index
+        if np.isscalar(y) and np.isscalar(x):
+            size = self.block_size
+            return self.get_block((int(x) // size, int(y) // size))[int(y) % size, int(x) % size]
+        ys, xs = np.broadcast_arrays(np.asarray(y, dtype=np.intp), np.asarray(x, dtype=np.intp))
+        heights = np.empty(ys.shape, dtype=self.dtype)
+        for _, block, mask, local_ys, local_xs in self.split(ys.ravel(), xs.ravel()):
+            heights.reshape(-1)[mask] = block[local_ys, local_xs]
+        return heights
+
+    def __setitem__(self, index: tuple, values):
+        ys, xs = (np.atleast_1d(np.asarray(a, dtype=np.intp)) for a in index)
+        ys, xs = np.broadcast_arrays(ys, xs)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), ys.shape).ravel()
+        for key, block, mask, local_ys, local_xs in self.split(ys.ravel(), xs.ravel()):
+            block[local_ys, local_xs] = values[mask]
+            self.edited.add(key)
+            self.maxima.pop(key, None)
+
+    def unload(self, keep: set[tuple[int, int]]):
+        """ Drop generated blocks outside keep, edited ones stay. """
+        for key in [key for key in self.blocks if key not in keep and key not in self.edited]:
+            del self.blocks[key]
+            self.maxima.pop(key, None)
@@ -0,0 +1,454 @@
+import heapq
+import math
+
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.world.world import World
+
+from src.world.terrain import WaterType
+
+
+# the eight neighbors water can flow to, and the distance to each
+FLOW_STEPS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+FLOW_DISTANCES = [math.hypot(dx, dy) for dx, dy in FLOW_STEPS]
+
+
+def get_neighbors(i: int, height: int, width: int) -> list[int]:
+    """ Flat indices of the cells around flat index i of a height x width array. """
+    y, x = divmod(i, width)
+    if 0 < y < height - 1 and 0 < x < width - 1:
+        return [i + dy * width + dx for dx, dy in FLOW_STEPS]
+    return [(y + dy) * width + x + dx for dx, dy in FLOW_STEPS if 0 <= x + dx < width and 0 <= y + dy < height]
+
+
+def fill_depressions(heights: np.ndarray, epsilon: float) -> np.ndarray:
+    """ heights with every depression filled up to the level it spills over at, so water
+    from any cell can run downhill off the edge of the array. Filled areas and flats slope
+    towards their outlet by epsilon per cell, leaving every cell a lower neighbor.
+
+    Solved by priority-flood: the edge keeps its height, and the lowest cell reached so far
+    is taken off a heap to flood each neighbor not reached yet, up to epsilon above itself
+    but never below the ground. """
+    height, width = heights.shape
+    ground = heights.astype(np.float64)
+    edge = np.zeros((height + 2, width + 2), dtype=bool)
+    edge[1, 1:-1], edge[-2, 1:-1], edge[1:-1, 1], edge[1:-1, -2] = True, True, True, True
+    # padded with a ring of reached cells, so neighbors never need bounds checks
+    reached = np.pad(np.zeros(heights.shape, dtype=bool), 1, constant_values=True) | edge
+    levels = np.pad(ground, 1).ravel().tolist()
+    grounds = list(levels)
+    reached = bytearray(reached.tobytes())
+    offsets = [dy * (width + 2) + dx for dx, dy in FLOW_STEPS]
+    heap = [(levels[i], i) for i in np.flatnonzero(edge).tolist()]
+    heapq.heapify(heap)
+    while heap:
+        level, i = heapq.heappop(heap)
+        level += epsilon
+        for offset in offsets:
+            j = i + offset
+            if not reached[j]:
+                reached[j] = 1
+                levels[j] = neighbor = grounds[j] if grounds[j] > level else level
+                heapq.heappush(heap, (neighbor, j))
+    # copied out of the padding, so updates can edit it in place through flat views
+    return np.array(levels).reshape(height + 2, width + 2)[1:-1, 1:-1].copy()
+
+
+def refill_depressions(ground: np.ndarray, filled: np.ndarray, edited: np.ndarray, epsilon: float) -> np.ndarray:
+    """ Bring filled, what fill_depressions gave for an earlier ground, up to date in place
+    after the ground of the edited cells (flat indices) changed, returning the flat indices
+    of the cells whose filled height changed.
+
+    A cell is filled to its own ground or to epsilon above its lowest neighbors, whichever is
+    higher. So besides the edited cells, only the cells whose lowest neighbors all rise can
+    rise: these are flooded again from the cells around them. The flood carries on into any
+    other cell it brings lower, and stops where it does not, so the work follows what the
+    edit changes rather than the size of the array. """
+    height, width = ground.shape
+    levels, grounds = filled.reshape(-1), ground.reshape(-1)
+
+    def is_edge(i: int) -> bool:
+        y, x = divmod(i, width)
+        return not (0 < y < height - 1 and 0 < x < width - 1)
+
+    edited = edited.tolist()
+    # from the lowest up, so the lowest neighbors of a cell are settled before it is looked at
+    rising = {i for i in edited if grounds[i] > levels[i]}
+    heap = [(float(levels[i]), i) for i in rising]
+    heapq.heapify(heap)
+    while heap:
+        level, i = heapq.heappop(heap)
+        for j in get_neighbors(i, height, width):
+            if j in rising or is_edge(j):
+                continue
+            around = get_neighbors(j, height, width)
+            lowest = min(levels[k] for k in around)
+            if lowest == level and all(k in rising for k in around if levels[k] == lowest):
+                rising.add(j)
+                heapq.heappush(heap, (float(levels[j]), j))
+
+    # the edge keeps its ground, every other cell flooded again waits for its neighbors
+    flooded = rising.union(edited)
+    previous = {i: float(levels[i]) for i in flooded}
+    for i in flooded:
+        levels[i] = grounds[i] if is_edge(i) else np.inf
+    heap = [(float(levels[i]), i) for i in flooded if is_edge(i)]
+    heap += [(float(levels[j]), j) for i in flooded for j in get_neighbors(i, height, width) if j not in flooded]
+    heapq.heapify(heap)
+    while heap:
+        level, i = heapq.heappop(heap)
+        if level > levels[i]:
+            continue
+        level += epsilon
+        for j in get_neighbors(i, height, width):
+            if is_edge(j):
+                continue
+            neighbor = float(grounds[j]) if grounds[j] > level else level
+            if neighbor < levels[j]:
+                previous.setdefault(j, float(levels[j]))
+                levels[j] = neighbor
+                heapq.heappush(heap, (neighbor, j))
+    return np.array([i for i, level in previous.items() if levels[i] != level], dtype=np.intp)
+
+
+def flow_receivers(filled: np.ndarray) -> np.ndarray:
+    """ Flat index of the neighbor each cell drains to, the steepest way down (D8),
+    -1 for cells on the edge, where water leaves the array, and for pits. """
+    height, width = filled.shape
+    padded = np.pad(filled, 1, constant_values=np.inf)
+    indices = np.pad(np.arange(filled.size).reshape(filled.shape), 1, constant_values=-1)
+    steepest = np.zeros(filled.shape)
+    receivers = np.full(filled.shape, -1, dtype=np.int64)
+    for (dx, dy), distance in zip(FLOW_STEPS, FLOW_DISTANCES):
+        neighbors = (slice(1 + dy, height + 1 + dy), slice(1 + dx, width + 1 + dx))
+        slope = (filled - padded[neighbors]) / distance
+        steeper = slope > steepest
+        steepest[steeper] = slope[steeper]
+        receivers[steeper] = indices[neighbors][steeper]
+    receivers[0], receivers[-1], receivers[:, 0], receivers[:, -1] = -1, -1, -1, -1
+    return receivers.ravel()
+
+
+def flow_accumulation(receivers: np.ndarray) -> np.ndarray:
+    """ Number of cells draining through each cell, itself included.
+
+    Flow only runs downhill, so cells are settled front by front from the ridges:
+    a cell passes its total on once every cell draining into it has. """
+    accumulation = np.ones(receivers.size, dtype=np.int32)
+    draining = receivers >= 0
+    upstream = np.bincount(receivers[draining], minlength=receivers.size)
+    front = np.flatnonzero((upstream == 0) & draining)
+    while front.size:
+        targets = receivers[front]
+        np.add.at(accumulation, targets, accumulation[front])
+        np.subtract.at(upstream, targets, 1)
+        targets = np.unique(targets[upstream[targets] == 0])
+        front = targets[receivers[targets] >= 0]
+    return accumulation
+
+
+def update_receivers(filled: np.ndarray, receivers: np.ndarray, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Find the receivers of the flat cells again, as flow_receivers does, after their filled
+    heights or their neighbors' changed. Returns the cells whose receiver changed, and the
+    receivers they had. """
+    height, width = filled.shape
+    levels = filled.reshape(-1)
+    ys, xs = np.divmod(cells, width)
+    steepest = np.zeros(cells.size)
+    found = np.full(cells.size, -1, dtype=receivers.dtype)
+    for (dx, dy), distance in zip(FLOW_STEPS, FLOW_DISTANCES):
+        inside = (xs + dx >= 0) & (xs + dx < width) & (ys + dy >= 0) & (ys + dy < height)
+        neighbors = np.where(inside, cells + dy * width + dx, 0)
+        slope = (levels[cells] - np.where(inside, levels[neighbors], np.inf)) / distance
+        steeper = slope > steepest
+        steepest[steeper] = slope[steeper]
+        found[steeper] = neighbors[steeper]
+    found[(ys == 0) | (ys == height - 1) | (xs == 0) | (xs == width - 1)] = -1
+    moved = found != receivers[cells]
+    previous = receivers[cells[moved]]
+    receivers[cells[moved]] = found[moved]
+    return cells[moved], previous
+
+
+def update_accumulation(filled: np.ndarray, receivers: np.ndarray, accumulation: np.ndarray, moved: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """ Bring accumulation up to date in place after the moved cells (flat indices) changed
+    receivers from previous, returning the flat indices whose count was counted again:
+    every cell downstream of a moved cell, along its old run of receivers and its new one. """
+    height, width = filled.shape
+    old = dict(zip(moved.tolist(), previous.tolist()))
+    counted = set(old)
+    for follow in (lambda i: old.get(i, int(receivers[i])), lambda i: int(receivers[i])):
+        seen = set()
+        for i in old:
+            i = follow(i)
+            while i >= 0 and i not in seen:
+                seen.add(i)
+                i = follow(i)
+        counted |= seen
+    cells = np.fromiter(counted, dtype=np.intp, count=len(counted))
+    # receivers are always lower, so cells upstream are counted before the cells they drain to
+    levels = filled.reshape(-1)
+    for i in cells[np.argsort(-levels[cells], kind="stable")].tolist():
+        accumulation[i] = 1 + sum(int(accumulation[j]) for j in get_neighbors(i, height, width) if receivers[j] == i)
+    return cells
+
+
+def get_neighborhood(cells: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """ The flat cells and every cell next to them, once each. """
+    height, width = shape
+    ys, xs = np.divmod(cells, width)
+    around = [cells]
+    for dx, dy in FLOW_STEPS:
+        inside = (xs + dx >= 0) & (xs + dx < width) & (ys + dy >= 0) & (ys + dy < height)
+        around.append(cells[inside] + dy * width + dx)
+    return np.unique(np.concatenate(around))
+
+
+def flow_directions(receivers: np.ndarray, water: np.ndarray, cells: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """ Bits over FLOW_STEPS of the flat cells, towards the cell each drains to if it holds
+    water, and towards the neighbors holding water that drain into it. water is flat, and
+    holds stamp keys. """
+    height, width = shape
+    ys, xs = np.divmod(cells, width)
+    wet = water[cells] >> 8 != 0
+    directions = np.zeros(cells.size, dtype=np.uint16)
+    for step, (dx, dy) in enumerate(FLOW_STEPS):
+        inside = (xs + dx >= 0) & (xs + dx < width) & (ys + dy >= 0) & (ys + dy < height)
+        neighbors = np.where(inside, cells + dy * width + dx, 0)
+        joined = inside & ((wet & (receivers[cells] == neighbors)) | ((water[neighbors] >> 8 != 0) & (receivers[neighbors] == cells)))
+        directions[joined] |= 1 << step
+    return directions
+
+
+class WaterMap:
+    """ Water and water surface elevation of every cell of a region. water holds stamp
+    keys, the WaterType shifted up 8 bits over the FLOW_STEPS a river runs in. The ground,
+    filled heights and flow the water comes from are kept, to bring it up to date in place
+    after an edit. """
+    def __init__(self, region: pg.Rect, ground: np.ndarray, filled: np.ndarray, receivers: np.ndarray, accumulation: np.ndarray):
+        self.region = region
+        self.ground = ground
+        self.filled = filled
+        # flat indices, see flow_receivers
+        self.receivers = receivers
+        self.accumulation = accumulation
+        self.water = np.zeros(ground.shape, dtype=np.uint16)
+        self.level = ground.copy()
+
+    def cells(self, grid_rect: pg.Rect) -> tuple[slice, slice]:
+        """ Index of a block of cells inside the region into its arrays. """
+        top, left = grid_rect.top - self.region.top, grid_rect.left - self.region.left
+        return slice(top, top + grid_rect.height), slice(left, left + grid_rect.width)
+
+
+class Hydrology:
+    """ Rivers and lakes, from where rain falling on every cell would run.
+
+    Depressions fill up to their spill level and become lakes, and cells that
+    enough of the terrain drains through become rivers. Bounded worlds are solved
+    as a whole the first time a chunk needs its water, unbounded ones per chunk over
+    a window margin cells wider on every side, which lets flow cross the chunk's
+    edges. Chunks bake the water into their surfaces next to the shadows, from
+    stamps rasterized once per shape. """
+    def __init__(self, world: "World"):
+        self.world = world
+        self.tile_size = world.tile_size
+        self.cube_height = world.cube_height
+        # cells that have to drain through a cell before it shows as a river
+        self.river_cells = 100
+        # filled this far above the ground, a cell is under a lake
+        self.lake_depth = 0.5
+        self.epsilon = 1e-4
+        self.margin = world.chunk_size // 2
+        self.lake_color = (40, 100, 200, 170)
+        self.river_color = (60, 140, 230, 200)
+        # in cells
+        self.river_width = 0.4
+        # keyed by chunk in unbounded worlds, a single map under None in bounded ones
+        self.maps: dict[tuple[int, int] | None, WaterMap] = {}
+        # stamp images and their offsets from the tile position, by stamp key
+        self.stamps: dict[int, tuple[pg.Surface, tuple[int, int]]] = {}
+
+    def get_stamp(self, key: int) -> tuple[pg.Surface, tuple[int, int]]:
+        stamp = self.stamps.get(key)
+        if stamp is None:
+            stamp = self.stamps[key] = self.create_stamp(key)
+        return stamp
+
+    def create_stamp(self, key: int) -> tuple[pg.Surface, tuple[int, int]]:
+        """ A lake covers the top face, a river runs from the middle of it towards each of its directions. """
+        water_type, directions = divmod(key, 256)
+        if water_type == WaterType.LAKE:
+            polygons = [[(0, 0), (1, 0), (1, 1), (0, 1)]]
+            color = self.lake_color
+        else:
+            half = self.river_width / 2
+            polygons = [[(0.5 - half, 0.5 - half), (0.5 + half, 0.5 - half), (0.5 + half, 0.5 + half), (0.5 - half, 0.5 + half)]]
+            for step, (dx, dy) in enumerate(FLOW_STEPS):
+                if directions >> step & 1:
+                    # half a step out, widened across the step's direction
+                    normal_x, normal_y = -dy / FLOW_DISTANCES[step] * half, dx / FLOW_DISTANCES[step] * half
+                    end_x, end_y = 0.5 + dx / 2, 0.5 + dy / 2
+                    polygons.append([(0.5 + normal_x, 0.5 + normal_y), (end_x + normal_x, end_y + normal_y), (end_x - normal_x, end_y - normal_y), (0.5 - normal_x, 0.5 - normal_y)])
+            color = self.river_color
+        # cell space to the top face of a cube image
+        polygons = [[((u - v) * self.tile_size + self.tile_size, (u + v) * self.tile_size / 2) for u, v in polygon] for polygon in polygons]
+        points = [point for polygon in polygons for point in polygon]
+        left, top = math.floor(min(x for x, _ in points)), math.floor(min(y for _, y in points))
+        right, bottom = math.ceil(max(x for x, _ in points)), math.ceil(max(y for _, y in points))
+        stamp = pg.Surface((right - left + 1, bottom - top + 1), pg.SRCALPHA)
+        # pg.draw writes the color as is, so the overlapping parts of a river stay evenly translucent
+        for polygon in polygons:
+            pg.draw.polygon(stamp, color, [(x - left, y - top) for x, y in polygon])
+        return stamp, (left, top)
+
+    def get_key(self, chunk_id: tuple[int, int]) -> tuple[int, int] | None:
+        return None if self.world.bounds is not None else chunk_id
+
+    def get_region(self, key: tuple[int, int] | None) -> pg.Rect:
+        """ The cells solved together for a map key. """
+        if key is None:
+            return self.world.bounds
+        return self.world.get_chunk_cells(*key).inflate(self.margin * 2, self.margin * 2)
+
+    def get_reach(self, dirty: pg.Rect) -> pg.Rect:
+        """ Cells whose chunks solve water over windows including dirty, and whose water
+        update has not already reported. A bounded world's single map reports every change
+        from update, once it has been solved. """
+        if self.world.bounds is not None:
+            return dirty if None in self.maps else self.world.bounds
+        return dirty.inflate(self.margin * 2, self.margin * 2)
+
+    def get_water(self, chunk_id: tuple[int, int], grid_rect: pg.Rect) -> tuple[np.ndarray, np.ndarray]:
+        """ Water stamp keys and water surface elevations of a chunk's cells, shaped like grid_rect. """
+        key = self.get_key(chunk_id)
+        water_map = self.maps.get(key)
+        if water_map is None:
+            water_map = self.maps[key] = self.load(key)
+        cells = water_map.cells(grid_rect)
+        return water_map.water[cells], water_map.level[cells]
+
+    def is_solved(self, grid_rect: pg.Rect) -> bool:
+        """ Whether the water of every cell of grid_rect is loaded, so get_lakes would not solve any. """
+        size = self.world.chunk_size
+        return all(self.get_key((cx, cy)) in self.maps
+                   for cy in range(grid_rect.top // size, (grid_rect.bottom - 1) // size + 1)
+                   for cx in range(grid_rect.left // size, (grid_rect.right - 1) // size + 1))
+
+    def get_lakes(self, grid_rect: pg.Rect) -> np.ndarray:
+        """ Mask of the cells of grid_rect under a lake, shaped (grid_rect.height, grid_rect.width). """
+        lakes = np.zeros((grid_rect.height, grid_rect.width), dtype=bool)
+        size = self.world.chunk_size
+        for cy in range(grid_rect.top // size, (grid_rect.bottom - 1) // size + 1):
+            for cx in range(grid_rect.left // size, (grid_rect.right - 1) // size + 1):
+                part = self.world.get_chunk_cells(cx, cy).clip(grid_rect)
+                water, _ = self.get_water((cx, cy), part)
+                lakes[part.top - grid_rect.top:part.bottom - grid_rect.top, part.left - grid_rect.left:part.right - grid_rect.left] = water >> 8 == WaterType.LAKE
+        return lakes
+
+    def is_edited(self, region: pg.Rect) -> bool:
+        """ Whether any chunk with cells in region has had its terrain edited. """
+        size = self.world.chunk_size
+        return any((cx, cy) in self.world.edited_chunks
+                   for cy in range(region.top // size, (region.bottom - 1) // size + 1)
+                   for cx in range(region.left // size, (region.right - 1) // size + 1))
+
+    def load(self, key: tuple[int, int] | None) -> WaterMap:
+        """ The water of a map key, from the disk cache while none of the terrain it is solved
+        over has been edited, else solved, and cached for the next launch if still unedited. """
+        region = self.get_region(key)
+        disk_cache = self.world.disk_cache if not self.is_edited(region) else None
+        cached = disk_cache.load_water(key) if disk_cache is not None else None
+        if cached is not None:
+            filled, receivers = cached
+            return self.create_map(region, self.world.grid.window(region), filled, receivers)
+        water_map = self.solve(region)
+        if disk_cache is not None:
+            disk_cache.save_water(key, water_map.filled, water_map.receivers)
+        return water_map
+
+    def solve(self, region: pg.Rect) -> WaterMap:
+        heights = self.world.grid.window(region)
+        filled = fill_depressions(heights, self.epsilon)
+        return self.create_map(region, heights, filled, flow_receivers(filled).astype(np.int32))
+
+    def create_map(self, region: pg.Rect, heights: np.ndarray, filled: np.ndarray, receivers: np.ndarray) -> WaterMap:
+        """ Lakes and rivers from the filled heights of region and the cells they drain to. """
+        water_map = WaterMap(region, heights, filled, receivers, flow_accumulation(receivers))
+        cells = np.arange(heights.size)
+        self.trace(water_map, cells, cells)
+        return water_map
+
+    def trace(self, water_map: WaterMap, cells: np.ndarray, around: np.ndarray):
+        """ Water type and level of the flat cells, then the directions of the rivers among
+        the flat cells around, which have to include every cell next to them. """
+        ground, filled = water_map.ground.reshape(-1), water_map.filled.reshape(-1)
+        water, level = water_map.water.reshape(-1), water_map.level.reshape(-1)
+        lake = filled[cells] - ground[cells] > self.lake_depth
+        river = water_map.accumulation[cells] >= self.river_cells
+        water[cells] = np.where(lake, WaterType.LAKE, np.where(river, WaterType.RIVER, WaterType.NONE)).astype(np.uint16) << 8
+        # filled lakes only rise epsilons above their spill level
+        level[cells] = np.where(lake, np.rint(filled[cells]), ground[cells])
+        # rivers run towards the cell they drain to, and back towards the rivers and lakes draining into them
+        rivers = around[water[around] >> 8 == WaterType.RIVER]
+        water[rivers] = WaterType.RIVER << 8 | flow_directions(water_map.receivers, water, rivers, water_map.water.shape)
+
+    def update(self, dirty: pg.Rect) -> pg.Rect | None:
+        """ Bring the maps reaching the edited cells in dirty up to date, redoing only what
+        the edit changes downstream of it, returning the cells whose water changed, None if
+        none did. """
+        changed = None
+        for key, water_map in self.maps.items():
+            region = water_map.region
+            if not region.colliderect(dirty):
+                continue
+            area = dirty.clip(region)
+            cells = water_map.cells(area)
+            heights = self.world.grid.window(area)
+            ys, xs = np.nonzero(heights != water_map.ground[cells])
+            if not xs.size:
+                continue
+            water_map.ground[cells] = heights
+            shape = water_map.ground.shape
+            edited = (ys + area.top - region.top) * region.width + xs + area.left - region.left
+            refilled = refill_depressions(water_map.ground, water_map.filled, edited, self.epsilon)
+            moved, previous = update_receivers(water_map.filled, water_map.receivers, get_neighborhood(refilled, shape))
+            counted = update_accumulation(water_map.filled, water_map.receivers, water_map.accumulation, moved, previous)
+            traced = np.unique(np.concatenate((edited, refilled, moved, counted)))
+            around = get_neighborhood(traced, shape)
+            water, level = water_map.water.reshape(-1), water_map.level.reshape(-1)
+            old_water, old_level = water[around], level[around]
+            self.trace(water_map, traced, around)
+            differs = (water[around] != old_water) | ((level[around] != old_level) & (water[around] != 0))
+            ys, xs = np.divmod(around[differs], region.width)
+            xs, ys = xs + region.left, ys + region.top
+            # chunks only show the middle of their windows
+            shown = region if key is None else self.world.get_chunk_cells(*key)
+            inside = (xs >= shown.left) & (xs < shown.right) & (ys >= shown.top) & (ys < shown.bottom)
+            xs, ys = xs[inside], ys[inside]
+            if xs.size:
+                rect = pg.Rect(xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1)
+                changed = rect if changed is None else changed.union(rect)
+        return changed
+
+    def unload(self, keep):
+        """ Drop the maps of chunks not in keep. """
+        for key in [key for key in self.maps if key is not None and key not in keep]:
+            del self.maps[key]
+
+    def get_blits(self, water: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> list[tuple[pg.Surface, tuple[int, int]]]:
+        """ Surface.blits items for water with the given stamp keys on the top faces of tiles at (xs, ys). """
+        blits = []
+        for key, x, y in zip(water.tolist(), xs.tolist(), ys.tolist()):
+            stamp, (offset_x, offset_y) = self.get_stamp(key)
+            blits.append((stamp, (x + offset_x, y + offset_y)))
+        return blits
+
+    def draw(self, surface: pg.Surface, area: pg.Rect, water: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        """ Draw water onto the part of surface inside area. Tile positions are relative to surface. """
+        surface.set_clip(area)
+        surface.blits(self.get_blits(water, xs, ys), doreturn=False)
+        surface.set_clip(None)
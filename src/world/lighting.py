@@ -0,0 +1,213 @@
+import math
+import time
+
+import numpy as np
+import pygame as pg
+import pygame.gfxdraw as gfxdraw
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.world.tile_store import TileStore
+    from src.world.world import World
+
+from src.world.terrain import FACE_NO_LEFT, FACE_NO_RIGHT
+
+
+# the four cube image variants, see terrain.FACE_FULL
+FACE_CODES = 4
+# lightmaps are painted with every index its own color, so blits copy indices as they are,
+# and shown with the light palette; index 0 is unlit white, stamps are transparent where KEY
+INDEX_PALETTE = [(index, index, index) for index in range(256)]
+KEY = 255
+
+
+class Lighting:
+    """ Sunlight and terrain shadows from a sun that moves with the time of day.
+
+    A cell's exposure to the sun comes from its horizon: the steepest rise of the
+    terrain towards the sun, found by marching every cell of a window along the sun's
+    direction at once. Exposure is quantized to levels, and each (face_code, level)
+    has a light stamp, a cube image whose top, left and right faces hold the palette
+    indices of their light. Chunks paint the stamps of their cubes into 8 bit lightmaps,
+    white wherever no cube is drawn, and multiply them onto their baked pixels with
+    BLEND_RGBA_MULT.
+
+    Baked chunks never depend on the sun. Moving it recolors every lightmap at once
+    through the palette, and repaints the shadows a few chunks per frame until every
+    loaded chunk has caught up. """
+    def __init__(self, world: "World", hours: float = 10.0, day_length: float | None = None):
+        self.world = world
+        self.atlas = world.atlas
+        self.levels = 8
+        # horizon slopes over which a shadow edge fades out
+        self.softness = 0.15
+        # in cells, the longest shadow looked for
+        self.max_distance = 24
+        # cells of height per elevation, the slope Picker sees the grid at
+        self.elevation_scale = world.cube_height / world.tile_size
+        # grid-space direction the sun shines from at noon, lighting left faces the most
+        self.noon_azimuth = math.atan2(1, 0.4)
+        self.max_sun_elevation = math.radians(60)
+        self.day_ambient = np.array([0.5, 0.52, 0.58])
+        self.night_ambient = np.array([0.3, 0.32, 0.45])
+        self.noon_sun = np.array([0.62, 0.6, 0.54])
+        self.horizon_sun = np.array([0.7, 0.42, 0.24])
+        # real seconds per day, None keeps the sun where it is set
+        self.day_length = day_length
+        # in hours, the sun only moves in these steps so chunks are not relit every frame
+        self.time_step = 0.25
+        # seconds per frame spent relighting chunks, at least one chunk is relit per frame
+        self.relight_budget = 0.004
+        # bumped whenever the sun moves, chunks lit for an older one are relit
+        self.version = 0
+        # the version whose palette the chunks' lightmaps were last given
+        self.recolored_version = 0
+        # stamps painted into lightmaps, and the same on white for multiplying tile by tile, by stamp id
+        self.stamps, self.multiply_stamps = self.create_stamps()
+        self.clock = hours
+        self.set_time(hours)
+
+    def set_time(self, hours: float):
+        """ Place the sun for a time of day, rising at 6 and setting at 18. """
+        self.time = hours % 24
+        # 0 at sunrise, pi at sunset
+        angle = (self.time - 6) / 12 * math.pi
+        self.set_sun(self.noon_azimuth + angle - math.pi / 2, math.sin(angle) * self.max_sun_elevation)
+
+    def advance(self, dt: float):
+        """ Move the sun along by dt seconds of the day, a time_step at a time. """
+        if not self.day_length:
+            return
+        previous = self.clock
+        self.clock += dt * 24 / self.day_length
+        if math.floor(self.clock / self.time_step) != math.floor(previous / self.time_step):
+            self.set_time(math.floor(self.clock / self.time_step) * self.time_step)
+
+    def set_sun(self, azimuth: float, elevation: float):
+        """ Point the sun at azimuth, an angle in grid space, and elevation above the horizon, in radians. """
+        self.azimuth = azimuth
+        self.elevation = elevation
+        self.direction = (math.cos(azimuth), math.sin(azimuth))
+        self.tangent = math.tan(elevation) if elevation > 0 else 0.0
+        lights = [tuple(light) for light in self.get_face_lights().reshape(-1, 3).tolist()]
+        self.palette = [(255, 255, 255)] + lights + [(255, 255, 255)] * (255 - len(lights))
+        for stamp in self.multiply_stamps:
+            stamp.set_palette(self.palette)
+        self.version += 1
+
+    def get_face_lights(self) -> np.ndarray:
+        """ RGB light of the top, left and right faces at every exposure level, shaped (levels, 3, 3). """
+        height = max(math.sin(self.elevation), 0.0)
+        # the sky brightens and the sun whitens as it climbs
+        daylight = min(height / math.sin(math.radians(20)), 1.0)
+        ambient = self.night_ambient + (self.day_ambient - self.night_ambient) * daylight
+        sun = (self.horizon_sun + (self.noon_sun - self.horizon_sun) * daylight) * min(height * 8, 1.0)
+        across = math.cos(self.elevation)
+        # left faces look along +y, right faces along +x
+        lambert = np.array([height, max(self.direction[1], 0) * across, max(self.direction[0], 0) * across])
+        exposure = np.linspace(0, 1, self.levels)
+        lights = ambient + sun * lambert[None, :, None] * exposure[:, None, None]
+        return np.rint(np.clip(lights, 0, 1) * 255).astype(np.uint8)
+
+    def create_stamps(self) -> tuple[list[pg.Surface], list[pg.Surface]]:
+        """ Stamps of every face_code and level, each face painted with the palette index of its
+        light. They never change, moving the sun only changes the colors of the indices. """
+        top_points, left_points, right_points = self.atlas.get_cube_points()
+        top_size, side_size = (self.atlas.tile_size * 2, self.atlas.tile_size), (self.atlas.tile_size, self.atlas.cube_height)
+        stamps, multiply_stamps = [], []
+        for face_code in range(FACE_CODES):
+            for level in range(self.levels):
+                faces = [(top_points, top_size, 0)]
+                if not face_code & FACE_NO_LEFT:
+                    faces.append((left_points, side_size, 1))
+                if not face_code & FACE_NO_RIGHT:
+                    faces.append((right_points, side_size, 2))
+                image = pg.Surface(self.atlas.cell_size, pg.SRCALPHA)
+                for points, size, face in faces:
+                    # textured like the atlas cubes, so the stamps cover exactly their pixels
+                    texture = pg.Surface(size, pg.SRCALPHA)
+                    texture.fill((*INDEX_PALETTE[1 + level * 3 + face], 255))
+                    gfxdraw.textured_polygon(image, points, texture, 0, 0)
+                # written as indices, blitting 32 bit images onto 8 bit surfaces does not keep them
+                indices = np.where(pg.surfarray.array_alpha(image) > 0, pg.surfarray.array_red(image), KEY)
+                stamp = self.create_lightmap(self.atlas.cell_size)
+                pg.surfarray.blit_array(stamp, indices.astype(np.uint8))
+                stamp.set_colorkey(KEY)
+                stamps.append(stamp)
+                multiply_stamp = self.create_lightmap(self.atlas.cell_size)
+                multiply_stamp.fill(0)
+                multiply_stamp.blit(stamp, (0, 0))
+                multiply_stamps.append(multiply_stamp)
+        return stamps, multiply_stamps
+
+    def create_lightmap(self, size: tuple[int, int]) -> pg.Surface:
+        lightmap = pg.Surface(size, depth=8)
+        lightmap.set_palette(INDEX_PALETTE)
+        return lightmap
+
+    def get_exposure(self, grid_rect: pg.Rect) -> np.ndarray:
+        """ How much sun each cell of grid_rect gets, from 0 in shadow to 1. """
+        if self.tangent <= 0:
+            return np.zeros((grid_rect.height, grid_rect.width))
+        world = self.world
+        distance = min(self.max_distance, math.ceil(world.max_elevation * self.elevation_scale / self.tangent))
+        # cells off a bounded world cast nothing
+        heights = np.full((grid_rect.height + distance * 2, grid_rect.width + distance * 2), -np.inf)
+        window = world.clip_cells(grid_rect.inflate(distance * 2, distance * 2))
+        top, left = window.top - grid_rect.top + distance, window.left - grid_rect.left + distance
+        heights[top:top + window.height, left:left + window.width] = world.grid.window(window) * self.elevation_scale
+        ground = heights[distance:distance + grid_rect.height, distance:distance + grid_rect.width]
+
+        horizon = np.full(ground.shape, -np.inf)
+        for step in range(1, distance + 1):
+            dx, dy = round(step * self.direction[0]), round(step * self.direction[1])
+            if not dx and not dy:
+                continue
+            ahead = heights[distance + dy:distance + dy + grid_rect.height, distance + dx:distance + dx + grid_rect.width]
+            np.maximum(horizon, (ahead - ground) / math.hypot(dx, dy), out=horizon)
+        return np.clip((self.tangent - horizon) / self.softness + 0.5, 0, 1)
+
+    def get_stamp_ids(self, tiles: "TileStore", grid_rect: pg.Rect) -> np.ndarray:
+        """ Light stamp of every cube of tiles, which cover grid_rect. Buried cubes are lit like their column. """
+        levels = np.rint(self.get_exposure(grid_rect) * (self.levels - 1)).astype(np.uint16)
+        return tiles.face_code * self.levels + levels[tiles.y - grid_rect.top, tiles.x - grid_rect.left]
+
+    def get_blits(self, stamp_ids: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> list:
+        """ Surface.blits items multiplying the light of cubes at (xs, ys) onto what was drawn there. """
+        stamps = self.multiply_stamps
+        return [(stamps[stamp_id], (x, y), None, pg.BLEND_RGBA_MULT) for stamp_id, x, y in zip(stamp_ids.tolist(), xs.tolist(), ys.tolist())]
+
+    def draw(self, lightmap: pg.Surface, area: pg.Rect, stamp_ids: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        """ Paint the part of a lightmap inside area with the light of cubes at (xs, ys), in drawing order. """
+        # read once, a bake on the pool may run while the sun moves
+        stamps, palette = self.stamps, self.palette
+        lightmap.set_palette(INDEX_PALETTE)
+        lightmap.fill(0, area)
+        lightmap.set_clip(area)
+        lightmap.blits([(stamps[stamp_id], (x, y)) for stamp_id, x, y in zip(stamp_ids.tolist(), xs.tolist(), ys.tolist())], doreturn=False)
+        lightmap.set_clip(None)
+        lightmap.set_palette(palette)
+
+    def invalidate(self, cells: pg.Rect):
+        """ Relight the chunks whose shadows an edit to cells can change. """
+        reach = cells.inflate(self.max_distance * 2, self.max_distance * 2)
+        for chunk in self.world.chunks.values():
+            if chunk.grid_rect.colliderect(reach):
+                chunk.light_version = -1
+
+    def update(self, view: pg.Rect):
+        """ Recolor every lightmap for the sun's current position, then repaint the shadows of chunks lit
+        for an older one, the ones overlapping view first, until relight_budget runs out. """
+        if self.recolored_version != self.version:
+            for chunk in self.world.chunks.values():
+                chunk.recolor_light(self.palette)
+            self.recolored_version = self.version
+        stale = [chunk for chunk in self.world.chunks.values() if chunk.light_version != self.version]
+        if not stale:
+            return
+        stale.sort(key=lambda chunk: not chunk.rect.colliderect(view))
+        deadline = time.perf_counter() + self.relight_budget
+        for chunk in stale:
+            chunk.relight()
+            if time.perf_counter() > deadline:
+                break
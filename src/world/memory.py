@@ -0,0 +1,150 @@
+import gc
+import tracemalloc
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.world.world import World
+
+from src.world.chunk import Chunk
+from src.world.chunk_cache import surface_bytes
+from src.world.tile import Tile
+
+
+def array_bytes(*objects) -> int:
+    """ Bytes of the numpy arrays objects hold as attributes. """
+    return sum(value.nbytes for obj in objects for value in vars(obj).values() if isinstance(value, np.ndarray))
+
+
+def get_cache_kind(key) -> str:
+    """ What a chunk cache entry holds, "surface" for the baked surface keyed by its chunk_id,
+    else the kind named after the chunk_id in its key, like "overlay" or "lod". """
+    return key[1] if isinstance(key[0], tuple) else "surface"
+
+
+def get_shared_surface_bytes(world: "World") -> dict[str, int]:
+    """ Pixel memory of the surfaces every chunk shares, by category. """
+    atlas = world.atlas
+    surfaces = {
+        "atlas": surface_bytes([atlas.surface, *(face for faces in atlas.faces.values() for face in faces)]),
+        "shadow stamps": surface_bytes([stamp for stamp in world.shadows.stamps if stamp is not None]),
+        "water stamps": surface_bytes([stamp for stamp, _ in world.hydrology.stamps.values()]),
+        "agent sprites": surface_bytes(world.agent_sprites.surface),
+        "textures": surface_bytes([world.mask_tex, world.player_tex]),
+        "screen": surface_bytes(world.app.screen),
+    }
+    if world.lighting is not None:
+        surfaces["light stamps"] = surface_bytes(world.lighting.stamps + world.lighting.multiply_stamps)
+    return surfaces
+
+
+def get_array_bytes(world: "World") -> dict[str, int]:
+    """ Memory of the world's numpy arrays, by category. """
+    arrays = {
+        "heightmap": sum(block.nbytes for block in world.grid.blocks.values()),
+        "tiles": sum(array_bytes(chunk, chunk.tiles) for chunk in world.chunks.values()),
+        "water": sum(array_bytes(water_map) for water_map in world.hydrology.maps.values()),
+        "step costs": sum(costs.nbytes for costs in world.navigation.costs.values()),
+        "agents": array_bytes(world.agents),
+    }
+    if world.save_file is not None:
+        arrays["save index"] = world.save_file.index.nbytes
+    return arrays
+
+
+class MemoryReport:
+    """ Where a world's memory goes, at the time the report is made.
+
+    Surface pixels are allocated by SDL, out of tracemalloc's sight, so surfaces are
+    counted by their size: the chunk cache's by kind of entry, then the ones shared by
+    every chunk. Arrays are counted by nbytes, and live objects by walking the objects
+    the garbage collector tracks. When the world was built under tracemalloc, the
+    snapshots it took between build phases are compared, listing the top allocation
+    sites of each phase. """
+    def __init__(self, world: "World", top: int = 5):
+        self.surfaces: dict[str, int] = {}
+        for key, value in world.chunk_cache.surfaces.items():
+            kind = f"chunk {get_cache_kind(key)}"
+            self.surfaces[kind] = self.surfaces.get(kind, 0) + surface_bytes(value)
+        self.surfaces.update(get_shared_surface_bytes(world))
+        self.arrays = get_array_bytes(world)
+        chunks = list(world.chunks.values())
+        live = {Chunk: 0, Tile: 0}
+        for obj in gc.get_objects():
+            if type(obj) in live:
+                live[type(obj)] += 1
+        self.objects = {
+            "loaded chunks": len(chunks),
+            "live Chunk objects": live[Chunk],
+            "live Tile objects": live[Tile],
+            "stored tiles": sum(len(chunk.tiles) for chunk in chunks),
+            "heightmap blocks": len(world.grid),
+            "agents": len(world.agents),
+        }
+        cache = world.chunk_cache
+        self.cache = {
+            "bytes_used": cache.bytes_used,
+            "budget": cache.budget,
+            "entries": len(cache),
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "evictions": cache.evictions,
+        }
+        self.memory_budget = world.memory_budget
+        self.phases = self.compare_snapshots(world.memory_snapshots, top)
+
+    @property
+    def total(self) -> int:
+        """ Bytes of every surface and array counted, what a memory budget is held to. """
+        return sum(self.surfaces.values()) + sum(self.arrays.values())
+
+    @staticmethod
+    def compare_snapshots(snapshots: list[tuple[str, tracemalloc.Snapshot]], top: int) -> list[dict]:
+        """ Traced bytes after each phase, and the allocation sites that grew the most during it. """
+        # tracemalloc's own bookkeeping is not the world's
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>")]
+        phases = []
+        previous = None
+        for phase, snapshot in snapshots:
+            snapshot = snapshot.filter_traces(filters)
+            if previous is not None:
+                growth = [stat for stat in snapshot.compare_to(previous, "lineno") if stat.size_diff > 0][:top]
+                phases.append({
+                    "phase": phase,
+                    "traced_bytes": sum(stat.size for stat in snapshot.statistics("filename")),
+                    "growth": [{"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size_diff} for stat in growth],
+                })
+            previous = snapshot
+        return phases
+
+    def to_dict(self) -> dict:
+        return {
+            "surfaces": self.surfaces,
+            "arrays": self.arrays,
+            "objects": self.objects,
+            "chunk_cache": self.cache,
+            "total_bytes": self.total,
+            "memory_budget": self.memory_budget,
+            "phases": self.phases,
+        }
+
+    def lines(self) -> list[str]:
+        """ The report as text, sizes in MB, and the growth of allocation sites in KB. """
+        megabyte = 1024 ** 2
+        lines = ["surfaces"]
+        lines += [f"  {name:<20}{size / megabyte:>10.1f}" for name, size in sorted(self.surfaces.items(), key=lambda item: -item[1])]
+        lines.append("arrays")
+        lines += [f"  {name:<20}{size / megabyte:>10.1f}" for name, size in sorted(self.arrays.items(), key=lambda item: -item[1])]
+        budget = f" of {self.memory_budget / megabyte:.1f}" if self.memory_budget is not None else ""
+        lines.append(f"total {self.total / megabyte:.1f} MB{budget}")
+        lines.append("objects")
+        lines += [f"  {name:<20}{count:>10}" for name, count in self.objects.items()]
+        cache = self.cache
+        cache_budget = f" of {cache['budget'] / megabyte:.1f}" if cache["budget"] is not None else ""
+        lines.append(f"chunk cache {cache['bytes_used'] / megabyte:.1f} MB{cache_budget} in {cache['entries']} entries, "
+                     f"{cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions")
+        for phase in self.phases:
+            lines.append(f"after {phase['phase']}: {phase['traced_bytes'] / megabyte:.1f} MB traced")
+            lines += [f"  {growth['bytes'] / 1024:>+10.1f}  {growth['where']}" for growth in phase["growth"]]
+        return lines
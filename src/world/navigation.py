@@ -0,0 +1,267 @@
+import time
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING, Generator
+if TYPE_CHECKING:
+    from src.world.world import World
+
+from src.world.spatial import SpatialGrid
+from src.world.heightmap import split_blocks
+
+
+# grid steps an agent can take, indexing the first axis of step cost arrays
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def step_costs(grid: np.ndarray, max_climb: int, climb_cost: float, blocked: np.ndarray) -> np.ndarray:
+    """ Cost of stepping from each cell in each of STEPS, inf where the height difference
+    is more than max_climb, the step leaves the grid or lands on a blocked cell. """
+    height, width = grid.shape
+    costs = np.full((len(STEPS), height, width), np.inf, dtype=np.float32)
+    for step, (dx, dy) in enumerate(STEPS):
+        source = (slice(max(-dy, 0), height - max(dy, 0)), slice(max(-dx, 0), width - max(dx, 0)))
+        target = (slice(max(dy, 0), height - max(-dy, 0)), slice(max(dx, 0), width - max(-dx, 0)))
+        climb = np.abs(grid[target].astype(np.int32) - grid[source])
+        costs[step][source] = np.where((climb <= max_climb) & ~blocked[target], 1 + climb * climb_cost, np.inf)
+    return costs
+
+
+class PathRequest:
+    """ A queued path query. path stays None until done, and when no path exists. """
+    def __init__(self, start: tuple[int, int], goal: tuple[int, int]):
+        self.start = start
+        self.goal = goal
+        self.path: list[tuple[int, int]] | None = None
+        self.done = False
+        self.search: Generator | None = None
+        self.version = -1
+
+
+class Navigation:
+    """ Walkability and step costs over the heightmap, with A* path queries. Cliffs higher
+    than max_climb and lakes are not walkable, rivers are waded through.
+
+    Step costs are kept per block of chunk_size cells, keyed like the heightmap's
+    blocks, computed when first searched and dropped by edits and unloading. Blocks
+    searched before their water is solved take it for dry land rather than solve it
+    then, and are computed again once it is.
+    Found paths are cached and indexed by the cells they cross, so terrain edits
+    only drop the paths running through the edited area. Queued requests are
+    searched search_step nodes at a time within a per frame time budget, so
+    long searches spread over several frames instead of stalling one. """
+    def __init__(self, world: "World", max_climb: int = 1, climb_cost: float = 0.5, budget: float = 0.002, max_paths: int = 1024):
+        self.world = world
+        self.max_climb = max_climb
+        self.climb_cost = climb_cost
+        # seconds of searching process() may spend per call
+        self.budget = budget
+        self.max_paths = max_paths
+        # nodes expanded between checks of the time budget
+        self.search_step = 128
+        # searches give up after max_nodes expanded nodes, an unbounded world never runs out of cells
+        self.max_nodes = 65536
+        self.block_size = world.chunk_size
+        self.costs: dict[tuple[int, int], np.ndarray] = {}
+        # blocks whose costs were computed without the lakes of cells not solved for water yet
+        self.dry: set[tuple[int, int]] = set()
+        self.paths: OrderedDict[tuple[tuple[int, int], tuple[int, int]], list[tuple[int, int]]] = OrderedDict()
+        self.path_index = SpatialGrid(16, 16)
+        # failed queries are only cached until the next edit, which may connect them
+        self.unreachable: set[tuple[tuple[int, int], tuple[int, int]]] = set()
+        self.queue: deque[PathRequest] = deque()
+        # bumped on every edit, searches started before it are restarted
+        self.version = 0
+        self.searched_nodes = 0
+
+    def in_bounds(self, cell: tuple[int, int]) -> bool:
+        return self.world.in_bounds(*cell)
+
+    def get_costs(self, key: tuple[int, int]) -> np.ndarray:
+        """ Step costs of the cells of one block, shaped (len(STEPS), block_size, block_size). """
+        costs = self.costs.get(key)
+        if costs is None:
+            size = self.block_size
+            block = pg.Rect(key[0] * size, key[1] * size, size, size)
+            # costs only look one cell away, so a one cell apron makes the block exact
+            window = self.world.clip_cells(block.inflate(2, 2))
+            cells = self.world.clip_cells(block)
+            hydrology = self.world.hydrology
+            if hydrology.is_solved(window):
+                lakes = hydrology.get_lakes(window)
+            else:
+                lakes = np.zeros((window.height, window.width), dtype=bool)
+                self.dry.add(key)
+            window_costs = step_costs(self.world.grid.window(window), self.max_climb, self.climb_cost, lakes)
+            # cells off a bounded world stay inf
+            costs = self.costs[key] = np.full((len(STEPS), size, size), np.inf, dtype=np.float32)
+            costs[:, cells.top - block.top:cells.bottom - block.top, cells.left - block.left:cells.right - block.left] = \
+                window_costs[:, cells.top - window.top:cells.bottom - window.top, cells.left - window.left:cells.right - window.left]
+        return costs
+
+    def costs_at(self, steps: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ Cost of taking each of steps, indices into STEPS, from the cells (xs, ys). """
+        size = self.block_size
+        costs = np.empty(steps.shape, dtype=np.float32)
+        for (bx, by), in_block in split_blocks(xs, ys, size):
+            costs[in_block] = self.get_costs((bx, by))[steps[in_block], ys[in_block] - by * size, xs[in_block] - bx * size]
+        return costs
+
+    def can_step(self, cell: tuple[int, int], target: tuple[int, int]) -> bool:
+        step = (target[0] - cell[0], target[1] - cell[1])
+        if step not in STEPS or not self.in_bounds(cell):
+            return False
+        size = self.block_size
+        costs = self.get_costs((cell[0] // size, cell[1] // size))
+        return bool(np.isfinite(costs[STEPS.index(step), cell[1] % size, cell[0] % size]))
+
+    def unload(self, keep: set[tuple[int, int]]):
+        """ Drop the step costs of blocks outside keep, they are recomputed when searched again. """
+        for key in [key for key in self.costs if key not in keep]:
+            del self.costs[key]
+            self.dry.discard(key)
+
+    def update(self, dirty: pg.Rect):
+        """ Drop step costs of the blocks holding dirty cells and cached paths through them.
+        dirty has to cover the cells whose water the edit changed, as well as their heights. """
+        size = self.block_size
+        for by in range(dirty.top // size, (dirty.bottom - 1) // size + 1):
+            for bx in range(dirty.left // size, (dirty.right - 1) // size + 1):
+                self.costs.pop((bx, by), None)
+                self.dry.discard((bx, by))
+
+        for key in self.path_index.query(dirty):
+            if any(dirty.collidepoint(cell) for cell in self.paths[key]):
+                self.forget(key)
+        self.unreachable.clear()
+        self.version += 1
+
+    def refresh_dry(self):
+        """ Compute the costs of dry blocks again once their water is solved, dropping the paths through them. """
+        size = self.block_size
+        for key in list(self.dry):
+            block = pg.Rect(key[0] * size, key[1] * size, size, size)
+            if self.world.hydrology.is_solved(self.world.clip_cells(block.inflate(2, 2))):
+                self.update(block)
+
+    def forget(self, key: tuple[tuple[int, int], tuple[int, int]]):
+        del self.paths[key]
+        self.path_index.remove(key)
+
+    def remember(self, key: tuple[tuple[int, int], tuple[int, int]], path: list[tuple[int, int]] | None):
+        if path is None:
+            self.unreachable.add(key)
+            return
+        if key in self.paths:
+            self.forget(key)
+        self.paths[key] = path
+        xs, ys = [x for x, _ in path], [y for _, y in path]
+        self.path_index.insert(key, pg.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1))
+        while len(self.paths) > self.max_paths:
+            self.forget(next(iter(self.paths)))
+
+    def cached(self, start: tuple[int, int], goal: tuple[int, int]) -> tuple[bool, list[tuple[int, int]] | None]:
+        key = (start, goal)
+        if key in self.paths:
+            self.paths.move_to_end(key)
+            return True, self.paths[key]
+        return key in self.unreachable, None
+
+    def find_path(self, start: tuple[int, int], goal: tuple[int, int]) -> list[tuple[int, int]] | None:
+        """ Cells from start to goal, both included, searched right away. None if goal is unreachable. """
+        found, path = self.cached(start, goal)
+        if found:
+            return path
+        search = self.search(start, goal)
+        try:
+            while True:
+                next(search)
+        except StopIteration as result:
+            path = result.value
+        self.remember((start, goal), path)
+        return path
+
+    def request(self, start: tuple[int, int], goal: tuple[int, int]) -> PathRequest:
+        """ Queue a path query for process(), answered at once when the path is cached. """
+        request = PathRequest(start, goal)
+        found, request.path = self.cached(start, goal)
+        if found:
+            request.done = True
+        else:
+            self.queue.append(request)
+        return request
+
+    def process(self) -> int:
+        """ Advance queued searches until the time budget runs out, returns how many finished. """
+        deadline = time.perf_counter() + self.budget
+        finished = 0
+        self.refresh_dry()
+        while self.queue and time.perf_counter() < deadline:
+            request = self.queue[0]
+            # an edit since the search started may have changed its costs
+            if request.version != self.version:
+                found, request.path = self.cached(request.start, request.goal)
+                if found:
+                    request.done = True
+                    self.queue.popleft()
+                    finished += 1
+                    continue
+                request.search = self.search(request.start, request.goal)
+                request.version = self.version
+            try:
+                next(request.search)
+            except StopIteration as result:
+                request.path = result.value
+                request.done = True
+                self.remember((request.start, request.goal), request.path)
+                self.queue.popleft()
+                finished += 1
+        return finished
+
+    def search(self, start: tuple[int, int], goal: tuple[int, int]) -> Generator[None, None, list[tuple[int, int]] | None]:
+        """ A* over the step costs, yielding every search_step expanded nodes. """
+        if not (self.in_bounds(start) and self.in_bounds(goal)):
+            return None
+        size = self.block_size
+        block, costs = None, None
+        goal_x, goal_y = goal
+        # every step costs at least 1, so the manhattan distance never overestimates
+        open_cells = [(abs(goal_x - start[0]) + abs(goal_y - start[1]), 0.0, start)]
+        came_from: dict[tuple[int, int], tuple[int, int] | None] = {start: None}
+        best = {start: 0.0}
+        expanded = 0
+        while open_cells:
+            _, cost, cell = heappop(open_cells)
+            if cell == goal:
+                path = []
+                while cell is not None:
+                    path.append(cell)
+                    cell = came_from[cell]
+                return path[::-1]
+            if cost > best[cell]:
+                continue
+            x, y = cell
+            if (x // size, y // size) != block:
+                block = (x // size, y // size)
+                costs = self.get_costs(block)
+            local_x, local_y = x % size, y % size
+            for step, (dx, dy) in enumerate(STEPS):
+                step_cost = costs.item(step, local_y, local_x)
+                if step_cost == np.inf:
+                    continue
+                neighbor = (x + dx, y + dy)
+                neighbor_cost = cost + step_cost
+                if neighbor_cost < best.get(neighbor, np.inf):
+                    best[neighbor] = neighbor_cost
+                    came_from[neighbor] = cell
+                    heappush(open_cells, (neighbor_cost + abs(goal_x - neighbor[0]) + abs(goal_y - neighbor[1]), neighbor_cost, neighbor))
+            expanded += 1
+            self.searched_nodes += 1
+            if expanded >= self.max_nodes:
+                return None
+            if expanded % self.search_step == 0:
+                yield
+        return None
@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.core.camera import Camera
+    from src.world.world import World
+
+from src.world.heightmap import split_blocks
+
+
+class Picker:
+    """ Screen to grid queries, the inverse of the isometric placement of cubes.
+
+    A screen pixel looks down a line through the grid: raising a point by one
+    elevation moves it cube_height / tile_size cells further along both x and y.
+    The cube drawn at the pixel is the first one that line meets coming down from
+    the top, so picking walks it cell by cell from the highest elevation of the
+    heightmap blocks it crosses, and stops at the first column tall enough. """
+    def __init__(self, world: "World"):
+        self.world = world
+        self.tile_size = world.tile_size
+        # cells moved along x and y per elevation
+        self.slope = world.cube_height / world.tile_size
+
+    def to_world(self, camera: "Camera", point: tuple[int, int]) -> tuple[int, int]:
+        """ The world pixel under a screen point. """
+        return (point[0] - int(camera.offset_x)) << camera.lod, (point[1] - int(camera.offset_y)) << camera.lod
+
+    def pick(self, camera: "Camera", point: tuple[int, int]) -> tuple[int, int, int] | None:
+        """ (x, y, elevation) of the cube drawn at a screen point, None over empty space. """
+        world_x, world_y = self.to_world(camera, point)
+        xs, ys, elevations, hit = self.pick_points(np.array([world_x]), np.array([world_y]))
+        if not hit[0]:
+            return None
+        return int(xs[0]), int(ys[0]), int(elevations[0])
+
+    def pick_points(self, world_xs: np.ndarray, world_ys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Cell x, y and elevation of the cube drawn at each world pixel, and whether there is one. """
+        tile_size, slope = self.tile_size, self.slope
+        # the cell under each pixel at elevation t is (floor(a + slope * t), floor(b + slope * t))
+        u = (world_xs - tile_size) / tile_size
+        v = (world_ys - tile_size / 2) / (tile_size / 2)
+        a = (u + v) / 2 + 0.5
+        b = (v - u) / 2 + 0.5
+
+        t = self.get_top(a, b)
+        cell_xs = np.floor(a + slope * t).astype(np.int64)
+        cell_ys = np.floor(b + slope * t).astype(np.int64)
+        elevations = np.full(t.shape, -1, dtype=np.int64)
+        hit = np.zeros(t.shape, dtype=bool)
+        active = np.arange(t.size)
+        while active.size:
+            xs, ys = cell_xs[active], cell_ys[active]
+            # the line leaves the cell going down where it crosses its lower x or y edge
+            t_x = (xs - a[active]) / slope
+            t_y = (ys - b[active]) / slope
+            t_low = np.maximum(t_x, t_y)
+            heights = self.get_heights(xs, ys)
+            hits = (heights >= t_low) & (heights >= 0)
+            # a column taller than where the line enters shows that cube's side, else its top
+            elevations[active[hits]] = np.minimum(heights[hits], np.ceil(t[active[hits]]))
+            hit[active[hits]] = True
+
+            misses = ~hits
+            t[active[misses]] = t_low[misses]
+            cell_xs[active[misses]] -= t_x[misses] >= t_y[misses]
+            cell_ys[active[misses]] -= t_y[misses] >= t_x[misses]
+            # below the bottom cubes, the line only passes cells off the world
+            active = active[misses & (t_low > -1)]
+        return cell_xs, cell_ys, elevations, hit
+
+    def get_top(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """ Elevation to start each line at: the highest elevation of the heightmap blocks the line
+        crosses on its way from max_elevation down to the bottom cubes, nothing above it can be hit. """
+        world = self.world
+        size = world.grid.block_size
+        low_xs, low_ys = np.floor(a - self.slope).astype(np.int64), np.floor(b - self.slope).astype(np.int64)
+        high_xs = np.floor(a + self.slope * world.max_elevation).astype(np.int64)
+        high_ys = np.floor(b + self.slope * world.max_elevation).astype(np.int64)
+        if world.bounds is not None:
+            # clamped, the corners span the part of the line's bounding box inside the world
+            low_xs, high_xs = (np.clip(xs, world.bounds.left, world.bounds.right - 1) for xs in (low_xs, high_xs))
+            low_ys, high_ys = (np.clip(ys, world.bounds.top, world.bounds.bottom - 1) for ys in (low_ys, high_ys))
+        top = np.zeros(a.shape, dtype=np.float64)
+        # the line moves along x and y together, so it crosses at most the 2x2 blocks between its ends
+        for xs, ys in ((low_xs, low_ys), (high_xs, low_ys), (low_xs, high_ys), (high_xs, high_ys)):
+            for key, mask in split_blocks(xs, ys, size):
+                top[mask] = np.maximum(top[mask], world.grid.block_max(key))
+        return np.minimum(top, world.max_elevation)
+
+    def get_heights(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ Elevations of cells, -1 for cells off a bounded world. """
+        inside = self.in_bounds(xs, ys)
+        heights = np.full(xs.shape, -1, dtype=np.int64)
+        if inside.any():
+            heights[inside] = self.world.grid[ys[inside], xs[inside]]
+        return heights
+
+    def in_bounds(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        bounds = self.world.bounds
+        if bounds is None:
+            return np.ones(xs.shape, dtype=bool)
+        return (xs >= bounds.left) & (xs < bounds.right) & (ys >= bounds.top) & (ys < bounds.bottom)
+
+    def pick_area(self, camera: "Camera", rect: pg.Rect, visible_only: bool = True) -> np.ndarray:
+        """ (x, y, elevation) rows of the cells whose top face center lies in a screen rect,
+        for drag selections. visible_only leaves out cells whose center is hidden behind others. """
+        tile_size, cube_height = self.tile_size, self.world.cube_height
+        left, top = self.to_world(camera, rect.topleft)
+        right, bottom = self.to_world(camera, rect.bottomright)
+        # top face centers sit at ((x - y + 1) * tile_size, (x + y + 1) * tile_size / 2 - elevation * cube_height)
+        diagonals = np.arange(math.ceil(left / tile_size) - 1, math.ceil(right / tile_size) - 1)
+        rows = np.arange(math.ceil(top * 2 / tile_size) - 1, math.ceil((bottom + self.world.max_elevation * cube_height) * 2 / tile_size) - 1)
+        diagonals, rows = (grid.ravel() for grid in np.meshgrid(diagonals, rows))
+        even = (diagonals + rows) % 2 == 0
+        diagonals, rows = diagonals[even], rows[even]
+        xs, ys = (rows + diagonals) // 2, (rows - diagonals) // 2
+
+        elevations = self.get_heights(xs, ys)
+        center_xs = (diagonals + 1) * tile_size
+        center_ys = (rows + 1) * tile_size // 2 - elevations * cube_height
+        inside = (elevations >= 0) & (center_ys >= top) & (center_ys < bottom)
+        xs, ys, elevations, center_xs, center_ys = xs[inside], ys[inside], elevations[inside], center_xs[inside], center_ys[inside]
+        if visible_only and xs.size:
+            picked_xs, picked_ys, _, hit = self.pick_points(center_xs, center_ys)
+            visible = hit & (picked_xs == xs) & (picked_ys == ys)
+            xs, ys, elevations = xs[visible], ys[visible], elevations[visible]
+        return np.column_stack((xs, ys, elevations)).astype(np.int32)
@@ -0,0 +1,227 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from src.world.heightmap import pack_block_key, unpack_block_key
+
+
+# bump whenever the layout changes, files of other versions are refused rather than misread
+SAVE_VERSION = 1
+MAGIC = b"ISOW"
+# magic, version, then the offset and size of the current index block
+HEADER = struct.Struct("<4sIQQ")
+# record count and state length at the start of an index block
+INDEX_HEADER = struct.Struct("<II")
+# the chunk's pixels differ from the generated world's, so disk cache pixels do not apply
+EDITED = 1
+
+INDEX_DTYPE = np.dtype([
+    ("key", "<i8"),
+    ("flags", "<u4"),
+    ("heights_offset", "<u8"),
+    ("heights_size", "<u4"),
+    ("heights_crc", "<u4"),
+    ("entities_offset", "<u8"),
+    ("entities_size", "<u4"),
+    ("entities_crc", "<u4"),
+    ("entity_count", "<u4"),
+])
+ENTITY_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("phase", "<f4"), ("step_timer", "<f4")])
+
+
+class SaveFile:
+    """ A saved world in one file, read a chunk at a time.
+
+    The file starts with a fixed header pointing at the current index and the world
+    params as JSON. zlib-compressed heightmap and entity blocks follow in any order,
+    then the index: one record per chunk with the offset, size and CRC32 of its blocks,
+    sorted by packed chunk key, and the rest of the world state as JSON. The file is
+    memory-mapped and records are found by binary search, so opening a large world
+    reads the index only, and each chunk's blocks once the chunk is needed. A block
+    that does not match its CRC32 on reading raises ValueError.
+
+    Saving appends the blocks whose contents changed and a new index, and only then
+    points the header at it, so an interrupted save leaves the previous one intact.
+    Replaced blocks stay behind as garbage until they take up more than max_garbage
+    of the file, when the save rewrites it compactly instead. """
+    def __init__(self, path: str, params: dict, max_garbage: float = 0.5):
+        self.path = path
+        self.params = params
+        self.max_garbage = max_garbage
+        # packed keys of the chunks whose saved entities were handed out, or written, since opening
+        self.read_entities: set[int] = set()
+        if not os.path.exists(path):
+            self.write_file(np.zeros(0, dtype=INDEX_DTYPE), {}, [])
+        saved = self.read_params(path)
+        if saved is None:
+            raise ValueError(f"{path} is not a version {SAVE_VERSION} world save")
+        if saved != params:
+            raise ValueError(f"{path} was saved with different world params: {saved}")
+        self.open()
+
+    @staticmethod
+    def read_params(path: str) -> dict | None:
+        """ The world params a save was created with, None if path is not a save this version reads. """
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            magic, version, _, _ = HEADER.unpack(header)
+            if magic != MAGIC or version != SAVE_VERSION:
+                return None
+            length, = struct.unpack("<I", f.read(4))
+            return json.loads(f.read(length))
+
+    def open(self):
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, offset, _ = HEADER.unpack_from(self.map)
+        count, state_length = INDEX_HEADER.unpack_from(self.map, offset)
+        records = offset + INDEX_HEADER.size
+        self.index = np.frombuffer(self.map, dtype=INDEX_DTYPE, count=count, offset=records).copy()
+        self.state: dict = json.loads(self.map[records + self.index.nbytes:records + self.index.nbytes + state_length])
+        # blocks start after the header and params
+        self.data_start = HEADER.size + 4 + struct.unpack_from("<I", self.map, HEADER.size)[0]
+
+    def close(self):
+        self.map.close()
+
+    def find(self, key: tuple[int, int]) -> np.void | None:
+        """ The index record of a chunk, None if nothing of it is saved. """
+        packed = int(pack_block_key(*key))
+        position = np.searchsorted(self.index["key"], packed)
+        if position < self.index.size and self.index["key"][position] == packed:
+            return self.index[position]
+        return None
+
+    def read_block(self, offset: int, size: int, crc: int) -> bytes:
+        """ A block's uncompressed data, checked against the CRC32 its index record keeps. """
+        data = zlib.decompress(self.map[offset:offset + size])
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"{self.path} is corrupt, the block at {offset} fails its CRC check")
+        return data
+
+    def load_heights(self, key: tuple[int, int], block_size: int) -> np.ndarray | None:
+        """ The saved elevations of a heightmap block, None if the block was never edited. """
+        record = self.find(key)
+        if record is None or not record["heights_size"]:
+            return None
+        data = self.read_block(int(record["heights_offset"]), int(record["heights_size"]), int(record["heights_crc"]))
+        return np.frombuffer(data, dtype="<i2").reshape(block_size, block_size).copy()
+
+    def take_entities(self, key: tuple[int, int]) -> np.ndarray | None:
+        """ The saved agents of a chunk, handed out once, None if there are none left to read. """
+        packed = int(pack_block_key(*key))
+        if packed in self.read_entities:
+            return None
+        self.read_entities.add(packed)
+        record = self.find(key)
+        if record is None or not record["entity_count"]:
+            return None
+        data = self.read_block(int(record["entities_offset"]), int(record["entities_size"]), int(record["entities_crc"]))
+        return np.frombuffer(data, dtype=ENTITY_DTYPE)
+
+    def has_unread_entities(self, key: tuple[int, int]) -> bool:
+        record = self.find(key)
+        return record is not None and record["entity_count"] > 0 and int(record["key"]) not in self.read_entities
+
+    def get_entity_keys(self) -> list[tuple[int, int]]:
+        """ Keys of the chunks whose saved agents were handed out. """
+        keys = self.index["key"][self.index["entity_count"] > 0].tolist()
+        return [unpack_block_key(key) for key in keys if key in self.read_entities]
+
+    def get_edited(self) -> list[tuple[int, int]]:
+        """ Keys of the chunks saved as edited. """
+        return [unpack_block_key(key) for key in self.index["key"][self.index["flags"] & EDITED != 0].tolist()]
+
+    def save(self, heights: dict[tuple[int, int], np.ndarray], entities: dict[tuple[int, int], np.ndarray], edited: set[tuple[int, int]], state: dict):
+        """ Store heightmap blocks, the agents of chunks, which chunks are edited and the world
+        state. Chunks left out of heights and entities keep what was saved of them before. """
+        fields = {name: position for position, name in enumerate(INDEX_DTYPE.names)}
+        records = {row[0]: list(row) for row in self.index.tolist()}
+        blocks = []
+        for kind, arrays, dtype in (("heights", heights, np.dtype("<i2")), ("entities", entities, ENTITY_DTYPE)):
+            offset, size, crc_field = fields[f"{kind}_offset"], fields[f"{kind}_size"], fields[f"{kind}_crc"]
+            for key, array in arrays.items():
+                packed = int(pack_block_key(*key))
+                record = records.setdefault(packed, [packed] + [0] * (len(fields) - 1))
+                if kind == "entities":
+                    record[fields["entity_count"]] = len(array)
+                data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+                crc = zlib.crc32(data)
+                if not data:
+                    record[offset] = record[size] = record[crc_field] = 0
+                elif not record[size] or record[crc_field] != crc:
+                    compressed = zlib.compress(data)
+                    record[size], record[crc_field] = len(compressed), crc
+                    blocks.append((packed, kind, compressed))
+        # chunks repainted by edits next to them are edited without any saved blocks of their own
+        for key in edited:
+            packed = int(pack_block_key(*key))
+            records.setdefault(packed, [packed] + [0] * (len(fields) - 1))
+        for packed, record in records.items():
+            record[fields["flags"]] = EDITED if unpack_block_key(packed) in edited else 0
+        self.read_entities.update(int(pack_block_key(*key)) for key in entities)
+
+        index = np.array(sorted(tuple(record) for record in records.values() if any(record[1:])), dtype=INDEX_DTYPE)
+        written = sum(len(data) for _, _, data in blocks)
+        kept = int(index["heights_size"].sum()) + int(index["entities_size"].sum()) - written
+        # everything past the params that the new index no longer refers to, the old index included
+        garbage = self.map.size() - self.data_start - kept
+        if garbage > self.max_garbage * (self.map.size() + written):
+            self.rewrite(index, state, blocks)
+        else:
+            self.append(index, state, blocks)
+
+    def append(self, index: np.ndarray, state: dict, blocks: list[tuple[int, str, bytes]]):
+        """ Write the changed blocks and the new index past the end of the file, then point the header at it. """
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            offset, size = self.write_blocks(f, index, state, blocks)
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, SAVE_VERSION, offset, size))
+        self.close()
+        self.open()
+
+    def rewrite(self, index: np.ndarray, state: dict, blocks: list[tuple[int, str, bytes]]):
+        """ Write the file anew with only the blocks the index refers to. """
+        changed = {(packed, kind) for packed, kind, _ in blocks}
+        kept = []
+        for record in index:
+            for kind in ("heights", "entities"):
+                offset, size = int(record[f"{kind}_offset"]), int(record[f"{kind}_size"])
+                if size and (int(record["key"]), kind) not in changed:
+                    kept.append((int(record["key"]), kind, self.map[offset:offset + size]))
+        self.close()
+        self.write_file(index, state, kept + blocks)
+        self.open()
+
+    def write_file(self, index: np.ndarray, state: dict, blocks: list[tuple[int, str, bytes]]):
+        # written under a temporary name so a crash never leaves a truncated save behind
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, SAVE_VERSION, 0, 0))
+            params = json.dumps(self.params, sort_keys=True).encode()
+            f.write(struct.pack("<I", len(params)) + params)
+            offset, size = self.write_blocks(f, index, state, blocks)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, SAVE_VERSION, offset, size))
+        os.replace(temp_path, self.path)
+
+    def write_blocks(self, f, index: np.ndarray, state: dict, blocks: list[tuple[int, str, bytes]]) -> tuple[int, int]:
+        """ Write blocks at the end of f, pointing their index records at them, then the index.
+        Returns the offset and size of the index block. """
+        for packed, kind, data in blocks:
+            index[f"{kind}_offset"][np.searchsorted(index["key"], packed)] = f.tell()
+            f.write(data)
+        state_data = json.dumps(state, sort_keys=True).encode()
+        data = INDEX_HEADER.pack(index.size, len(state_data)) + index.tobytes() + state_data
+        offset = f.tell()
+        f.write(data)
+        return offset, len(data)
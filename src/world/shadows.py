@@ -1,46 +1,95 @@
+import math
+
+import numpy as np
 import pygame as pg
 import pygame.gfxdraw as gfxdraw
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from src.world.chunk import Chunk
-    from src.world.tile import Tile
+    from src.world.world import World
+
+from src.world.terrain import ShadowType
 
 
 
 class Shadows:
-    def __init__(self, chunk: "Chunk"):
-        self.chunk = chunk
-        self.tile_size = self.chunk.tile_size
-        self.cube_height = self.chunk.cube_height
-        self.main_surface = pg.Surface((self.chunk.width, self.chunk.height), pg.SRCALPHA)
-        self.top_layer_surface = pg.Surface((self.chunk.width, self.chunk.height), pg.SRCALPHA)
-        self.rect = self.chunk.rect
+    """ The two shadow shapes, rasterized once into stamps that chunks blit in a single pass.
+
+    Stamps are combined with BLEND_RGBA_MAX on a transparent scratch surface, so
+    overlapping shadows keep the same darkness instead of stacking, and the result
+    is then alpha blended onto the chunk. The scratch surface is one block_size
+    square at a time, only for the blocks shadows fall in. """
+    def __init__(self, world: "World"):
+        self.tile_size = world.tile_size
+        self.cube_height = world.cube_height
         self.shadow_color = (0, 0, 0, 150)
-        self.shadow_size = 0.5 
+        self.shadow_size = 0.5
+        self.block_size = 256
         self.points = [
-            (self.tile_size, 0), 
-            (self.tile_size * 2, self.tile_size / 2), 
-            (self.tile_size, self.tile_size), 
+            (self.tile_size, 0),
+            (self.tile_size * 2, self.tile_size / 2),
+            (self.tile_size, self.tile_size),
             (0, self.tile_size / 2)
         ]
+        # stamp images and their offsets from the casting tile, indexed by ShadowType
+        self.stamps: list[pg.Surface | None] = [None] * len(ShadowType)
+        self.offsets = np.zeros((len(ShadowType), 2), dtype=np.int32)
+        self.sizes = np.zeros((len(ShadowType), 2), dtype=np.int32)
+        for shadow_type in (ShadowType.FULL, ShadowType.PARTIAL):
+            self.stamps[shadow_type], self.offsets[shadow_type] = self.create_stamp(self.get_shadow_points(shadow_type))
+            self.sizes[shadow_type] = self.stamps[shadow_type].get_size()
 
-    def draw(self, tile: "Tile", surface: pg.Surface):
-        if tile.shadow_type == "none":
-            return
-
-        if tile.shadow_type == "full":
-            full_face_points = [(x + tile.rect.x - self.rect.x, y + tile.rect.y - self.rect.y) for x, y in self.points]
-            full_shadow_points = [(x + self.tile_size , y + self.cube_height * 2) for x, y in full_face_points]
+    def get_shadow_points(self, shadow_type: ShadowType) -> list[tuple[float, float]]:
+        """ Corners of a shadow cast by a tile at the origin. """
+        if shadow_type == ShadowType.FULL:
+            full_shadow_points = [(x + self.tile_size , y + self.cube_height * 2) for x, y in self.points]
             full_shadow_points[1] = (full_shadow_points[1][0] - self.tile_size * self.shadow_size, full_shadow_points[1][1] - self.cube_height * self.shadow_size)
-            full_shadow_points[2] = (full_shadow_points[2][0] - self.tile_size * self.shadow_size, full_shadow_points[2][1] - self.cube_height * self.shadow_size)  
-            gfxdraw.filled_polygon(surface, full_shadow_points, self.shadow_color)
+            full_shadow_points[2] = (full_shadow_points[2][0] - self.tile_size * self.shadow_size, full_shadow_points[2][1] - self.cube_height * self.shadow_size)
+            return full_shadow_points
+
+        partial_face_points = [(x + self.tile_size / 2, y - self.cube_height/2) for x, y in self.points]
+        partial_shadow_points = [(x + self.tile_size , y + self.cube_height * 2) for x, y in partial_face_points]
+        partial_shadow_points[0] = (partial_shadow_points[0][0] - self.tile_size / 2, partial_shadow_points[0][1] + (self.cube_height / 2))
+        partial_shadow_points[1] = (partial_shadow_points[1][0] - self.tile_size, partial_shadow_points[1][1])
+        partial_shadow_points[2] = (partial_shadow_points[2][0] - self.tile_size * self.shadow_size, partial_shadow_points[2][1] - self.cube_height * self.shadow_size)
+        return partial_shadow_points
+
+    def create_stamp(self, points: list[tuple[float, float]]) -> tuple[pg.Surface, tuple[int, int]]:
+        # whole pixel offsets keep the polygon's rounding the same wherever the stamp lands
+        left, top = math.floor(min(x for x, _ in points)), math.floor(min(y for _, y in points))
+        right, bottom = math.ceil(max(x for x, _ in points)), math.ceil(max(y for _, y in points))
+        stamp = pg.Surface((right - left + 1, bottom - top + 1), pg.SRCALPHA)
+        gfxdraw.filled_polygon(stamp, [(x - left, y - top) for x, y in points], self.shadow_color)
+        return stamp, (left, top)
+
+    def draw(self, surface: pg.Surface, area: pg.Rect, shadow_types: np.ndarray, tile_xs: np.ndarray, tile_ys: np.ndarray):
+        """ Shadow the part of surface inside area. Tile positions are relative to surface. """
+        block_size = self.block_size
+        xs = tile_xs + self.offsets[shadow_types, 0] - area.x
+        ys = tile_ys + self.offsets[shadow_types, 1] - area.y
+        columns = zip(
+            np.maximum(xs // block_size, 0).tolist(),
+            np.minimum((xs + self.sizes[shadow_types, 0] - 1) // block_size, (area.width - 1) // block_size).tolist()
+        )
+        rows = zip(
+            np.maximum(ys // block_size, 0).tolist(),
+            np.minimum((ys + self.sizes[shadow_types, 1] - 1) // block_size, (area.height - 1) // block_size).tolist()
+        )
 
-        elif tile.shadow_type == "partial":
-            partial_face_points = [(x + tile.rect.x + self.tile_size / 2  - self.rect.x, y + tile.rect.y - self.cube_height/2 - self.rect.y) for x, y in self.points]
-            partial_shadow_points = [(x + self.tile_size , y + self.cube_height * 2) for x, y in partial_face_points]
-            partial_shadow_points[0] = (partial_shadow_points[0][0] - self.tile_size / 2, partial_shadow_points[0][1] + (self.cube_height / 2))
-            partial_shadow_points[1] = (partial_shadow_points[1][0] - self.tile_size, partial_shadow_points[1][1])
-            partial_shadow_points[2] = (partial_shadow_points[2][0] - self.tile_size * self.shadow_size, partial_shadow_points[2][1] - self.cube_height * self.shadow_size)  
-            gfxdraw.filled_polygon(surface, partial_shadow_points, self.shadow_color)
+        # stamps crossing a block edge are blitted into every block they touch
+        blocks: dict[tuple[int, int], list] = {}
+        stamps = self.stamps
+        for shadow_type, x, y, (first_column, last_column), (first_row, last_row) in zip(shadow_types.tolist(), xs.tolist(), ys.tolist(), columns, rows):
+            for row in range(first_row, last_row + 1):
+                for column in range(first_column, last_column + 1):
+                    blocks.setdefault((column, row), []).append(
+                        (stamps[shadow_type], (x - column * block_size, y - row * block_size), None, pg.BLEND_RGBA_MAX)
+                    )
 
+        scratch = pg.Surface((block_size, block_size), pg.SRCALPHA)
+        surface.set_clip(area)
+        for (column, row), block in blocks.items():
+            scratch.fill((0, 0, 0, 0))
+            scratch.blits(block, doreturn=False)
+            surface.blit(scratch, (area.x + column * block_size, area.y + row * block_size))
+        surface.set_clip(None)
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+import pygame as pg
+
+
+class SpatialGrid:
+    """ Uniform grid over world-space bounding rects.
+
+    Each item is registered in every cell its rect overlaps, so a query only
+    visits the cells under the queried rect, independent of how many items exist. """
+    def __init__(self, cell_width: int, cell_height: int):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.cells: defaultdict[tuple[int, int], list] = defaultdict(list)
+        self.rects: dict[object, pg.Rect] = {}
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def cell_range(self, rect: pg.Rect) -> tuple[range, range]:
+        return (
+            range(rect.left // self.cell_width, (rect.right - 1) // self.cell_width + 1),
+            range(rect.top // self.cell_height, (rect.bottom - 1) // self.cell_height + 1)
+        )
+
+    def insert(self, item, rect: pg.Rect):
+        self.rects[item] = pg.Rect(rect)
+        columns, rows = self.cell_range(rect)
+        for row in rows:
+            for column in columns:
+                self.cells[(column, row)].append(item)
+
+    def remove(self, item):
+        rect = self.rects.pop(item)
+        columns, rows = self.cell_range(rect)
+        for row in rows:
+            for column in columns:
+                cell = self.cells[(column, row)]
+                cell.remove(item)
+                if not cell:
+                    del self.cells[(column, row)]
+
+    def query(self, rect: pg.Rect) -> set:
+        """ Items whose rect collides with the given rect. """
+        found = set()
+        columns, rows = self.cell_range(rect)
+        for row in rows:
+            for column in columns:
+                for item in self.cells.get((column, row), ()):
+                    if item not in found and rect.colliderect(self.rects[item]):
+                        found.add(item)
+        return found
@@ -0,0 +1,84 @@
+from enum import IntEnum
+
+import numpy as np
+
+
+# neighbor offsets (dx, dy) in grid space, named after the screen direction they face
+NORTHEAST = (0, -1)
+NORTH = (-1, -1)
+NORTHWEST = (-1, 0)
+SOUTHEAST = (1, 0)
+SOUTH = (1, 1)
+SOUTHWEST = (0, 1)
+
+# cube image variants, indexed by face_code
+FACE_FULL = 0
+FACE_NO_LEFT = 1
+FACE_NO_RIGHT = 2
+FACE_TOP_ONLY = 3
+
+
+class ShadowType(IntEnum):
+    """ Shadow a surface cube casts onto the cell southeast of it, stored as uint8. """
+    NONE = 0
+    FULL = 1
+    PARTIAL = 2
+
+
+class WaterType(IntEnum):
+    """ Water lying on a surface cube, the high byte of a Hydrology stamp key. """
+    NONE = 0
+    RIVER = 1
+    LAKE = 2
+
+
+def neighbor_mask(grid: np.ndarray, dx: int, dy: int, condition) -> np.ndarray:
+    """ Whole-array counterpart of World.has_neighbor_with_condition.
+    Cells whose neighbor at (dx, dy) falls outside the grid are False. """
+    height, width = grid.shape
+    mask = np.zeros(grid.shape, dtype=bool)
+    if abs(dx) >= width or abs(dy) >= height:
+        return mask
+    cells = grid[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)]
+    neighbors = grid[max(0, dy):height + min(0, dy), max(0, dx):width + min(0, dx)]
+    mask[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)] = condition(cells, neighbors)
+    return mask
+
+
+def lower(e, ne):
+    return ne < e
+
+
+def equal_or_higher(e, ne):
+    return ne >= e
+
+
+class TerrainMasks:
+    """ Per-cell flags derived from the heightmap, computed with shifted array comparisons. """
+    def __init__(self, grid: np.ndarray):
+        self.needs_layering = (
+            neighbor_mask(grid, *NORTHEAST, lower)
+            | neighbor_mask(grid, *NORTHWEST, lower)
+            | neighbor_mask(grid, *NORTH, lower)
+        )
+        self.left_face_visible = ~neighbor_mask(grid, *SOUTHWEST, equal_or_higher)
+        self.right_face_visible = ~neighbor_mask(grid, *SOUTHEAST, equal_or_higher)
+
+        # faces are only trimmed on tiles that get redrawn over the player
+        self.face_code = np.where(
+            self.needs_layering,
+            (~self.left_face_visible) * FACE_NO_LEFT + (~self.right_face_visible) * FACE_NO_RIGHT,
+            FACE_FULL
+        ).astype(np.uint8)
+
+        has_shadow = neighbor_mask(grid, *SOUTHEAST, lower)
+        self.shadow_type = np.where(
+            has_shadow,
+            np.where(neighbor_mask(grid, *SOUTH, equal_or_higher), ShadowType.PARTIAL, ShadowType.FULL),
+            ShadowType.NONE
+        ).astype(np.uint8)
+
+    def clear_layering(self, mask: np.ndarray):
+        """ Draw the masked cells in the main layer, with full faces. """
+        self.needs_layering &= ~mask
+        self.face_code[mask] = FACE_FULL
@@ -0,0 +1,92 @@
+import numpy as np
+import pygame as pg
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from src.world.world import World
+
+from src.world.tile import Tile
+from src.world.terrain import neighbor_mask, SOUTHWEST, SOUTHEAST, ShadowType, TerrainMasks
+
+
+class TileStore:
+    """ Struct-of-arrays storage for every cube a block of grid cells can show.
+
+    Cubes are kept in painter order (row, column, elevation). Buried cubes whose
+    top and side faces are all covered by cubes drawn after them are not stored.
+    image is the cube's variant in the world's texture atlas. water is the stamp key of the
+    water on a surface cube, 0 for none, see Hydrology, and water_y is where it is drawn,
+    above rect_y when a lake stands over the cube. """
+    def __init__(self, world: "World", grid_rect: pg.Rect, chunk_id: tuple[int, int]):
+        self.world = world
+        self.chunk_id = chunk_id
+        self.atlas = world.atlas
+        self.tile_size = world.tile_size
+        self.cube_height = world.cube_height
+
+        # flags look one cell away, so masks of a window one cell wider on every side are exact
+        # for the block, and its extra row and column to the south and east are the neighbors
+        # that hide buried cubes
+        window = world.clip_cells(grid_rect.inflate(2, 2))
+        heights = world.grid.window(window)
+        masks = TerrainMasks(heights)
+        # cubes under a lake stay in the main layer, where the water drawn after them covers them
+        water, level = world.hydrology.get_water(chunk_id, window)
+        masks.clear_layering(level > heights)
+        top, left = grid_rect.top - window.top, grid_rect.left - window.left
+        cells = (slice(top, top + grid_rect.height), slice(left, left + grid_rect.width))
+        apron = (slice(top, None), slice(left, None))
+        grid = heights[cells]
+        lowest = self.lowest_visible_elevation(heights[apron], masks.needs_layering[apron])[:grid_rect.height, :grid_rect.width]
+        image_index = world.get_variants(grid, masks.face_code[cells])
+
+        counts = (grid - lowest + 1).ravel()
+        columns = np.repeat(np.arange(grid.size), counts)
+        column_starts = np.repeat(np.cumsum(counts) - counts, counts)
+
+        self.y, self.x = (a.astype(np.int32) for a in np.divmod(columns, grid_rect.width))
+        self.x += grid_rect.left
+        self.y += grid_rect.top
+        self.elevation = (lowest.ravel()[columns] + np.arange(columns.size) - column_starts).astype(np.int16)
+        self.is_surface = self.elevation == grid.ravel()[columns]
+        self.needs_layering = masks.needs_layering[cells].ravel()[columns]
+        self.image = image_index.ravel()[columns]
+        self.face_code = masks.face_code[cells].ravel()[columns]
+        self.shadow = np.where(self.is_surface, masks.shadow_type[cells].ravel()[columns], ShadowType.NONE).astype(np.uint8)
+
+        self.rect_x = (self.x - self.y) * self.tile_size
+        self.rect_y = (self.x + self.y) * self.tile_size // 2 - self.elevation * self.cube_height
+
+        self.water = np.where(self.is_surface, water[cells].ravel()[columns], 0).astype(np.uint16)
+        self.water_y = self.rect_y - (level[cells].ravel()[columns] - self.elevation) * self.cube_height
+
+    def __len__(self):
+        return self.x.size
+
+    def __getitem__(self, index: int) -> Tile:
+        return Tile(
+            self.world.app,
+            self.atlas.image(self.image[index]),
+            int(self.elevation[index]),
+            (int(self.x[index]), int(self.y[index])),
+            self.tile_size,
+            self.cube_height,
+            ShadowType(self.shadow[index]),
+            bool(self.needs_layering[index]),
+            bool(self.is_surface[index]),
+            self.chunk_id
+        )
+
+    @staticmethod
+    def lowest_visible_elevation(grid: np.ndarray, needs_layering: np.ndarray) -> np.ndarray:
+        """ A buried cube is hidden once its southwest and southeast neighbors are baked
+        at least as high, since their cubes are drawn after it and cover both side faces.
+        Layered columns only ever draw their surface cube. """
+        lowest = grid.astype(np.int16)
+        for dx, dy in (SOUTHWEST, SOUTHEAST):
+            covered = neighbor_mask(needs_layering, dx, dy, lambda nl, neighbor_nl: ~neighbor_nl)
+            neighbor = np.zeros_like(lowest)
+            neighbor[:grid.shape[0] - dy, :grid.shape[1] - dx] = grid[dy:, dx:] + 1
+            lowest = np.minimum(lowest, np.where(covered, neighbor, 0))
+        return np.where(needs_layering, grid, lowest)
+
@@ -1,22 +1,50 @@
+import math
+import tracemalloc
+
+import numpy as np
 import pygame as pg
-import pygame.gfxdraw as gfxdraw
+from bisect import insort
 from opensimplex import OpenSimplex
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from src.core.app import App
     from src.core.camera import Camera
+    from src.world.tile_store import TileStore
     
-from src.world.tile import Tile
-from src.world.chunk import Chunk
+from src.world.chunk import Chunk, get_chunk_rect, get_chunk_surface_size
+from src.world.chunk_cache import ChunkCache
+from src.world.baker import ChunkBaker
+from src.world.disk_cache import DiskCache
+from src.world.save_file import SaveFile, ENTITY_DTYPE
+from src.world.heightmap import HeightMap
+from src.world.atlas import TextureAtlas
+from src.world.shadows import Shadows
+from src.world.hydrology import Hydrology
+from src.world.lighting import Lighting
+from src.world.memory import get_array_bytes, get_shared_surface_bytes
+from src.world.navigation import Navigation
+from src.world.picking import Picker
+from src.world.terrain import FACE_FULL, FACE_NO_LEFT, FACE_NO_RIGHT, FACE_TOP_ONLY
 from src.entities.agent import Agent
-
+from src.entities.agent_manager import AgentManager
+from src.entities.agent_sprites import AgentSprites
 
 
 
 class World:
-    def __init__(self, app: "App", width, height, tile_size, cube_height, max_elevation, noise_scale, seed=0):
+    """ A width x height grid of cells, or an unbounded one when both are None, whose
+    chunks are generated when they first come into view and unloaded once far from it. """
+    def __init__(self, app: "App", width, height, tile_size, cube_height, max_elevation, noise_scale, seed=0, streaming=False, cache_budget=None, bake_workers=0, cache_dir=None, shade_step=0.0, save_path=None, lighting=False, day_length=None, memory_budget=None, chunk_size=None):
         self.app = app
+        # bytes the world's surfaces and arrays are held to, the chunk cache gets what the rest leaves
+        # of it in place of cache_budget, and chunks shrink until the ones around a view fit in it
+        self.memory_budget = memory_budget
+        # whether the chunks around a view fitted the chunk cache the last time it was fitted to the budget
+        self.view_fits = True
+        # tracemalloc snapshots taken between build phases, only while tracemalloc is tracing
+        self.memory_snapshots: list[tuple[str, tracemalloc.Snapshot]] = []
+        self.snapshot_memory("start")
         self.width = width
         self.height = height
         self.tile_size = tile_size
@@ -25,136 +53,393 @@ class World:
         self.seed = seed
         self.noise_scale = noise_scale
         self.simplex = OpenSimplex(seed=self.seed)
-        self.chunk_size = self.app.scale * 4
-        self.grass_tex = pg.image.load("assets/grass.jpg").convert_alpha()
-        self.dirt_tex = pg.image.load("assets/dirt.jpg").convert_alpha()
+        # chunks are never halved below min_chunk_size cells to fit the memory budget
+        self.min_chunk_size = 8
+        # a given chunk_size is kept, a save only loads into chunks of the size it was saved with
+        self.chunk_size = chunk_size or self.fit_chunk_size(self.app.scale * 4, lighting)
+        self.bounds = pg.Rect(0, 0, width, height) if width is not None else None
+        # streaming worlds create and bake chunks only once they come within stream_margin pixels of the view,
+        # unbounded worlds always stream and unload chunks further than unload_margin pixels from it
+        self.streaming = streaming or self.bounds is None
+        self.stream_margin = self.tile_size * self.chunk_size // 4
+        self.unload_margin = self.stream_margin * 4
+        # isometric rows per overlay band, the unit the top layer is pre-baked and depth sorted in
+        self.band_rows = 16
+        # zoomed out views draw chunks downsampled by 1/2, 1/4 and 1/8, built lazily and cached
+        self.lod_levels = 4
+        self.chunk_cache = ChunkCache(cache_budget if memory_budget is None else memory_budget)
+        # with bake_workers chunks bake on a thread pool and draw as placeholders until ready
+        self.baker = ChunkBaker(self, bake_workers) if bake_workers else None
+        self.material_paths = {
+            "dirt": "assets/dirt.jpg",
+            "dirt1": "assets/dirt1.jpg",
+            "grass": "assets/grass.jpg",
+            "grass1": "assets/grass1.jpg",
+            "grmarble": "assets/grmarble.jpg",
+        }
+        # materials cycle with elevation, dirt on even elevations and grass on odd ones
+        self.elevation_materials = ["dirt", "grass"]
+        # darkens each elevation below max_elevation by another shade_step, 0 leaves them all alike
+        self.shade_step = shade_step
+        # with lighting, a movable sun lights and shadows the terrain in place of the fixed side shades and shadows
+        side_shades = (255, 255) if lighting else (200, 150)
+        self.atlas = TextureAtlas(self.material_paths, self.tile_size, self.cube_height, self.shade_step, side_shades=side_shades)
+        self.shadows = Shadows(self)
+        self.hydrology = Hydrology(self)
+        self.lighting = Lighting(self, day_length=day_length) if lighting else None
         self.mask_tex = pg.Surface((self.tile_size * 3, self.tile_size + self.cube_height * 2), pg.SRCALPHA)
         self.mask_tex.fill((255, 0, 255, 255))
-        self.player_tex = pg.image.load("assets/rock2.png").convert_alpha()
-        self.grid = self.create_grid()
+        self.player_tex = pg.image.load("assets/rock2.PNG").convert_alpha()
+        self.snapshot_memory("textures")
+        self.disk_cache = DiskCache(cache_dir, self.get_cache_params(), [self.material_paths[material] for material in self.elevation_materials]) if cache_dir else None
+        # edited heightmap blocks, agents and the player are saved to and loaded from save_path, chunk by chunk
+        self.save_file = SaveFile(save_path, self.get_save_params()) if save_path else None
+        # elevations, generated a chunk_size block at a time as chunks and agents need them
+        self.grid = HeightMap(self, self.chunk_size)
         self.top_layer_positions: list[tuple[int, int]] = []
-        self.tiles: list["Tile"] = self.create_tiles()
-        self.chunks: list["Chunk"] = self.create_chunks()
-        self.player = Agent(self.app, None, 0, (0, 0), self.tile_size, self.cube_height, True, False, False, -1)
-        self.river_surface, self.river_rect = self.create_river()
-
-    def update(self):
-        pass
-
-    def draw(self, screen: pg.Surface, camera: "Camera"):
-        for chunk in self.chunks:
-            if camera.view_rect.colliderect(chunk.rect):
-                chunk.draw_main_layer(screen, camera)
-
-                entities: list["Tile"] = [(tile, tile.rect.y) for tile in chunk.top_layer_tiles]
-                entities.append((self.player, self.player.rect.y))
-
-                sorted_entities: list["Tile"] = sorted(entities, key=lambda x: x[1])
-
-                for entity, _ in sorted_entities:
-                    entity.draw(screen, camera)
-                    if entity.grid_pos == self.player.current_grid_pos:
-                        self.player.draw(screen, camera)
-
-                self.draw_rivers(screen, camera)
-
-    def create_river(self):
-        points = [(0, 0), (0, 1), (1, 1), (1, 0)]
-        for point in points:
-            x, y = point
-            elevation_offset = self.grid[y][x] * self.cube_height
-            isometric_x = ((x * self.tile_size) - (y * self.tile_size)) + self.tile_size // 2
-            isometric_y = ((x + y) * self.tile_size // 2)  - elevation_offset
-            river_surface = pg.Surface((self.tile_size, self.tile_size), pg.SRCALPHA)
-            river_rect = river_surface.get_rect()
-            river_rect.x = isometric_x
-            river_rect.y = isometric_y
-            circle_radius = self.tile_size // 2
-            circle_center = (circle_radius, circle_radius)
-            pg.draw.circle(river_surface, pg.Color("blue"), circle_center, circle_radius)
-        return river_surface, river_rect
-
-
-    def draw_rivers(self, screen: pg.Surface, camera: "Camera"):
-        screen.blit(self.river_surface, camera.apply(self.river_rect))
-
-    def create_chunks(self) -> list["Chunk"]:
+        self.navigation = Navigation(self)
+        self.picker = Picker(self)
+        # chunks with terrain edits, kept across unloading so they never load stale disk cache pixels
+        self.edited_chunks: set[tuple[int, int]] = set()
+        if self.save_file is not None:
+            self.edited_chunks.update(self.save_file.get_edited())
+        # world-space areas changed by bakes and edits since the last frame, see add_damage
+        self.damage: list[pg.Rect] | None = None
+        self.chunks: dict[tuple[int, int], "Chunk"] = self.create_chunks()
+        self.snapshot_memory("chunks")
+        self.chunks_drawn = 0
+        self.chunks_culled = 0
+        self.blits_drawn = 0
+        self.agent_sprites = AgentSprites(self.tile_size, self.cube_height)
+        self.player = Agent(self.app, None, 0, (0, 0), self.tile_size, self.cube_height, True, False, False, -1, sprites=self.agent_sprites)
+        self.agents = AgentManager(self, self.agent_sprites)
+        if self.save_file is not None:
+            self.load_player()
+            for key in self.chunks:
+                self.load_entities(key)
+        self.snapshot_memory("agents")
+        if self.memory_budget is not None:
+            self.fit_cache_budget()
+
+    def snapshot_memory(self, phase: str):
+        """ Keep a tracemalloc snapshot of the memory allocated by the end of phase, see MemoryReport. """
+        if tracemalloc.is_tracing():
+            self.memory_snapshots.append((phase, tracemalloc.take_snapshot()))
+
+    def fit_chunk_size(self, chunk_size: int, lighting: bool) -> int:
+        """ chunk_size, halved until the chunks around a view fit the memory budget, so the chunk
+        cache never evicts chunks the same frame draws. Below min_chunk_size the cache evicts instead. """
+        if self.memory_budget is None:
+            return chunk_size
+        while chunk_size // 2 >= self.min_chunk_size and self.get_view_bytes(chunk_size, lighting) > self.memory_budget:
+            chunk_size //= 2
+        return chunk_size
+
+    def get_view_bytes(self, chunk_size: int, lighting: bool) -> int:
+        """ Upper bound on the bytes of the chunk layers cached to draw a screen and stream
+        the chunks around it, with chunks of chunk_size x chunk_size cells. """
+        width, height = get_chunk_surface_size(self, chunk_size)
+        # the stream_margin of chunks that size
+        margin = self.tile_size * chunk_size // 4
+        span = chunk_size * self.tile_size
+        # there is a chunk rect for every span x span of the plane, the ones colliding with
+        # the view have their top left corner in the view grown by a chunk rect
+        chunks = math.ceil((self.app.screen_w + margin * 2 + width) * (self.app.screen_h + margin * 2 + height) / span ** 2)
+        # the surface and an overlay at most as large, both 32 bit, and their 8 bit lightmaps
+        pixel_bytes = 10 if lighting else 8
+        return chunks * width * height * pixel_bytes
+
+    def fit_cache_budget(self):
+        """ Give the chunk cache what the memory budget leaves after the shared surfaces and the arrays. """
+        reserved = sum(get_shared_surface_bytes(self).values()) + sum(get_array_bytes(self).values())
+        self.chunk_cache.budget = max(self.memory_budget - reserved, 0)
+        self.chunk_cache.evict()
+        view_fits = self.get_view_bytes(self.chunk_size, self.lighting is not None) <= self.chunk_cache.budget
+        if self.view_fits and not view_fits:
+            print("memory budget too small for the chunks around a view, they will be evicted while drawing")
+        self.view_fits = view_fits
+
+    def update(self, dt: float = 0.0):
+        """ Advance the simulation by dt seconds. """
+        self.navigation.process()
+        self.agents.update(dt)
+        if self.lighting is not None:
+            self.lighting.advance(dt)
+
+    def collect_bakes(self):
+        """ Hand chunks baked on the pool to the chunk cache. """
+        if self.baker is not None:
+            self.baker.poll()
+
+    def close(self):
+        if self.baker is not None:
+            self.baker.shutdown()
+        if self.save_file is not None:
+            self.save_file.close()
+
+    def load_player(self):
+        position = self.save_file.state.get("player")
+        if position is not None:
+            self.player.current_grid_pos = tuple(position)
+
+    def load_entities(self, key: tuple[int, int]):
+        """ Add the agents saved in a chunk, the first time the chunk loads. """
+        entities = self.save_file.take_entities(key)
+        if entities is not None:
+            self.agents.add(entities["x"], entities["y"], entities["phase"], entities["step_timer"])
+
+    def save(self):
+        """ Write what differs from the generated world to the save file: the edited heightmap
+        blocks, which chunks are edited, every chunk's agents and the player's position. """
+        if self.save_file is None:
+            return
+        print("saving world")
+        agents = self.agents
+        # agents that walked into chunks not loaded since opening would overwrite the ones saved there
+        for key in agents.get_chunks():
+            if self.save_file.has_unread_entities(key):
+                self.load_entities(key)
+        entities = {}
+        for key, indices in agents.get_chunks().items():
+            entities[key] = np.zeros(indices.size, dtype=ENTITY_DTYPE)
+            for name in ENTITY_DTYPE.names:
+                entities[key][name] = getattr(agents, name)[indices]
+        # chunks whose saved agents all walked away
+        for key in self.save_file.get_entity_keys():
+            entities.setdefault(key, np.zeros(0, dtype=ENTITY_DTYPE))
+        heights = {key: self.grid.blocks[key] for key in self.grid.edited}
+        state = {"player": list(self.player.current_grid_pos)}
+        self.save_file.save(heights, entities, self.edited_chunks, state)
+
+    def draw(self, screen: pg.Surface, camera: "Camera", areas: list[pg.Rect] | None = None):
+        """ Draw the camera view, or only the given screen areas of it, each clipped to its area. """
+        if self.streaming:
+            self.stream(camera)
+        if self.lighting is not None:
+            self.lighting.update(camera.world_rect)
+
+        self.blits_drawn = 0
+        # a chunk under several areas is drawn into each, but counted once
+        drawn = set()
+        if areas is None:
+            drawn.update(self.draw_view(screen, camera, camera.world_rect))
+        else:
+            for area in areas:
+                screen.set_clip(area)
+                drawn.update(self.draw_view(screen, camera, camera.unapply(area)))
+            screen.set_clip(None)
+        self.chunks_drawn = len(drawn)
+        self.chunks_culled = len(self.chunks) - len(drawn)
+
+    def draw_view(self, screen: pg.Surface, camera: "Camera", view: pg.Rect) -> set[tuple[int, int]]:
+        """ Draw what overlaps view, a world-space rect, returning the keys of the chunks drawn. """
+        visible_chunks = self.visible_chunks(view)
+        drawn = {chunk.chunk_id for chunk in visible_chunks}
+
+        if camera.lod:
+            # chunk LODs have the top layer baked in, entities are drawn over them
+            for chunk in visible_chunks:
+                chunk.draw_lod(screen, camera)
+            for chunk in visible_chunks:
+                screen.blits([blit for _, blit in self.agents.get_blits(chunk, camera, view)], doreturn=False)
+            self.player.draw(screen, camera)
+            return drawn
+
+        player_chunk = self.get_cell_chunk(*self.player.current_grid_pos)
+        for chunk in visible_chunks:
+            chunk.draw_main_layer(screen, camera)
+
+            entities = self.agents.get_blits(chunk, camera, view)
+            if chunk is player_chunk:
+                player_position = chunk.get_draw_position(self.player.rect.y, self.player.current_grid_pos)
+                insort(entities, (player_position, self.player.get_blit(camera)), key=lambda entity: entity[0])
+            chunk.draw_top_layer(screen, camera, entities)
+        return drawn
+
+    def add_damage(self, rect: pg.Rect):
+        """ Note a world-space area whose pixels changed, for renderers that only redraw
+        what changed. Nothing is kept while damage is None. """
+        if self.damage is not None:
+            self.damage.append(rect)
+
+    def stream(self, camera: "Camera"):
+        """ Bake the chunks near the camera that are not in the chunk cache yet, at the
+        camera's LOD level when zoomed out, and in unbounded worlds unload the ones far
+        from it. Under a memory budget, the chunk cache is fitted to what loading and
+        unloading left of it. """
+        loaded = (set(self.chunks), len(self.grid)) if self.memory_budget is not None else None
+        near_rect = camera.world_rect.inflate(self.stream_margin * 2, self.stream_margin * 2)
+        for chunk in self.visible_chunks(near_rect):
+            if camera.lod:
+                # zoomed out views never need the full size surfaces, LOD bakes make their own
+                if chunk.has_lod(camera.lod):
+                    continue
+                if self.baker is not None:
+                    self.baker.submit_lods(chunk, camera.lod)
+                else:
+                    chunk.update_lods(camera.lod)
+            elif chunk.is_baked:
+                continue
+            elif self.baker is not None:
+                self.baker.submit(chunk)
+            else:
+                chunk.update()
+        if self.bounds is None:
+            self.unload_chunks(camera.world_rect.inflate(self.unload_margin * 2, self.unload_margin * 2))
+        # heightmap blocks are all the same size, their count is enough to tell their bytes changed
+        if loaded is not None and (set(self.chunks), len(self.grid)) != loaded:
+            self.fit_cache_budget()
+
+    def unload_chunks(self, keep_rect: pg.Rect):
+        """ Unload chunks outside keep_rect, then their water and the heightmap and step cost blocks nothing near uses. """
+        keep = set(self.get_chunk_keys(keep_rect))
+        far = [key for key in self.chunks if key not in keep]
+        if not far:
+            return
+        for key in far:
+            self.chunks.pop(key).unload()
+        self.hydrology.unload(self.chunks)
+        # loaded chunks read one cell past their edges, agents read the blocks they walk on
+        blocks = {(cx + dx, cy + dy) for cx, cy in self.chunks for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+        blocks.update(self.agents.get_blocks())
+        blocks.add((self.player.current_grid_pos[0] // self.chunk_size, self.player.current_grid_pos[1] // self.chunk_size))
+        self.grid.unload(blocks)
+        self.navigation.unload(blocks)
+
+    def visible_chunks(self, rect: pg.Rect) -> list["Chunk"]:
+        """ Chunks overlapping a world-space rect, in drawing order, created as needed. """
+        return [self.get_chunk(key) for key in self.get_chunk_keys(rect)]
+
+    def get_chunk_keys(self, rect: pg.Rect) -> list[tuple[int, int]]:
+        """ Keys of the chunks, loaded or not, overlapping a world-space rect, in drawing order. """
+        span = self.chunk_size * self.tile_size
+        top = self.max_elevation * self.cube_height
+        height = span + self.max_elevation * self.tile_size + self.tile_size * 4
+        # chunk rects move right by one span for every diagonal step of cx - cy, and down by half
+        # a span for every step of cx + cy; the ranges are padded for chunks clipped by the bounds
+        diagonals = range(rect.left // span - 3, rect.right // span + 3)
+        rows = range((rect.top + top - height) // (span // 2) - 1, (rect.bottom + top) // (span // 2) + 2)
+        keys = []
+        for row in rows:
+            for diagonal in diagonals:
+                if (row + diagonal) % 2:
+                    continue
+                cx, cy = (row + diagonal) // 2, (row - diagonal) // 2
+                if self.has_chunk(cx, cy) and get_chunk_rect(self, self.get_chunk_cells(cx, cy)).colliderect(rect):
+                    keys.append((cx, cy))
+        return sorted(keys, key=lambda key: (key[1], key[0]))
+
+    def create_chunks(self) -> dict[tuple[int, int], "Chunk"]:
+        """ Every chunk of a bounded world that does not stream, baked up front.
+        Streaming worlds, unbounded ones included, create chunks as they come into view. """
         print("creating chunks")
-        num_chunks = max(tile.chunk_id for tile in self.tiles)
-        chunks: list["Chunk"] = [Chunk(self, i, []) for i in range(num_chunks + 1)]
-
-        for tile in self.tiles:
-            chunks[tile.chunk_id].add_tile(tile)
-        for chunk in chunks:
-            chunk.update()
+        if self.streaming:
+            return {}
+        chunks_x, chunks_y = -(-self.width // self.chunk_size), -(-self.height // self.chunk_size)
+        chunks: dict[tuple[int, int], "Chunk"] = {
+            (cx, cy): Chunk(self, (cx, cy), self.get_chunk_cells(cx, cy))
+            for cy in range(chunks_y) for cx in range(chunks_x)
+        }
+
+        for chunk in chunks.values():
+            if self.baker is not None:
+                self.baker.submit(chunk)
+            else:
+                chunk.update()
+        if self.baker is not None:
+            self.baker.wait()
 
         return chunks
 
-    def create_tiles(self) -> list["Tile"]:
-        print("creating tiles")
-        tiles = []
-        grass_image_full = self.create_cube(self.grass_tex)
-        grass_image_no_left_face = self.create_cube(self.grass_tex, left_face_visible=False)
-        grass_image_no_right_face = self.create_cube(self.grass_tex, right_face_visible=False)
-        grass_image_top_only = self.create_cube(self.grass_tex, left_face_visible=False, right_face_visible=False)
-
-        dirt_image_full = self.create_cube(self.dirt_tex) 
-        dirt_image_no_left_face = self.create_cube(self.dirt_tex, left_face_visible=False)
-        dirt_image_no_right_face = self.create_cube(self.dirt_tex, right_face_visible=False)
-        dirt_image_top_only = self.create_cube(self.dirt_tex, left_face_visible=False, right_face_visible=False)
-        
-        for y, row in enumerate(self.grid):
-            for x, elevation in enumerate(row):
-                # img = dirt_image if elevation % 2 == 0 else grass_image
-                chunk_id = (x // self.chunk_size) + (y // self.chunk_size) * (self.height // self.chunk_size)
-
-                needs_layering = not (not self.has_lower_northeast_neighbor(x, y) and not self.has_lower_northwest_neighbor(x, y) and not self.has_lower_north_neighbor(x, y))
-
-                left_face_visible = not self.has_equal_or_higher_southwest_neighbor(x, y)
-                right_face_visible = not self.has_equal_or_higher_southeast_neighbor(x, y)
-
-                if elevation % 2 == 0:
-                    tile_type = "dirt"
-                else:
-                    tile_type = "grass"
-
-                if needs_layering:
-                    if not left_face_visible and right_face_visible:
-                        img = grass_image_no_left_face if tile_type == "grass" else dirt_image_no_left_face
-                    elif left_face_visible and not right_face_visible:
-                        img = grass_image_no_right_face if tile_type == "grass" else dirt_image_no_right_face
-                    elif not left_face_visible and not right_face_visible:
-                        img = grass_image_top_only if tile_type == "grass" else dirt_image_top_only
-                    else:
-                        img = grass_image_full if tile_type == "grass" else dirt_image_full
-                else:
-                    img = grass_image_full if tile_type == "grass" else dirt_image_full
-
-
-                for elev in range(elevation + 1):
-                    has_shadow = False if elev != elevation and elevation != 0 else self.has_lower_southeast_neighbor(x, y)
-                    is_surface_tile = elev == elevation       
-                    shadow_type = "partial" if has_shadow and self.has_equal_or_higher_south_neighbor(x, y) else "full" if has_shadow else "none"
-                    tiles.append(Tile(
-                                self.app, 
-                                img, 
-                                elev, 
-                                (x, y), 
-                                self.tile_size, 
-                                self.cube_height, 
-                                shadow_type, 
-                                needs_layering, 
-                                is_surface_tile, 
-                                chunk_id
-                            ))
-
-        return tiles
+    def get_chunk(self, key: tuple[int, int], tiles: "TileStore | None" = None) -> "Chunk":
+        """ The chunk at key, generating it from the heightmap if it is not loaded, or
+        from tiles when they were already built for it. """
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk(self, key, self.get_chunk_cells(*key), tiles)
+            if self.save_file is not None:
+                self.load_entities(key)
+        return chunk
+
+    def has_chunk(self, cx: int, cy: int) -> bool:
+        """ Whether the world has a chunk at (cx, cy), loaded or not. """
+        return self.bounds is None or (0 <= cx * self.chunk_size < self.width and 0 <= cy * self.chunk_size < self.height)
+
+    def get_cell_chunk(self, x: int, y: int) -> "Chunk":
+        return self.get_chunk((x // self.chunk_size, y // self.chunk_size))
+
+    def get_chunk_cells(self, cx: int, cy: int) -> pg.Rect:
+        """ The block of grid cells a chunk covers, clipped to the world edge. """
+        return self.clip_cells(pg.Rect(cx * self.chunk_size, cy * self.chunk_size, self.chunk_size, self.chunk_size))
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return self.bounds is None or self.bounds.collidepoint(x, y)
+
+    def clip_cells(self, cells: pg.Rect) -> pg.Rect:
+        """ A block of grid cells clipped to the world edge, unchanged in unbounded worlds. """
+        return cells.clip(self.bounds) if self.bounds is not None else cells
+
+    def get_variants(self, elevation: np.ndarray, face_code: np.ndarray) -> np.ndarray:
+        """ Atlas variant of each cell, rendering the variants not used so far. """
+        shade = np.clip(self.max_elevation - elevation, 0, None) if self.shade_step else np.zeros_like(elevation)
+        keys = (elevation % len(self.elevation_materials) * 4 + face_code) * (self.max_elevation + 1) + shade
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        variants = []
+        for key in unique_keys.tolist():
+            material_face, shade_level = divmod(key, self.max_elevation + 1)
+            material, face = divmod(material_face, 4)
+            variants.append(self.atlas.get(self.elevation_materials[material], face, shade_level))
+        return np.array(variants, dtype=np.uint16)[inverse].reshape(keys.shape)
+
+    def build_atlas(self):
+        """ Render every atlas variant the terrain can use, instead of when chunks first need them. """
+        elevations = np.arange(self.max_elevation + 1)
+        for face_code in (FACE_FULL, FACE_NO_LEFT, FACE_NO_RIGHT, FACE_TOP_ONLY):
+            self.get_variants(elevations, np.full(elevations.shape, face_code))
+
+    def set_elevation(self, x: int, y: int, elevation: int):
+        self.set_elevations([x], [y], [elevation])
+
+    def set_elevations(self, xs, ys, elevations):
+        """ Change the height of any number of cells, then refresh only what depends on them:
+        the step costs and loaded chunks covering their 3x3 neighborhoods, and the cells
+        whose rivers and lakes the edit moves. """
+        xs, ys = np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp)
+        elevations = np.clip(elevations, 0, self.max_elevation).astype(self.grid.dtype)
+        changed = self.grid[ys, xs] != elevations
+        if not changed.any():
+            return
+        xs, ys = xs[changed], ys[changed]
+        self.grid[ys, xs] = elevations[changed]
+
+        dirty = self.clip_cells(pg.Rect(xs.min() - 1, ys.min() - 1, xs.max() - xs.min() + 3, ys.max() - ys.min() + 3))
+        wet = self.hydrology.update(dirty)
+        if wet is not None:
+            dirty = dirty.union(wet)
+        # lakes are not walkable, so paths and step costs depend on the water too
+        self.navigation.update(dirty)
+
+        # unloaded chunks whose water is solved over the edit pick it up when they load again
+        reach = dirty.union(self.hydrology.get_reach(dirty))
+        for cy in range(reach.top // self.chunk_size, (reach.bottom - 1) // self.chunk_size + 1):
+            for cx in range(reach.left // self.chunk_size, (reach.right - 1) // self.chunk_size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    if chunk.grid_rect.colliderect(dirty):
+                        self.edited_chunks.add((cx, cy))
+                        chunk.rebuild(dirty.clip(chunk.grid_rect))
+                elif self.has_chunk(cx, cy):
+                    self.edited_chunks.add((cx, cy))
+                    if self.disk_cache is not None:
+                        self.disk_cache.discard_chunk((cx, cy))
+        if self.lighting is not None:
+            self.lighting.invalidate(dirty)
 
     def has_neighbor_with_condition(self, x, y, dx, dy, condition):
         neighbor_x, neighbor_y = x + dx, y + dy
-        if 0 <= neighbor_x < self.width and 0 <= neighbor_y < self.height:
-            neighbor_elevation = self.grid[neighbor_y][neighbor_x]
-            return condition(self.grid[y][x], neighbor_elevation)
+        if self.in_bounds(neighbor_x, neighbor_y):
+            neighbor_elevation = self.grid[neighbor_y, neighbor_x]
+            return condition(self.grid[y, x], neighbor_elevation)
         return False
 
     def is_edge_tile(self, x, y):
@@ -190,9 +475,7 @@ class World:
 
     def is_neighbor_within_bounds(self, x, y, dx, dy):
         """ Check if the neighbor at the given offset is within the world bounds. """
-        neighbor_x = x + dx
-        neighbor_y = y + dy
-        return 0 <= neighbor_x < self.width and 0 <= neighbor_y < self.height
+        return self.in_bounds(x + dx, y + dy)
 
     def southeast_neighbor_out_of_bounds(self, x, y):
         return not self.is_neighbor_within_bounds(x, y, 1, 0)
@@ -200,51 +483,30 @@ class World:
     def southwest_neighbor_out_of_bounds(self, x, y):
         return not self.is_neighbor_within_bounds(x, y, 0, 1)
     
-    def create_grid(self) -> list[list[int]]:
-        return [
-            [int((self.simplex.noise2(x * self.noise_scale, y * self.noise_scale) + 1) / 2 * self.max_elevation)
-            for x in range(self.width)] for y in range(self.height)
-        ]
-
-    def get_cube_points(self) -> tuple[list[tuple[int, int]]]:
-        top_face_points = [
-            (self.tile_size, 0), 
-            (self.tile_size * 2, self.tile_size / 2), 
-            (self.tile_size, self.tile_size), 
-            (0, self.tile_size / 2)
-        ]
-        left_face_points = [
-            (0, self.tile_size / 2), 
-            (self.tile_size, self.tile_size), 
-            (self.tile_size, self.tile_size + self.cube_height), 
-            (0, self.tile_size / 2 + self.cube_height)
-        ]
-        right_face_points = [
-            (self.tile_size, self.tile_size), 
-            (self.tile_size * 2, self.tile_size / 2), 
-            (self.tile_size * 2, self.tile_size / 2 + self.cube_height), 
-            (self.tile_size, self.tile_size + self.cube_height)
-        ]
-        return top_face_points, left_face_points, right_face_points
-
-    def create_cube(self, texture:pg.Surface, left_face_visible:bool=True, right_face_visible:bool=True, apply_shading:bool=True) -> pg.Surface:
-        surface = pg.Surface((self.tile_size * 2, self.tile_size + self.cube_height), pg.SRCALPHA)
-
-        top_face_points, left_face_points, right_face_points = self.get_cube_points()
-
-        texture_top = pg.transform.scale(texture, (self.tile_size * 2, self.tile_size))
-        texture_left = pg.transform.scale(texture, (self.tile_size, self.cube_height))
-        texture_right = pg.transform.scale(texture, (self.tile_size, self.cube_height))
-
-        if apply_shading:
-            texture_left.fill((200, 200, 200, 255), None, pg.BLEND_RGBA_MULT)
-            texture_right.fill((150, 150, 150, 255), None, pg.BLEND_RGBA_MULT)
-
-        gfxdraw.textured_polygon(surface, top_face_points, texture_top, 0, 0)
-        if left_face_visible:
-            gfxdraw.textured_polygon(surface, left_face_points, texture_left, 0, 0)
-        if right_face_visible:
-            gfxdraw.textured_polygon(surface, right_face_points, texture_right, 0, 0)
-
-        return surface
- 
\ No newline at end of file
+    def get_cache_params(self) -> dict:
+        return {
+            "seed": self.seed,
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "cube_height": self.cube_height,
+            "max_elevation": self.max_elevation,
+            "noise_scale": self.noise_scale,
+            "chunk_size": self.chunk_size,
+            "elevation_materials": self.elevation_materials,
+            "shade_step": self.shade_step,
+            "river_cells": self.hydrology.river_cells,
+            "side_shades": self.atlas.side_shades,
+            "shadows": self.lighting is None,
+        }
+
+    def get_save_params(self) -> dict:
+        """ What generates the world, a save only applies to worlds generated alike. """
+        return {
+            "seed": self.seed,
+            "width": self.width,
+            "height": self.height,
+            "max_elevation": self.max_elevation,
+            "noise_scale": self.noise_scale,
+            "chunk_size": self.chunk_size,
+        }
@@ -0,0 +1,27 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame as pg
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SmallApp:
+    """ The parts of App a world needs, for a world small enough to bake in a test. """
+    def __init__(self):
+        self.screen_w, self.screen_h = 320, 240
+        self.screen = pg.Surface((self.screen_w, self.screen_h))
+        self.scale = 4
+        self.tile_size = 8
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # assets are loaded relative to the repository root
+    monkeypatch.chdir(ROOT)
+    pg.init()
+    pg.display.set_mode((1, 1))
+    yield SmallApp()
+    pg.quit()
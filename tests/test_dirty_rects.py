@@ -0,0 +1,46 @@
+import numpy as np
+import pygame as pg
+
+from src.world.world import World
+from src.core.camera import Camera
+from src.core.dirty_rects import DirtyRects
+
+
+def test_chunks_under_several_areas_count_once(app):
+    world = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05)
+    app.world = world
+    camera = Camera(app)
+    camera.update()
+    half = app.screen_w // 2
+    world.draw(app.screen, camera, [pg.Rect(0, 0, half, app.screen_h), pg.Rect(half, 0, half, app.screen_h)])
+    visible = world.visible_chunks(camera.world_rect)
+    assert world.chunks_drawn == len(visible)
+    assert world.chunks_culled == len(world.chunks) - len(visible) >= 0
+    world.close()
+
+
+def test_dirty_frames_match_full_redraws(app):
+    world = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True)
+    app.world = world
+    world.agents.spawn(3, pg.Rect(8, 8, 8, 8))
+    camera = Camera(app)
+    camera.offset_x, camera.offset_y = app.screen_w // 2, -20
+    dirty_rects = DirtyRects(app)
+    full = pg.Surface(app.screen.get_size())
+    partial = 0
+    # still frames, scrolls by a few pixels and by more than the screen, and edits
+    moves = [(0, 0)] * 3 + [(3, -2), (0, 5), (-7, 0)] + [(0, 0)] * 3 + [(400, 0), (-400, 0), (1, 1)]
+    for frame, (dx, dy) in enumerate(moves):
+        camera.offset_x += dx
+        camera.offset_y += dy
+        world.update(0.1)
+        if frame in (4, 8):
+            world.set_elevations([12, 13, 14], [10, 10, 10], [frame % 8, 7, 0])
+        camera.update()
+        dirty_rects.draw(app.screen, camera)
+        full.fill(pg.Color("black"))
+        world.draw(full, camera)
+        assert np.array_equal(pg.surfarray.pixels3d(app.screen), pg.surfarray.pixels3d(full)), frame
+        partial += dirty_rects.redrawn_area < app.screen_w * app.screen_h
+    assert partial >= 4
+    world.close()
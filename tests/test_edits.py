@@ -0,0 +1,45 @@
+import numpy as np
+import pygame as pg
+import pytest
+
+from src.world.world import World
+from src.core.camera import Camera
+
+
+def get_edits() -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """ Blocks of cells set to random elevations, digging pits and raising walls across chunk edges. """
+    rng = np.random.default_rng(0)
+    edits = []
+    for _ in range(12):
+        x, y = rng.integers(0, 28, 2)
+        width, height = rng.integers(1, 6, 2)
+        ys, xs = np.mgrid[y:y + height, x:x + width]
+        edits.append((xs.ravel(), ys.ravel(), rng.integers(0, 8, xs.size)))
+    return edits
+
+
+def draw(app, world: World) -> pg.Surface:
+    app.world = world
+    camera = Camera(app)
+    # the middle of the world's diamond
+    camera.offset_x, camera.offset_y = app.screen_w // 2, -20
+    camera.update()
+    screen = pg.Surface((app.screen_w, app.screen_h))
+    world.draw(screen, camera)
+    return screen
+
+
+@pytest.mark.parametrize("lighting", [False, True])
+def test_edited_world_draws_like_a_fresh_one(app, lighting):
+    edited = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True, lighting=lighting)
+    draw(app, edited)
+    for xs, ys, elevations in get_edits():
+        edited.set_elevations(xs, ys, elevations)
+        draw(app, edited)
+
+    fresh = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True, lighting=lighting)
+    for xs, ys, elevations in get_edits():
+        fresh.set_elevations(xs, ys, elevations)
+    assert np.array_equal(pg.surfarray.pixels3d(draw(app, edited)), pg.surfarray.pixels3d(draw(app, fresh)))
+    edited.close()
+    fresh.close()
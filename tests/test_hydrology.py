@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from src.world.world import World
+
+
+def assert_solved(world):
+    """ Every water map matches a solve from scratch of the terrain as it is now. """
+    hydrology = world.hydrology
+    for water_map in hydrology.maps.values():
+        fresh = hydrology.solve(water_map.region)
+        for name in ("filled", "receivers", "accumulation", "water", "level"):
+            assert np.array_equal(getattr(water_map, name), getattr(fresh, name)), name
+
+
+def test_bounded_world_is_solved_as_a_whole(app):
+    world = World(app, 64, 64, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True)
+    whole = world.hydrology.solve(world.bounds)
+    for chunk_id in [(0, 0), (1, 2), (3, 3)]:
+        grid_rect = world.get_chunk_cells(*chunk_id)
+        water, level = world.hydrology.get_water(chunk_id, grid_rect)
+        cells = whole.cells(grid_rect)
+        assert np.array_equal(water, whole.water[cells])
+        assert np.array_equal(level, whole.level[cells])
+    assert list(world.hydrology.maps) == [None]
+    world.close()
+
+
+@pytest.mark.parametrize("size", [64, None])
+def test_edits_update_water_like_a_fresh_solve(app, size):
+    world = World(app, size, size, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True)
+    for cy in range(4):
+        for cx in range(4):
+            world.get_chunk((cx, cy))
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        x, y = rng.integers(1, 58, 2)
+        side = int(rng.integers(1, 6))
+        ys, xs = np.mgrid[y:y + side, x:x + side]
+        world.set_elevations(xs.ravel(), ys.ravel(), rng.integers(0, 8, xs.size))
+    assert_solved(world)
+    world.close()
@@ -0,0 +1,18 @@
+from src.world.world import World
+from src.core.camera import Camera
+
+
+def test_lit_world_bakes_without_workers(app):
+    world = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True, lighting=True)
+    app.world = world
+    camera = Camera(app)
+    camera.update()
+    world.draw(app.screen, camera)
+    chunk = next(iter(world.chunks.values()))
+    assert chunk.is_baked
+    assert world.chunk_cache.peek(chunk.light_key) is not None
+    # a chunk evicted from the cache is re-baked, lightmaps included, on its next draw
+    world.chunk_cache.clear()
+    assert chunk.main_surface.get_size() == chunk.rect.size
+    assert world.chunk_cache.peek(chunk.overlay_light_key) is not None
+    world.close()
@@ -0,0 +1,20 @@
+from src.world.world import World
+from src.core.camera import Camera
+
+
+def test_zoomed_out_view_keeps_only_lods(app):
+    world = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True)
+    app.world = world
+    camera = Camera(app)
+    camera.zoom_by(-2)
+    camera.update()
+    world.draw(app.screen, camera)
+    chunks = world.visible_chunks(camera.world_rect)
+    assert chunks and all(chunk.has_lod(camera.lod) for chunk in chunks)
+    # LOD bakes bake the full size layers themselves, without keeping them
+    assert not any(chunk.is_baked or chunk.overlay_key in world.chunk_cache for chunk in world.chunks.values())
+    baked = world.chunk_cache.misses
+    world.draw(app.screen, camera)
+    assert world.chunk_cache.evictions == 0
+    assert world.chunk_cache.misses == baked
+    world.close()
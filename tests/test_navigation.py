@@ -0,0 +1,87 @@
+import numpy as np
+import pygame as pg
+
+from src.world.navigation import STEPS
+from src.world.world import World
+
+
+def create_world(app) -> World:
+    """ A flat bounded world at elevation 3, flat enough to hold neither rivers nor lakes. """
+    world = World(app, 32, 32, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True)
+    app.world = world
+    set_cells(world, pg.Rect(0, 0, 32, 32), 3)
+    return world
+
+
+def set_cells(world: World, rect: pg.Rect, elevation: int):
+    ys, xs = np.mgrid[rect.top:rect.bottom, rect.left:rect.right]
+    world.set_elevations(xs.ravel(), ys.ravel(), np.full(xs.size, elevation))
+
+
+def assert_legal(world: World, path: list[tuple[int, int]]):
+    navigation = world.navigation
+    lakes = world.hydrology.get_lakes(world.bounds)
+    for (x, y), (next_x, next_y) in zip(path, path[1:]):
+        assert (next_x - x, next_y - y) in STEPS
+        assert abs(int(world.grid[next_y, next_x]) - int(world.grid[y, x])) <= navigation.max_climb
+        assert not lakes[next_y, next_x]
+
+
+def test_paths_go_around_cliffs_and_lakes(app):
+    world = create_world(app)
+    # a cliff across the world but for a gap at the bottom
+    set_cells(world, pg.Rect(10, 0, 1, 28), 7)
+    # a pit only one step deep, which fills up into a lake
+    set_cells(world, pg.Rect(16, 4, 5, 5), 2)
+    lakes = world.hydrology.get_lakes(world.bounds)
+    assert lakes[6, 18] and not lakes[6, 14]
+
+    around_cliff = world.navigation.find_path((2, 2), (20, 20))
+    assert around_cliff[0] == (2, 2) and around_cliff[-1] == (20, 20)
+    assert any(y >= 28 for _, y in around_cliff)
+    assert_legal(world, around_cliff)
+
+    around_lake = world.navigation.find_path((13, 6), (24, 6))
+    assert around_lake[0] == (13, 6) and around_lake[-1] == (24, 6)
+    assert len(around_lake) > 12
+    assert_legal(world, around_lake)
+    world.close()
+
+
+def test_paths_found_before_the_water_go_around_it_once_solved(app):
+    world = create_world(app)
+    set_cells(world, pg.Rect(16, 4, 5, 5), 2)
+    navigation = world.navigation
+    # nothing has needed the water yet, the pit is searched as dry land
+    assert (18, 6) in navigation.find_path((13, 6), (24, 6))
+    world.hydrology.get_lakes(world.bounds)
+    navigation.process()
+    assert not navigation.dry
+    assert ((13, 6), (24, 6)) not in navigation.paths
+    assert_legal(world, navigation.find_path((13, 6), (24, 6)))
+    world.close()
+
+
+def test_walled_in_goal_is_unreachable(app):
+    world = create_world(app)
+    set_cells(world, pg.Rect(20, 20, 7, 7), 7)
+    set_cells(world, pg.Rect(21, 21, 5, 5), 3)
+    assert world.navigation.find_path((2, 2), (23, 23)) is None
+    # nor is a cell off the world
+    assert world.navigation.find_path((2, 2), (40, 2)) is None
+    world.close()
+
+
+def test_edit_drops_only_paths_through_it(app):
+    world = create_world(app)
+    navigation = world.navigation
+    crossing = navigation.find_path((2, 2), (2, 12))
+    away = navigation.find_path((20, 20), (28, 20))
+    assert (2, 7) in crossing
+    world.set_elevations([2], [7], [6])
+    assert ((2, 2), (2, 12)) not in navigation.paths
+    assert navigation.paths[((20, 20), (28, 20))] == away
+    rerouted = navigation.find_path((2, 2), (2, 12))
+    assert (2, 7) not in rerouted
+    assert_legal(world, rerouted)
+    world.close()
@@ -0,0 +1,32 @@
+import numpy as np
+
+from src.world.world import World
+from src.core.camera import Camera
+
+
+def get_top_center(world: World, camera: Camera, x: int, y: int) -> tuple[int, int]:
+    """ Screen point of the middle of a cell's top face. """
+    tile_size = world.tile_size
+    world_x = (x - y + 1) * tile_size
+    world_y = (x + y + 1) * tile_size // 2 - int(world.grid[y, x]) * world.cube_height
+    return (world_x >> camera.lod) + int(camera.offset_x), (world_y >> camera.lod) + int(camera.offset_y)
+
+
+def test_pick_top_face_centers(app):
+    # large tiles, so the pixels zoomed out views round to stay on the face
+    world = World(app, 32, 32, 32, 16, 7, 0.05, streaming=True)
+    app.world = world
+    ys, xs = np.mgrid[0:32, 0:32]
+    world.set_elevations(xs.ravel(), ys.ravel(), np.full(xs.size, 2))
+    # a column in front of (10, 10), tall enough to hide all of it
+    world.set_elevations([11, 5, 20], [11, 9, 3], [7, 4, 5])
+    camera = Camera(app)
+    for lod in range(3):
+        camera.lod = lod
+        for offset in [(0, 0), (123.6, -40.2), (-517, 88.9)]:
+            camera.offset_x, camera.offset_y = offset
+            for x, y in [(3, 4), (5, 9), (20, 3), (11, 11), (31, 0)]:
+                elevation = int(world.grid[y, x])
+                assert world.picker.pick(camera, get_top_center(world, camera, x, y)) == (x, y, elevation)
+            assert world.picker.pick(camera, get_top_center(world, camera, 10, 10))[:2] == (11, 11)
+    world.close()
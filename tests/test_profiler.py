@@ -0,0 +1,15 @@
+import time
+
+from src.core.profiler import FrameProfiler
+
+
+def test_phase_entered_twice_in_a_frame_adds_up():
+    profiler = FrameProfiler(capacity=4)
+    for _ in range(2):
+        with profiler.phase("controls"):
+            time.sleep(0.01)
+    assert profiler.durations["controls"][profiler.slot] >= 20
+    profiler.end_frame()
+    with profiler.phase("controls"):
+        pass
+    assert profiler.durations["controls"][profiler.slot] < 10
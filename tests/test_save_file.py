@@ -0,0 +1,60 @@
+import numpy as np
+import pygame as pg
+import pytest
+
+from src.world.save_file import SaveFile, HEADER, INDEX_HEADER, INDEX_DTYPE
+from src.world.world import World
+
+
+def open_world(app, size, path):
+    world = World(app, size, size, app.tile_size, app.tile_size // 2, 7, 0.05, streaming=True, save_path=path)
+    app.world = world
+    for key in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+        world.get_chunk(key)
+    return world
+
+
+def get_agents(world) -> list[tuple]:
+    agents = world.agents
+    count = len(agents)
+    return sorted(zip(agents.x[:count].tolist(), agents.y[:count].tolist(), agents.phase[:count].tolist(), agents.step_timer[:count].tolist()))
+
+
+@pytest.mark.parametrize("size", [64, None])
+def test_world_round_trip(app, tmp_path, size):
+    path = str(tmp_path / "world.isow")
+    world = open_world(app, size, path)
+    xs, ys = np.array([3, 17, 20, 30]), np.array([4, 5, 21, 30])
+    world.set_elevations(xs, ys, np.array([0, 7, 3, 6]))
+    heights = world.grid[ys, xs].copy()
+    world.player.current_grid_pos = (9, 12)
+    world.agents.spawn(12, pg.Rect(0, 0, 32, 32))
+    agents = get_agents(world)
+    edited = set(world.edited_chunks)
+    world.save()
+    world.close()
+
+    world = open_world(app, size, path)
+    assert np.array_equal(world.grid[ys, xs], heights)
+    assert world.player.current_grid_pos == (9, 12)
+    assert get_agents(world) == agents
+    assert world.edited_chunks == edited
+    world.close()
+
+
+def test_crc_mismatch_raises(tmp_path):
+    path = str(tmp_path / "world.isow")
+    heights = np.arange(64, dtype=np.int16).reshape(8, 8)
+    save_file = SaveFile(path, {"seed": 0})
+    save_file.save({(0, 0): heights}, {}, set(), {})
+    assert np.array_equal(save_file.load_heights((0, 0), 8), heights)
+    _, _, offset, _ = HEADER.unpack_from(save_file.map)
+    save_file.close()
+    # the index record of the block claims another CRC
+    with open(path, "r+b") as f:
+        f.seek(offset + INDEX_HEADER.size + INDEX_DTYPE.fields["heights_crc"][1])
+        f.write(b"\0\0\0\0")
+    save_file = SaveFile(path, {"seed": 0})
+    with pytest.raises(ValueError):
+        save_file.load_heights((0, 0), 8)
+    save_file.close()